@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+Consensus analytics for KLSE Target Price Monitor
+Per-stock consensus targets, dispersion and revision momentum, updated incrementally.
+
+Author: cming401
+License: MIT
+"""
+
+import argparse
+import bisect
+import datetime
+import json
+import logging
+import math
+import os
+import tempfile
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Iterable, List, Optional, Sequence, Union
+
+from history_store import HistoryStore
+from models import TargetPrice
+
+logger = logging.getLogger(__name__)
+
+# Rolling windows for revision momentum, in days
+DEFAULT_WINDOWS = (7, 30, 90)
+
+
+def _day(date: str) -> Optional[datetime.date]:
+    try:
+        return datetime.date.fromisoformat(date)
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass
+class StockConsensus:
+    """Consensus view of one stock from each analyst's latest target."""
+
+    stock_code: str
+    stock_name: Optional[str]
+    analysts: int
+    mean_target: float
+    median_target: float
+    min_target: float
+    max_target: float
+    stdev: float
+    current: Optional[float]
+    raises: Dict[int, int] = field(default_factory=dict)
+    cuts: Dict[int, int] = field(default_factory=dict)
+
+    @property
+    def spread(self) -> float:
+        return self.max_target - self.min_target
+
+    @property
+    def spread_pct(self) -> float:
+        """Spread between the highest and lowest target as a percent of the mean."""
+        return self.spread / self.mean_target * 100 if self.mean_target else 0.0
+
+    @property
+    def upside_pct(self) -> Optional[float]:
+        """Mean target versus the latest current price."""
+        if not self.current:
+            return None
+        return (self.mean_target - self.current) / self.current * 100
+
+    def momentum(self, days: int) -> int:
+        """Target raises minus cuts over the last `days` days."""
+        return self.raises.get(days, 0) - self.cuts.get(days, 0)
+
+
+class _Revision:
+    """One analyst moving their target on a stock; `value` is +1 (raise), -1 (cut) or 0."""
+
+    __slots__ = ('date', 'day', 'stock_code', 'analyst', 'value')
+
+    def __init__(self, date: str, stock_code: str, analyst: str, value: int):
+        self.date = date
+        self.day = _day(date)
+        self.stock_code = stock_code
+        self.analyst = analyst
+        self.value = value
+
+
+class _Call:
+    """An analyst's latest target on a stock and the target it replaced that day."""
+
+    __slots__ = ('date', 'target', 'base', 'revision')
+
+    def __init__(self, date: str, target: float, base: Optional[float] = None,
+                 revision: Optional[_Revision] = None):
+        self.date = date
+        self.target = target
+        self.base = base
+        self.revision = revision
+
+
+class _StockBook:
+    """Running aggregates over a stock's current targets: sorted values, sum and sum of squares."""
+
+    __slots__ = ('calls', 'targets', 'total', 'total_sq', 'name', 'current', 'current_date')
+
+    def __init__(self):
+        self.calls: Dict[str, _Call] = {}
+        self.targets: List[float] = []
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.name: Optional[str] = None
+        self.current: Optional[float] = None
+        self.current_date = ''
+
+    def add(self, target: float):
+        bisect.insort(self.targets, target)
+        self.total += target
+        self.total_sq += target * target
+
+    def replace(self, old: float, new: float):
+        del self.targets[bisect.bisect_left(self.targets, old)]
+        self.total -= old
+        self.total_sq -= old * old
+        self.add(new)
+
+    def median(self) -> float:
+        n = len(self.targets)
+        mid = n // 2
+        return self.targets[mid] if n % 2 else (self.targets[mid - 1] + self.targets[mid]) / 2
+
+
+class _Window:
+    """Raise and cut counts per stock over the last `days` days, expired as the date advances."""
+
+    def __init__(self, days: int):
+        self.days = days
+        self.start: Optional[datetime.date] = None
+        self.revisions: Deque[_Revision] = deque()
+        self.raises: Dict[str, int] = {}
+        self.cuts: Dict[str, int] = {}
+
+    def _apply(self, revision: _Revision, value: int, sign: int):
+        counts = self.raises if value > 0 else self.cuts if value < 0 else None
+        if counts is None:
+            return
+        count = counts.get(revision.stock_code, 0) + sign
+        if count:
+            counts[revision.stock_code] = count
+        else:
+            counts.pop(revision.stock_code, None)
+
+    def contains(self, revision: _Revision) -> bool:
+        return revision.day is not None and (self.start is None or revision.day >= self.start)
+
+    def add(self, revision: _Revision):
+        if self.contains(revision):
+            self.revisions.append(revision)
+            self._apply(revision, revision.value, 1)
+
+    def change(self, revision: _Revision, old_value: int):
+        if self.contains(revision):
+            self._apply(revision, old_value, -1)
+            self._apply(revision, revision.value, 1)
+
+    def advance(self, as_of: datetime.date):
+        """Move the window to end on `as_of`, dropping revisions that fell out of it."""
+        self.start = as_of - datetime.timedelta(days=self.days - 1)
+        while self.revisions and self.revisions[0].day < self.start:
+            revision = self.revisions.popleft()
+            self._apply(revision, revision.value, -1)
+
+
+class ConsensusEngine:
+    """Per-stock consensus built from a stream of calls.
+
+    Each analyst's latest target on a stock counts once. Running sums and a sorted list of
+    targets per stock keep mean, median, spread and standard deviation current as calls
+    arrive. Each rolling window keeps its own queue of revisions, so an update costs
+    O(new rows) rather than a pass over the whole history. Calls should arrive in date
+    order. Replaying the latest day is harmless, but older rows for a call that has
+    already moved on are ignored.
+    """
+
+    def __init__(self, windows: Sequence[int] = DEFAULT_WINDOWS):
+        self.windows = [_Window(int(days)) for days in sorted(set(windows))]
+        self.books: Dict[str, _StockBook] = {}
+        self.watermark: Optional[str] = None
+
+    def _record_revision(self, code: str, analyst: str, call: _Call):
+        value = (call.target > call.base) - (call.target < call.base)
+        if call.revision is not None:
+            old_value, call.revision.value = call.revision.value, value
+            for window in self.windows:
+                window.change(call.revision, old_value)
+        else:
+            call.revision = _Revision(call.date, code, analyst, value)
+            for window in self.windows:
+                window.add(call.revision)
+
+    def update(self, data_list: Iterable[Union[TargetPrice, Dict]]) -> int:
+        """Fold new calls into the aggregates; returns how many changed a consensus."""
+        records = sorted((TargetPrice.coerce(item) for item in data_list), key=lambda r: r.date or '')
+        changed = 0
+        for rec in records:
+            if rec.target is None or not rec.stock_code or not rec.date:
+                continue
+            code, analyst, date = rec.stock_code, rec.analyst or '', rec.date
+            book = self.books.get(code)
+            if book is None:
+                book = self.books[code] = _StockBook()
+            if date >= book.current_date:
+                book.current_date = date
+                book.name = rec.stock_name or book.name
+                if rec.current is not None:
+                    book.current = rec.current
+
+            call = book.calls.get(analyst)
+            if call is None:
+                book.calls[analyst] = _Call(date, rec.target)
+                book.add(rec.target)
+                changed += 1
+            elif date < call.date:
+                logger.debug(f"Ignoring {code}/{analyst} call from {date}, already at {call.date}")
+            elif rec.target == call.target:
+                if date > call.date:
+                    # A reiteration starts a new day for this call without moving it
+                    book.calls[analyst] = _Call(date, call.target, base=call.target)
+            else:
+                if date > call.date:
+                    call.revision = None
+                    call.base = call.target
+                    call.date = date
+                book.replace(call.target, rec.target)
+                call.target = rec.target
+                changed += 1
+                if call.base is not None:
+                    self._record_revision(code, analyst, call)
+
+            if self.watermark is None or date > self.watermark:
+                self.watermark = date
+
+        as_of = _day(self.watermark) if self.watermark else None
+        if as_of is not None:
+            for window in self.windows:
+                window.advance(as_of)
+        return changed
+
+    def refresh(self, store: HistoryStore) -> int:
+        """Fold in calls stored since the last update, replaying the latest day."""
+        return self.update(store.query(start_date=self.watermark))
+
+    def _consensus(self, code: str, book: _StockBook) -> StockConsensus:
+        n = len(book.targets)
+        mean = book.total / n
+        variance = max(0.0, book.total_sq / n - mean * mean)
+        return StockConsensus(
+            stock_code=code, stock_name=book.name, analysts=n,
+            mean_target=mean, median_target=book.median(),
+            min_target=book.targets[0], max_target=book.targets[-1],
+            stdev=math.sqrt(variance), current=book.current,
+            raises={w.days: w.raises.get(code, 0) for w in self.windows},
+            cuts={w.days: w.cuts.get(code, 0) for w in self.windows},
+        )
+
+    def get(self, stock_code: str) -> Optional[StockConsensus]:
+        book = self.books.get(stock_code)
+        return self._consensus(stock_code, book) if book and book.targets else None
+
+    def consensus(self, min_analysts: int = 1) -> List[StockConsensus]:
+        """Consensus for every stock with enough analysts, by upside to the mean target."""
+        result = [self._consensus(code, book) for code, book in self.books.items()
+                  if len(book.targets) >= min_analysts]
+        result.sort(key=lambda c: (c.upside_pct is None, -(c.upside_pct or 0.0), c.stock_code))
+        return result
+
+    # Persistence
+
+    def to_state(self) -> Dict:
+        longest = self.windows[-1] if self.windows else None
+        return {
+            'windows': [w.days for w in self.windows],
+            'watermark': self.watermark,
+            'stocks': {
+                code: {
+                    'name': book.name, 'current': book.current, 'current_date': book.current_date,
+                    'calls': {analyst: [call.date, call.target, call.base] for analyst, call in book.calls.items()},
+                }
+                for code, book in self.books.items()
+            },
+            'revisions': [[r.date, r.stock_code, r.analyst, r.value] for r in longest.revisions] if longest else [],
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict, windows: Optional[Sequence[int]] = None) -> 'ConsensusEngine':
+        engine = cls(windows or state.get('windows') or DEFAULT_WINDOWS)
+        engine.watermark = state.get('watermark')
+        for code, entry in state.get('stocks', {}).items():
+            book = engine.books[code] = _StockBook()
+            book.name, book.current, book.current_date = entry['name'], entry['current'], entry['current_date']
+            for analyst, (date, target, base) in entry['calls'].items():
+                book.calls[analyst] = _Call(date, target, base)
+                book.add(target)
+        for date, code, analyst, value in state.get('revisions', []):
+            revision = _Revision(date, code, analyst, value)
+            call = engine.books[code].calls.get(analyst) if code in engine.books else None
+            if call is not None and call.date == date:
+                call.revision = revision
+            for window in engine.windows:
+                window.add(revision)
+        as_of = _day(engine.watermark) if engine.watermark else None
+        if as_of is not None:
+            for window in engine.windows:
+                window.advance(as_of)
+        return engine
+
+    @classmethod
+    def load(cls, path: str, windows: Optional[Sequence[int]] = None) -> 'ConsensusEngine':
+        """Load saved state, or start empty if there is none (the next refresh replays history)."""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return cls(windows or DEFAULT_WINDOWS)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable consensus state {path}: {e}")
+            return cls(windows or DEFAULT_WINDOWS)
+        if windows and sorted(set(windows)) != state.get('windows'):
+            # Revisions older than the old longest window are gone; rebuild from history
+            logger.info("Consensus windows changed, rebuilding from history")
+            return cls(windows)
+        return cls.from_state(state, windows)
+
+    def save(self, path: str):
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(self.to_state(), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+def main():
+    """Print consensus targets from the history database."""
+    parser = argparse.ArgumentParser(description="Consensus targets from stored KLSE price target history")
+    parser.add_argument('--db', default='klse_history.db', help="History database")
+    parser.add_argument('--state', help="Consensus state file to load and update")
+    parser.add_argument('--stock', help="Show one stock code")
+    parser.add_argument('--min-analysts', type=int, default=1)
+    parser.add_argument('--limit', type=int, default=30)
+    parser.add_argument('--windows', type=int, nargs='+', default=list(DEFAULT_WINDOWS),
+                        help="Revision momentum windows in days")
+    args = parser.parse_args()
+
+    engine = ConsensusEngine.load(args.state, args.windows) if args.state else ConsensusEngine(args.windows)
+    with HistoryStore(args.db) as store:
+        engine.refresh(store)
+    if args.state:
+        engine.save(args.state)
+
+    rows = [engine.get(args.stock)] if args.stock else engine.consensus(args.min_analysts)[:args.limit]
+    windows = [w.days for w in engine.windows]
+    print(f"{'Stock':8} {'N':>3} {'Mean':>8} {'Median':>8} {'Min':>8} {'Max':>8} {'Spread%':>8} {'Upside%':>8}  "
+          + ' '.join(f"{f'{d}d':>4}" for d in windows))
+    for c in rows:
+        if c is None:
+            continue
+        upside = f"{c.upside_pct:8.2f}" if c.upside_pct is not None else f"{'N/A':>8}"
+        print(f"{c.stock_code:8} {c.analysts:3} {c.mean_target:8.3f} {c.median_target:8.3f} "
+              f"{c.min_target:8.3f} {c.max_target:8.3f} {c.spread_pct:8.2f} {upside}  "
+              + ' '.join(f"{c.momentum(d):+4d}" for d in windows))
+
+
+if __name__ == "__main__":
+    main()
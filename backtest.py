@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Analyst accuracy backtest for KLSE Target Price Monitor
+Scores each analyst by how often, and how fast, stocks reached their targets.
+
+Author: cming401
+License: MIT
+"""
+
+import argparse
+import csv
+import datetime
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+
+from history_store import HistoryStore
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HORIZON_DAYS = 365
+
+# Calls and prices are joined on stock * DAY_SPAN + day (days since 1970-01-01)
+DAY_SPAN = 1_000_000
+
+
+@dataclass
+class AnalystScore:
+    """Backtest result for one analyst over a fixed horizon."""
+
+    analyst: str
+    calls: int
+    evaluated: int
+    hits: int
+    hit_rate: Optional[float]
+    mean_days_to_target: Optional[float]
+    median_days_to_target: Optional[float]
+
+
+def _days(dates: Sequence[str]) -> np.ndarray:
+    """YYYY-MM-DD strings to int64 days since the epoch."""
+    return np.array(dates, dtype='datetime64[D]').astype(np.int64)
+
+
+def _is_date(text: str) -> bool:
+    try:
+        datetime.date.fromisoformat(text)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def _encode(values: Iterable[str], index: Dict[str, int]) -> np.ndarray:
+    return np.fromiter((index.setdefault(v, len(index)) for v in values), dtype=np.int64)
+
+
+class PriceHistory:
+    """Daily prices held as arrays sorted by (stock, day).
+
+    `high` and `low` fall back to `close` when the file has no such columns, so a target
+    counts as reached on the first close at or beyond it.
+    """
+
+    def __init__(self, stock_codes: Sequence[str], dates: Sequence[str], close: Sequence[float],
+                 high: Optional[Sequence[float]] = None, low: Optional[Sequence[float]] = None):
+        self.index: Dict[str, int] = {}
+        stock = _encode(stock_codes, self.index)
+        day = _days(dates)
+        order = np.lexsort((day, stock))
+        self.stock = stock[order]
+        self.day = day[order]
+        self.key = self.stock * DAY_SPAN + self.day
+        self.close = np.asarray(close, dtype=np.float64)[order]
+        self.high = np.asarray(high, dtype=np.float64)[order] if high is not None else self.close
+        self.low = np.asarray(low, dtype=np.float64)[order] if low is not None else self.close
+
+    def __len__(self) -> int:
+        return len(self.key)
+
+    @classmethod
+    def load(cls, path: str) -> 'PriceHistory':
+        """Read a CSV or Parquet file with date, stock_code and close (optionally high, low) columns."""
+        if path.endswith('.parquet'):
+            try:
+                import pandas as pd
+            except ImportError as e:
+                raise RuntimeError("Reading Parquet price files needs pandas and pyarrow "
+                                   "(pip install pandas pyarrow)") from e
+            frame = pd.read_parquet(path)
+            frame['date'] = frame['date'].astype(str).str[:10]
+            columns = {name: frame[name].to_numpy() for name in frame.columns}
+        else:
+            with open(path, 'r', encoding='utf-8', newline='') as f:
+                reader = csv.reader(f)
+                header = [name.strip().lower() for name in next(reader)]
+                raw = list(zip(*reader)) or [()] * len(header)
+            columns = dict(zip(header, raw))
+            for name in ('close', 'high', 'low'):
+                if name in columns:
+                    columns[name] = np.array(columns[name], dtype=np.float64)
+        missing = {'date', 'stock_code', 'close'} - set(columns)
+        if missing:
+            raise ValueError(f"{path} is missing price columns: {', '.join(sorted(missing))}")
+        return cls(columns['stock_code'], columns['date'], columns['close'],
+                   columns.get('high'), columns.get('low'))
+
+
+class CallSet:
+    """Target price calls as arrays, joined to a PriceHistory's stock codes."""
+
+    def __init__(self, rows: Sequence[Tuple[str, str, str, Optional[float], Optional[float]]],
+                 prices: PriceHistory):
+        rows = [row for row in rows if row[3] is not None and _is_date(row[0])]
+        self.analyst_index: Dict[str, int] = {}
+        self.analyst = _encode((row[2] or '' for row in rows), self.analyst_index)
+        self.day = _days([row[0] for row in rows]) if rows else np.empty(0, dtype=np.int64)
+        self.stock = np.fromiter((prices.index.get(row[1], -1) for row in rows), dtype=np.int64, count=len(rows))
+        self.target = np.fromiter((row[3] for row in rows), dtype=np.float64, count=len(rows))
+        self.current = np.fromiter((np.nan if row[4] is None else row[4] for row in rows),
+                                   dtype=np.float64, count=len(rows))
+
+    def __len__(self) -> int:
+        return len(self.day)
+
+    @classmethod
+    def from_history(cls, store: HistoryStore, prices: PriceHistory,
+                     start_date: Optional[str] = None, end_date: Optional[str] = None) -> 'CallSet':
+        return cls(store.call_rows(start_date, end_date), prices)
+
+
+def evaluate(calls: CallSet, prices: PriceHistory, horizon_days: int = DEFAULT_HORIZON_DAYS,
+             chunk_size: int = 4_000_000) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Find, for every call, whether the price reached the target within the horizon.
+
+    Calls are merged into the sorted price keys with searchsorted, giving each call the
+    slice of its stock's prices after the call date. Slices are expanded in chunks of
+    at most `chunk_size` price points and tested in one vectorized pass per chunk.
+    Returns (hit, days_to_target, evaluated): a call is evaluated once it hit, or once
+    its whole horizon has price data.
+    """
+    n = len(calls)
+    hit = np.zeros(n, dtype=bool)
+    days_to = np.full(n, -1, dtype=np.int64)
+    known = calls.stock >= 0
+    if not n or not len(prices):
+        return hit, days_to, np.zeros(n, dtype=bool)
+
+    call_key = calls.stock * DAY_SPAN + calls.day
+    start = np.searchsorted(prices.key, call_key, side='right')
+    end = np.searchsorted(prices.key, call_key + horizon_days, side='right')
+    start[~known] = end[~known] = 0
+
+    # Price on the call date stands in for a missing current price
+    current = calls.current.copy()
+    at = np.clip(start - 1, 0, len(prices) - 1)
+    fill = np.isnan(current) & known & (prices.stock[at] == calls.stock)
+    current[fill] = prices.close[at[fill]]
+    bullish = ~(calls.target < current)
+
+    lengths = end - start
+    bounds = np.concatenate(([0], np.cumsum(lengths)))
+    first = 0
+    while first < n:
+        # Take as many calls as fit in one chunk (at least one)
+        last = max(first + 1, int(np.searchsorted(bounds, bounds[first] + chunk_size, side='right')) - 1)
+        seg_len = lengths[first:last]
+        total = int(seg_len.sum())
+        if total:
+            seg = np.repeat(np.arange(first, last), seg_len)
+            offsets = np.repeat(bounds[first:last] - bounds[first], seg_len)
+            pos = np.arange(total) - offsets + np.repeat(start[first:last], seg_len)
+            reached = np.where(bullish[seg], prices.high[pos] >= calls.target[seg],
+                               prices.low[pos] <= calls.target[seg])
+            where = np.flatnonzero(reached)
+            # Positions within a call's slice are ascending, so the first match per call is its first hit
+            hit_calls, first_match = np.unique(seg[where], return_index=True)
+            hit[hit_calls] = True
+            days_to[hit_calls] = prices.day[pos[where[first_match]]] - calls.day[hit_calls]
+        first = last
+
+    stock_end = np.searchsorted(prices.key, (calls.stock + 1) * DAY_SPAN, side='left') - 1
+    last_day = np.where(known, prices.day[np.clip(stock_end, 0, len(prices) - 1)], -1)
+    evaluated = known & (hit | (last_day >= calls.day + horizon_days))
+    return hit, days_to, evaluated
+
+
+def score_analysts(calls: CallSet, prices: PriceHistory,
+                   horizon_days: int = DEFAULT_HORIZON_DAYS) -> Dict[str, AnalystScore]:
+    """Hit rate and time to target for each analyst."""
+    hit, days_to, evaluated = evaluate(calls, prices, horizon_days)
+    size = len(calls.analyst_index)
+    totals = np.bincount(calls.analyst, minlength=size)
+    evaluated_counts = np.bincount(calls.analyst, weights=evaluated, minlength=size).astype(np.int64)
+    hit_counts = np.bincount(calls.analyst, weights=hit, minlength=size).astype(np.int64)
+
+    # Group hit durations by analyst for the medians
+    order = np.argsort(calls.analyst[hit], kind='stable')
+    hit_days = days_to[hit][order]
+    groups = np.split(hit_days, np.cumsum(np.bincount(calls.analyst[hit], minlength=size))[:-1])
+
+    scores = {}
+    for analyst, i in calls.analyst_index.items():
+        durations = groups[i]
+        scores[analyst] = AnalystScore(
+            analyst=analyst,
+            calls=int(totals[i]),
+            evaluated=int(evaluated_counts[i]),
+            hits=int(hit_counts[i]),
+            hit_rate=float(hit_counts[i] / evaluated_counts[i]) if evaluated_counts[i] else None,
+            mean_days_to_target=float(durations.mean()) if len(durations) else None,
+            median_days_to_target=float(np.median(durations)) if len(durations) else None,
+        )
+    return scores
+
+
+def inputs_key(paths: Sequence[str], horizon_days: int) -> str:
+    """Cache key from the input files' sizes and modification times and the horizon.
+
+    The history store runs in WAL mode, so new calls sit in its `-wal` file until a
+    checkpoint copies them into the database; that file's stat is part of the key too.
+    """
+    parts = [str(horizon_days)]
+    for path in paths:
+        stat = os.stat(path)
+        parts.append(f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}")
+        try:
+            wal = os.stat(path + '-wal')
+        except FileNotFoundError:
+            continue
+        parts.append(f"wal:{wal.st_size}:{wal.st_mtime_ns}")
+    return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+
+
+def save_scores(path: str, scores: Dict[str, AnalystScore], key: str, horizon_days: int):
+    payload = {
+        'key': key,
+        'horizon_days': horizon_days,
+        'generated': datetime.datetime.now().isoformat(timespec='seconds'),
+        'scores': {name: asdict(score) for name, score in scores.items()},
+    }
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+def load_scores(path: str, key: Optional[str] = None) -> Optional[Dict[str, AnalystScore]]:
+    """Read cached scores; None if missing, unreadable or computed from different inputs."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            payload = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable analyst scores {path}: {e}")
+        return None
+    if key is not None and payload.get('key') != key:
+        return None
+    return {name: AnalystScore(**entry) for name, entry in payload.get('scores', {}).items()}
+
+
+def run_backtest(db_path: str, prices_path: str, scores_path: Optional[str] = None,
+                 horizon_days: int = DEFAULT_HORIZON_DAYS, refresh: bool = False) -> Dict[str, AnalystScore]:
+    """Score analysts from the history database and a price file, reusing cached scores when
+    neither input changed."""
+    key = inputs_key([db_path, prices_path], horizon_days)
+    if scores_path and not refresh:
+        cached = load_scores(scores_path, key)
+        if cached is not None:
+            logger.info(f"Using cached analyst scores from {scores_path}")
+            return cached
+    prices = PriceHistory.load(prices_path)
+    with HistoryStore(db_path) as store:
+        calls = CallSet.from_history(store, prices)
+    scores = score_analysts(calls, prices, horizon_days)
+    logger.info(f"Backtested {len(calls)} calls against {len(prices)} prices for {len(scores)} analysts")
+    if scores_path:
+        save_scores(scores_path, scores, key, horizon_days)
+    return scores
+
+
+def main():
+    """Backtest command line entry point."""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Score analysts by how often their targets were reached")
+    parser.add_argument('--db', default='klse_history.db', help="History database")
+    parser.add_argument('--prices', required=True, help="Price history (.csv or .parquet): date, stock_code, close")
+    parser.add_argument('--horizon', type=int, default=DEFAULT_HORIZON_DAYS, help="Days allowed to reach the target")
+    parser.add_argument('--output', default='analyst_scores.json', help="Where to cache the scores")
+    parser.add_argument('--refresh', action='store_true', help="Ignore cached scores")
+    args = parser.parse_args()
+
+    scores = run_backtest(args.db, args.prices, args.output, args.horizon, args.refresh)
+    ranked = sorted(scores.values(), key=lambda s: (s.hit_rate is None, -(s.hit_rate or 0.0)))
+    print(f"{'Analyst':24} {'Calls':>7} {'Eval':>7} {'Hits':>7} {'Hit%':>6} {'Days':>6}")
+    for s in ranked:
+        rate = f"{s.hit_rate * 100:6.1f}" if s.hit_rate is not None else f"{'N/A':>6}"
+        days = f"{s.median_days_to_target:6.0f}" if s.median_days_to_target is not None else f"{'N/A':>6}"
+        print(f"{s.analyst[:24]:24} {s.calls:7} {s.evaluated:7} {s.hits:7} {rate} {days}")
+
+
+if __name__ == "__main__":
+    main()
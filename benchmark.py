@@ -0,0 +1,770 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for KLSE Target Price Monitor
+Measures hot paths of the monitor on fixture and synthetic data.
+
+Author: cming401
+License: MIT
+"""
+
+import argparse
+import datetime
+import glob
+import json
+import logging
+import os
+import platform
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from backtest import CallSet, PriceHistory, score_analysts
+from charts import MAX_BARS, ChartRenderer, _backend
+from chunking import join_blocks
+from columnar import RecordBatch
+from fake_telegram import start_fake_telegram
+from fixture_server import ANALYSTS, CALLS, STOCKS, start_fixture_server, synthetic_page
+from models import TargetPrice, parse_upside
+from renderer import MessageRenderer
+from rules import FIELDS, OPS, Rule, RuleMatcher
+from scheduler import MYT
+from scraper import iter_listing, parse_listing_bs4
+from synthetic import dataset_summary, generate_dicts, generate_rows, listing_date, write_pages
+
+
+def measure(func: Callable, *args) -> Dict:
+    """Report wall time of one run of `func` and peak traced memory of a second run."""
+    started = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - started
+    # Tracing slows Python down a lot, so memory is measured on a separate run
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'seconds': elapsed, 'peak_kb': peak / 1024, 'result': result}
+
+
+def load_pages(directory: Optional[str] = None, pages: int = 30, rows_per_page: int = 200) -> List[bytes]:
+    """Read saved page_<n>.html fixtures, or generate synthetic pages."""
+    if directory:
+        paths = sorted(glob.glob(os.path.join(directory, '*.html')))
+        contents = []
+        for path in paths:
+            with open(path, 'rb') as f:
+                contents.append(f.read())
+        return contents
+    return [synthetic_page(page, rows_per_page).encode('utf-8') for page in range(1, pages + 1)]
+
+
+def bench_parser(pages: List[bytes]) -> Dict[str, Dict]:
+    """Compare the streaming lxml parser with the BeautifulSoup tree parser."""
+    def run_stream():
+        count = 0
+        for html in pages:
+            for _ in iter_listing([html], 'utf-8'):
+                count += 1
+        return count
+
+    def run_bs4():
+        count = 0
+        for html in pages:
+            count += len(parse_listing_bs4(html.decode('utf-8')))
+        return count
+
+    return {'streaming_lxml': measure(run_stream), 'bs4': measure(run_bs4)}
+
+
+def iter_synthetic_dicts(count: int, seed: int = 42):
+    """Yield `count` record dicts in the scraper's string shape."""
+    rng = random.Random(seed)
+    for _ in range(count):
+        code, name = rng.choice(STOCKS)
+        cur = rng.uniform(0.2, 12.0)
+        tgt = cur * rng.uniform(0.8, 1.6)
+        diff = tgt - cur
+        yield {
+            'date': '2025-01-07',
+            'stock_code': code,
+            'stock_name': name,
+            'current_price': f"{cur:.2f}",
+            'target_price': f"{tgt:.2f}",
+            'upside_downside': f"{diff:+.2f} ({diff / cur * 100:.2f}%)",
+            'price_call': rng.choice(CALLS),
+            'analyst': rng.choice(ANALYSTS),
+        }
+
+
+def bench_records(count: int) -> Dict[str, Dict]:
+    """Compare dict rows with TargetPrice records: build cost, retained memory and ranking passes."""
+    dicts = list(iter_synthetic_dicts(count))
+    records = [TargetPrice.from_dict(d) for d in dicts]
+
+    def rank_dicts():
+        # Same work the formatters did per record: filter, rank and trend, each re-parsing strings
+        kept = 0
+        for d in dicts:
+            pct = parse_upside(d['upside_downside'])[1]
+            if pct is not None and pct >= 10:
+                kept += 1
+            max(0.0, parse_upside(d['upside_downside'])[1] or 0.0)
+            up = d['upside_downside']
+            '+' in up or '-' in up
+            d['price_call'].upper() == 'BUY'
+        return len(dicts)
+
+    def rank_records():
+        kept = 0
+        for r in records:
+            if r.upside_pct is not None and r.upside_pct >= 10:
+                kept += 1
+            max(0.0, r.upside_pct or 0.0)
+            r.direction
+            r.call
+        return len(records)
+
+    return {
+        'build_dicts': measure(lambda: len(list(iter_synthetic_dicts(count)))),
+        'build_records': measure(lambda: len([TargetPrice.from_dict(d) for d in iter_synthetic_dicts(count)])),
+        'rank_dicts': measure(rank_dicts),
+        'rank_records': measure(rank_records),
+    }
+
+
+def bench_columnar(count: int, threshold: float = 10, top: int = 50) -> Dict[str, Dict]:
+    """Compare list-of-records ranking with vectorized RecordBatch ops."""
+    records = [TargetPrice.from_dict(d) for d in iter_synthetic_dicts(count)]
+    batch = RecordBatch(records)
+
+    def python_path():
+        filtered = [r for r in records if r.upside_pct is not None and r.upside_pct >= threshold]
+        groups: Dict[str, List[TargetPrice]] = {}
+        for r in filtered:
+            groups.setdefault(r.get('stock_code', 'N/A'), []).append(r)
+        ranked = sorted(((max([0.0] + [r.upside_pct or 0.0 for r in items]), code, items)
+                         for code, items in groups.items()), key=lambda x: x[0], reverse=True)
+        sum(1 for r in filtered if r.call is not None)
+        ranked[:top]
+        return len(records)
+
+    def batch_path():
+        mask = batch.upside_mask(threshold)
+        batch.rank_groups(mask, limit=top)
+        batch.call_counts(mask)
+        return len(records)
+
+    return {
+        'build_batch': measure(lambda: len(RecordBatch(records))),
+        'rank_python': measure(python_path),
+        'rank_columnar': measure(batch_path),
+    }
+
+
+def legacy_format_html(data_list: List[Dict], message_cfg: Dict, today_str: str) -> str:
+    """The HTML formatter as it was before the renderer: string concatenation, no caching."""
+    def esc(s: Optional[str]) -> str:
+        s = s or ''
+        return s.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+    def pct_of(text: str) -> Optional[float]:
+        return parse_upside(text)[1]
+
+    threshold = float(message_cfg.get('upside_threshold_pct', 0) or 0)
+    filtered = [it for it in data_list
+                if pct_of(it.get('upside_downside', '')) is not None
+                and pct_of(it.get('upside_downside', '')) >= threshold] or data_list
+    stock_groups: Dict[str, List[Dict]] = {}
+    for it in filtered:
+        stock_groups.setdefault(it.get('stock_code', 'N/A'), []).append(it)
+    ranked = sorted(((max([0.0] + [pct_of(it.get('upside_downside', '')) or 0.0 for it in items]), code, items)
+                     for code, items in stock_groups.items()), key=lambda x: x[0], reverse=True)
+
+    body = "<b>🔥 Top Movers</b>\n<pre>"
+    for i, (_, code, items) in enumerate(ranked[:int(message_cfg.get('top_movers_count', 3) or 3)], 1):
+        it = items[0]
+        emoji = {'BUY': '🟢', 'HOLD': '🟡', 'SELL': '🔴'}.get(it.get('price_call', '').upper(), '⚪')
+        body += f"{i}. {emoji} {code:7} {esc(it.get('stock_name', 'N/A'))}\n"
+        body += f"    Cur RM{it.get('current_price', 'N/A'):>6}  Tgt RM{it.get('target_price', 'N/A'):>6}  " \
+                f"{it.get('upside_downside', ''):>12}\n"
+    body += "</pre>\n\n<b>📋 Full List</b>\n<pre>"
+    for rank, (_, code, items) in enumerate(ranked[:int(message_cfg.get('max_items', 50) or 50)], 1):
+        emoji = {'BUY': '🟢', 'HOLD': '🟡', 'SELL': '🔴'}.get(items[0].get('price_call', '').upper(), '⚪')
+        multi = f" ({len(items)} analysts)" if len(items) > 1 else ""
+        body += f"{rank:2}. {emoji} {code:7} {esc(items[0].get('stock_name', 'N/A'))}{multi}\n"
+        for it in items:
+            up = it.get('upside_downside', '')
+            trend = "📈" if '+' in up else ("📉" if '-' in up else "➡️")
+            body += f"    Cur RM{it.get('current_price', 'N/A'):>6}  Tgt RM{it.get('target_price', 'N/A'):>6}  " \
+                    f"{trend} {up:>12}  {esc(it.get('analyst', 'N/A'))}\n"
+        body += "\n"
+    body += "</pre>\n"
+    buy = sum(1 for d in filtered if d.get('price_call', '').upper() == 'BUY')
+    hold = sum(1 for d in filtered if d.get('price_call', '').upper() == 'HOLD')
+    sell = sum(1 for d in filtered if d.get('price_call', '').upper() == 'SELL')
+    summary = f"<b>📊 Daily Summary</b>\n🟢 Buy: {buy}  🟡 Hold: {hold}  🔴 Sell: {sell}\n" \
+              f"📈 Total records: {len(filtered)}\n"
+    return f"<b>📊 KLSE Target Price Update</b>\n<i>{today_str}</i>\n\n" + body + summary
+
+
+def synthetic_day(count: int, stocks: int, seed: int = 42) -> List[Dict]:
+    """`count` record dicts spread over `stocks` distinct stock codes."""
+    rows = []
+    for i, d in enumerate(iter_synthetic_dicts(count, seed)):
+        suffix = i % stocks
+        d['stock_code'] = f"{d['stock_code']}{suffix}"
+        d['stock_name'] = f"{d['stock_name']} {suffix}"
+        rows.append(d)
+    return rows
+
+
+def bench_render(count: int, stocks: int = 2000, destinations: int = 3, changed_pct: float = 10) -> Dict[str, Dict]:
+    """Compare the concatenating formatter with the compiled, fragment-caching renderer.
+
+    Each case renders, once per destination, a day where `changed_pct` of the calls
+    moved since the previous day; `renderer_warm` starts with the previous day's fragments.
+    """
+    cfg = {'parse_mode': 'HTML', 'max_items': stocks, 'top_movers_count': 5}
+    when = '2025-01-07 18:00 MYT'
+    dicts = synthetic_day(count, stocks)
+    records = [TargetPrice.from_dict(d) for d in dicts]
+    rng = random.Random(7)
+    next_dicts = [dict(d) for d in dicts]
+    for d in rng.sample(next_dicts, int(count * changed_pct / 100)):
+        d['target_price'] = f"{float(d['target_price']) * 1.05:.2f}"
+    next_records = [TargetPrice.from_dict(d) for d in next_dicts]
+
+    def legacy():
+        for _ in range(destinations):
+            legacy_format_html(next_dicts, cfg, when)
+        return count
+
+    def renderer_cold():
+        renderer = MessageRenderer()
+        for _ in range(destinations):
+            join_blocks(renderer.html_blocks(next_records, when, cfg))
+        return count
+
+    # Yesterday's fragments are already cached when today's report is rendered
+    warm = MessageRenderer()
+    warm.html_blocks(records, when, cfg)
+
+    def renderer_warm():
+        for _ in range(destinations):
+            join_blocks(warm.html_blocks(next_records, when, cfg))
+        return count
+
+    return {
+        'legacy_concat': measure(legacy),
+        'renderer_cold': measure(renderer_cold),
+        'renderer_warm': measure(renderer_warm),
+    }
+
+
+def synthetic_market(stocks: int, days: int, calls: int, seed: int = 42):
+    """Random-walk daily closes for `stocks` stocks over `days` weekdays, and `calls` call rows."""
+    rng = np.random.default_rng(seed)
+    calendar = np.busday_offset('2020-01-01', np.arange(days), roll='forward')
+    steps = rng.normal(0, 0.02, size=(stocks, days))
+    closes = np.round(rng.uniform(0.5, 10, size=(stocks, 1)) * np.exp(np.cumsum(steps, axis=1)), 3)
+    codes = [f"STK{i:04d}" for i in range(stocks)]
+    prices = PriceHistory(np.repeat(codes, days), np.tile(calendar.astype(str), stocks), closes.ravel())
+
+    which = rng.integers(0, stocks, calls)
+    when = rng.integers(0, days, calls)
+    current = closes[which, when]
+    target = np.round(current * rng.uniform(0.7, 1.5, calls), 3)
+    analysts = [ANALYSTS[i] for i in rng.zipf(1.6, calls) % len(ANALYSTS)]
+    rows = list(zip(calendar[when].astype(str).tolist(), [codes[i] for i in which],
+                    analysts, target.tolist(), current.tolist()))
+    return prices, rows
+
+
+def bench_backtest(stocks: int, years: int, calls: int, horizon: int) -> Dict[str, Dict]:
+    """Time the vectorized analyst backtest on a synthetic market."""
+    prices, rows = synthetic_market(stocks, years * 260, calls)
+
+    def join_calls():
+        return len(CallSet(rows, prices))
+
+    call_set = CallSet(rows, prices)
+
+    def score():
+        score_analysts(call_set, prices, horizon)
+        return len(call_set)
+
+    return {'build_calls': measure(join_calls), 'score_analysts': measure(score)}
+
+
+def bench_pipeline(count: int, rows_per_page: int = 500, skew: float = 1.1,
+                   malformed_pct: float = 2.0, seed: int = 42) -> Dict:
+    """Time fetch, filter, format and send on one synthetic day.
+
+    The day is served as listing pages by the fixture server and sent to the fake Bot API,
+    so every stage runs the monitor's real code over local HTTP.
+    """
+    # The monitor is imported here so the other benchmarks do not pay for its imports
+    from klse_monitor import KLSETargetPriceMonitor
+
+    with tempfile.TemporaryDirectory() as workdir:
+        today = datetime.datetime.now(MYT).strftime('%Y-%m-%d')
+        rows = list(generate_rows(count, listing_date(today), seed=seed, skew=skew, malformed_pct=malformed_pct))
+        pages = write_pages(os.path.join(workdir, 'pages'), iter(rows), rows_per_page)
+        source, url = start_fixture_server(directory=os.path.join(workdir, 'pages'))
+        telegram, api_base = start_fake_telegram()
+        config = {
+            'telegram': {'bot_token': 'bench', 'channel_id': '-100', 'chat_id': '', 'api_base': api_base,
+                         'queue_path': os.path.join(workdir, 'queue.db'),
+                         'per_chat_per_minute': 0, 'global_per_second': 0},
+            'data_source': {'url': url, 'max_pages': pages, 'max_workers': 8, 'requests_per_second': 0,
+                            'fallback_to_sample': False, 'cache': {'enabled': False}},
+            'history': {'enabled': False},
+            'delta': {'enabled': False},
+            'message': {'parse_mode': 'HTML', 'max_items': 50, 'upside_threshold_pct': 10,
+                        'split_long_messages': True, 'include_buttons': True},
+        }
+        config_path = os.path.join(workdir, 'config.json')
+        with open(config_path, 'w', encoding='utf-8') as f:
+            json.dump(config, f)
+
+        monitor = KLSETargetPriceMonitor(config_path)
+        state: Dict = {}
+
+        def fetch():
+            state['records'] = monitor.fetch_target_prices()
+            return len(state['records'])
+
+        def filter_today():
+            state['today'] = monitor.filter_today_data(state['records'])
+            return len(state['today'])
+
+        def format_markdown():
+            monitor.format_message(state['today'])
+            return len(state['today'])
+
+        def format_html():
+            # A fresh renderer each time, so cached fragments do not flatter the numbers
+            monitor.renderer = MessageRenderer()
+            state['parts'] = monitor.build_messages(state['today'])
+            return len(state['today'])
+
+        def send():
+            for part in state['parts']:
+                monitor.send_to_telegram(part)
+            return len(state['today'])
+
+        root = logging.getLogger()
+        level = root.level
+        root.setLevel(logging.WARNING)
+        try:
+            stages = {
+                'fetch': measure(fetch),
+                'filter': measure(filter_today),
+                'format_markdown': measure(format_markdown),
+                'format_html': measure(format_html),
+                'send': measure(send),
+            }
+        finally:
+            root.setLevel(level)
+            monitor.close()
+            source.shutdown()
+            telegram.shutdown()
+
+    return {
+        'records': count,
+        'pages': pages,
+        'messages': len(state.get('parts', [])),
+        'dataset': dataset_summary(rows),
+        'stages': {name: {'seconds': round(res['seconds'], 6),
+                          'rows_per_sec': round(res['result'] / res['seconds'], 1) if res['seconds'] else None,
+                          'peak_kb': round(res['peak_kb'], 1),
+                          'rows': res['result']}
+                   for name, res in stages.items()},
+    }
+
+
+def _chat_messages(messages: List[Dict]) -> Dict[str, List[tuple]]:
+    """Messages the fake Bot API accepted, per chat in arrival order, minus the report's clock time."""
+    chats: Dict[str, List[tuple]] = {}
+    for message in messages:
+        params = message['params']
+        text = re.sub(r'\d{2}:\d{2} MYT', 'HH:MM MYT', params.get('text', ''))
+        chats.setdefault(str(params['chat_id']), []).append(
+            (text, params.get('parse_mode'), params.get('reply_markup')))
+    return chats
+
+
+def bench_modes(count: int, rows_per_page: int = 200, destinations: int = 20, latency: float = 0.02,
+                parse_executor: str = 'thread', seed: int = 42) -> Dict[str, Dict]:
+    """Run the sync and async pipelines on the same synthetic day and check they send the same messages.
+
+    Both modes fetch from the fixture server and send to the fake Bot API, each with
+    `latency` seconds per request, and start from empty history, delta and outbox files.
+    """
+    from klse_monitor import KLSETargetPriceMonitor
+
+    results: Dict[str, Dict] = {}
+    sent: Dict[str, Dict[str, List[tuple]]] = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        today = datetime.datetime.now(MYT).strftime('%Y-%m-%d')
+        rows = list(generate_rows(count, listing_date(today), seed=seed))
+        pages = write_pages(os.path.join(workdir, 'pages'), iter(rows), rows_per_page)
+        source, url = start_fixture_server(latency=latency, directory=os.path.join(workdir, 'pages'))
+        root = logging.getLogger()
+        level = root.level
+        root.setLevel(logging.WARNING)
+        try:
+            for mode in ('sync', 'async'):
+                telegram, api_base = start_fake_telegram(latency=latency)
+                state = os.path.join(workdir, mode)
+                os.makedirs(state)
+                config = {
+                    'telegram': {'bot_token': 'bench', 'channel_id': '-100', 'chat_id': '', 'api_base': api_base,
+                                 'queue_path': os.path.join(state, 'queue.db'), 'fanout_workers': 8,
+                                 'per_chat_per_minute': 0, 'global_per_second': 0,
+                                 'destinations': [{'chat_id': str(1000 + i), 'message': {
+                                     'upside_threshold_pct': 5 * (i % 4), 'max_items': 20 + i % 3 * 15}}
+                                     for i in range(destinations)]},
+                    'data_source': {'url': url, 'max_pages': pages, 'max_workers': 8, 'requests_per_second': 0,
+                                    'fallback_to_sample': False, 'cache': {'enabled': False}},
+                    'history': {'enabled': True, 'path': os.path.join(state, 'history.db')},
+                    'delta': {'enabled': True, 'path': os.path.join(state, 'published.json')},
+                    'schedule': {'weekdays_only': False},
+                    'message': {'parse_mode': 'HTML', 'split_long_messages': True, 'include_buttons': True},
+                    'pipeline': {'mode': mode, 'parse_executor': parse_executor},
+                }
+                config_path = os.path.join(state, 'config.json')
+                with open(config_path, 'w', encoding='utf-8') as f:
+                    json.dump(config, f)
+                monitor = KLSETargetPriceMonitor(config_path)
+                try:
+                    started = time.perf_counter()
+                    monitor.run_monitor()
+                    elapsed = time.perf_counter() - started
+                finally:
+                    monitor.close()
+                    telegram.shutdown()
+                sent[mode] = _chat_messages(telegram.messages)
+                results[mode] = {'seconds': elapsed, 'peak_kb': 0, 'result': count}
+        finally:
+            root.setLevel(level)
+            source.shutdown()
+
+    if not sent['sync'] or sent['sync'] != sent['async']:
+        raise AssertionError("async pipeline sent different messages from the sync pipeline")
+    print(f"Identical output: {sum(map(len, sent['sync'].values()))} messages to {len(sent['sync'])} chats")
+    return results
+
+
+def pipeline_report(counts: List[int], **kwargs) -> Dict:
+    """Pipeline runs for each dataset size, with enough context to compare versions."""
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                  text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        revision = ''
+    return {
+        'generated': datetime.datetime.now(MYT).isoformat(timespec='seconds'),
+        'revision': revision or None,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': kwargs,
+        'runs': [bench_pipeline(count, **kwargs) for count in counts],
+    }
+
+
+def print_pipeline(report: Dict, baseline: Optional[Dict] = None):
+    """Print stage timings, with the change against a baseline report when given."""
+    before = {}
+    if baseline:
+        for run in baseline.get('runs', []):
+            for name, stage in run['stages'].items():
+                before[(run['records'], name)] = stage['seconds']
+    for run in report['runs']:
+        data = run['dataset']
+        print(f"\nPipeline ({run['records']:,} rows, {data['stocks']} stocks, {run['pages']} pages, "
+              f"{data['malformed_upside']} malformed, {run['messages']} messages)")
+        for name, stage in run['stages'].items():
+            line = (f"  {name:16} {stage['seconds'] * 1000:9.1f} ms  {stage['rows_per_sec'] or 0:11,.0f} rows/s  "
+                    f"peak {stage['peak_kb']:9,.0f} KiB")
+            old = before.get((run['records'], name))
+            if old:
+                line += f"  ({(stage['seconds'] - old) / old * 100:+.1f}% vs baseline)"
+            print(line)
+
+
+def synthetic_rules(count: int, codes: List[str], analysts: List[str], subscribers: int = 500,
+                    seed: int = 42) -> List[Rule]:
+    """Subscriber rules in the mix a bot would see: mostly watchlists, a few analyst and call filters."""
+    rng = random.Random(seed)
+    rules = []
+    for _ in range(count):
+        entry = {'chat_id': str(rng.randrange(subscribers))}
+        kind = rng.random()
+        if kind < 0.85:
+            entry['stocks'] = rng.sample(codes, min(len(codes), rng.randint(1, 10)))
+        elif kind < 0.95:
+            entry['analysts'] = [rng.choice(analysts)]
+        elif kind < 0.99:
+            entry['calls'] = [rng.choice(['BUY', 'HOLD', 'SELL'])]
+        # Broad rules nearly always carry a threshold, or the subscriber would get every call
+        if rng.random() < (0.5 if kind < 0.85 else 0.95):
+            entry['field'] = rng.choice(FIELDS[:3])
+            entry['op'] = rng.choice(list(OPS))
+            entry['value'] = round(rng.uniform(0, 40) if entry['field'] == 'upside_pct' else rng.uniform(0.2, 12), 2)
+        rules.append(Rule.from_config(entry))
+    return rules
+
+
+def bench_rules(rules_count: int, count: int) -> Dict[str, Dict]:
+    """Compare checking every rule against every record with the indexed RuleMatcher."""
+    records = [TargetPrice.from_dict(d) for d in generate_dicts(count, listing_date('2025-01-07'))]
+    rules = synthetic_rules(rules_count, sorted({r.stock_code for r in records}), sorted({r.analyst for r in records}))
+    matcher = RuleMatcher(rules)
+
+    def naive():
+        return [(rule, rec) for rec in records for rule in rules if rule.matches(rec)]
+
+    # Both must find the same (rule, record) pairs; only the order of rules within a record differs
+    pairs = lambda matches: sorted((id(rec), id(rule)) for rule, rec in matches)
+    if pairs(naive()) != pairs(matcher.match(records)):
+        raise AssertionError("RuleMatcher disagrees with Rule.matches")
+    return {
+        'compile': measure(lambda: len(RuleMatcher(rules).rules)),
+        'match_naive': measure(lambda: naive() and len(records)),
+        'match_indexed': measure(lambda: matcher.match(records) and len(records)),
+    }
+
+
+def bench_charts(count: int, stocks: int, top_n: int = MAX_BARS, runs: int = 5) -> Dict:
+    """Chart cost on one synthetic day: importing matplotlib, drawing both charts into an
+    empty cache, and serving an identical day from the cache. Fresh draws of the same
+    rows must give identical PNG bytes, or the cache could never match."""
+    records = [TargetPrice.from_dict(d) for d in synthetic_day(count, stocks)]
+    started = time.perf_counter()
+    _backend()
+    import_seconds = time.perf_counter() - started
+
+    drawn, cached, images = [], [], set()
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            renderer = ChartRenderer(cache_dir, top_n=top_n, budget_seconds=float('inf'))
+            started = time.perf_counter()
+            charts = renderer.charts(records, 'caption')
+            drawn.append(time.perf_counter() - started)
+            mtimes = [os.stat(chart.path).st_mtime_ns for chart in charts]
+            images.add(tuple(open(chart.path, 'rb').read() for chart in charts))
+
+            started = time.perf_counter()
+            again = renderer.charts(records, 'caption')
+            cached.append(time.perf_counter() - started)
+            if again != charts or [os.stat(chart.path).st_mtime_ns for chart in again] != mtimes:
+                raise AssertionError("Identical day was redrawn instead of served from the chart cache")
+    if len(images) != 1:
+        raise AssertionError("Charts of identical rows differ between draws")
+    return {
+        'charts': len(charts),
+        'bars': min(top_n, stocks),
+        'import_ms': import_seconds * 1000,
+        'draw_ms': statistics.median(drawn) * 1000,
+        'cached_ms': statistics.median(cached) * 1000,
+    }
+
+
+# Modules a skipped run must not load: the network stack, the parser, NumPy and SQLite
+HEAVY_MODULES = ('requests', 'urllib3', 'lxml', 'bs4', 'numpy', 'sqlite3', 'zoneinfo', 'matplotlib')
+
+# A weekend cron run: load the config and stop at the weekday check, then report what got imported
+_SKIPPED_RUN = """
+import sys, time
+started = time.perf_counter()
+import klse_monitor
+monitor = klse_monitor.KLSETargetPriceMonitor(sys.argv[1])
+monitor.is_weekday = lambda: False
+monitor.run_monitor()
+elapsed = time.perf_counter() - started
+print(elapsed, ','.join(m for m in sys.argv[2].split(',') if m in sys.modules))
+"""
+
+
+def _import_us(stderr: str, module: str) -> int:
+    """Cumulative microseconds for `module` from -X importtime output."""
+    for line in stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) == 3 and parts[2].strip() == module:
+            return int(parts[1])
+    raise ValueError(f"{module} not in importtime output")
+
+
+def bench_startup(runs: int = 10, config_path: str = 'config.json.example') -> Dict:
+    """Startup cost of a short run, each in a fresh interpreter: importing the monitor,
+    a skipped weekend run from the command line, and the bare interpreter for reference."""
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    imports, skipped, bare = [], [], []
+    loaded = set()
+    with tempfile.TemporaryDirectory() as workdir:
+        # Runs start in the scratch directory, so the config snapshot lands there too
+        env = dict(os.environ, PYTHONPATH=here)
+
+        def interpreter(*args) -> subprocess.CompletedProcess:
+            return subprocess.run([sys.executable, *args], cwd=workdir, env=env, capture_output=True,
+                                  text=True, check=True)
+
+        # The example config is used as is, with state kept out of the working tree
+        with open(os.path.join(here, config_path), 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        config['metrics'] = {'enabled': False}
+        path = os.path.join(workdir, 'config.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(config, f)
+
+        interpreter('-c', 'import klse_monitor')  # compile bytecode once
+        for _ in range(runs):
+            imports.append(_import_us(interpreter('-X', 'importtime', '-c', 'import klse_monitor').stderr,
+                                      'klse_monitor') / 1e6)
+            started = time.perf_counter()
+            interpreter('-c', 'pass')
+            bare.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            out = interpreter('-c', _SKIPPED_RUN, path, ','.join(HEAVY_MODULES)).stdout.split()
+            skipped.append(time.perf_counter() - started)
+            loaded.update(m for m in (out[1].split(',') if len(out) > 1 else []) if m)
+    return {
+        'import_ms': statistics.median(imports) * 1000,
+        'skipped_run_ms': statistics.median(skipped) * 1000,
+        'bare_interpreter_ms': statistics.median(bare) * 1000,
+        'heavy_modules_loaded': sorted(loaded),
+    }
+
+
+def print_results(title: str, results: Dict[str, Dict]):
+    """Print one line per benchmark case."""
+    print(f"\n{title}")
+    for name, res in results.items():
+        rate = res['result'] / res['seconds'] if res['seconds'] else 0
+        print(f"  {name:16} {res['seconds'] * 1000:9.1f} ms  {rate:11,.0f} rows/s  "
+              f"peak {res['peak_kb']:9,.0f} KiB  ({res['result']} rows)")
+
+
+def main():
+    """Benchmark command line entry point."""
+    parser = argparse.ArgumentParser(description="Benchmark KLSE Target Price Monitor")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_parser = sub.add_parser('parser', help="Streaming lxml vs bs4 listing parser")
+    p_parser.add_argument('--dir', help="Directory of saved listing pages (*.html)")
+    p_parser.add_argument('--pages', type=int, default=30)
+    p_parser.add_argument('--rows-per-page', type=int, default=200)
+
+    p_records = sub.add_parser('records', help="Dict rows vs TargetPrice records")
+    p_records.add_argument('--count', type=int, default=100_000)
+
+    p_columnar = sub.add_parser('columnar', help="Python lists vs RecordBatch ranking")
+    p_columnar.add_argument('--count', type=int, default=50_000)
+
+    p_render = sub.add_parser('render', help="Concatenating formatter vs cached renderer")
+    p_render.add_argument('--count', type=int, default=20_000)
+    p_render.add_argument('--stocks', type=int, default=2000)
+    p_render.add_argument('--destinations', type=int, default=3)
+    p_render.add_argument('--changed-pct', type=float, default=10)
+
+    p_backtest = sub.add_parser('backtest', help="Vectorized analyst backtest on a synthetic market")
+    p_backtest.add_argument('--stocks', type=int, default=1000)
+    p_backtest.add_argument('--years', type=int, default=5)
+    p_backtest.add_argument('--calls', type=int, default=200_000)
+    p_backtest.add_argument('--horizon', type=int, default=365)
+
+    p_rules = sub.add_parser('rules', help="Every rule per record vs the indexed alert matcher")
+    p_rules.add_argument('--rules', type=int, default=5000)
+    p_rules.add_argument('--count', type=int, default=5000)
+
+    p_modes = sub.add_parser('modes', help="Sync vs async pipeline on one synthetic day, checked for identical output")
+    p_modes.add_argument('--count', type=int, default=20_000)
+    p_modes.add_argument('--rows-per-page', type=int, default=200)
+    p_modes.add_argument('--destinations', type=int, default=20)
+    p_modes.add_argument('--latency', type=float, default=0.02, help="Seconds of delay per page and per send")
+    p_modes.add_argument('--parse-executor', choices=['thread', 'process'], default='thread')
+
+    p_charts = sub.add_parser('charts', help="Chart draw time against the budget, and cache reuse on identical days")
+    p_charts.add_argument('--count', type=int, default=2000)
+    p_charts.add_argument('--stocks', type=int, default=200)
+    p_charts.add_argument('--runs', type=int, default=5)
+    p_charts.add_argument('--budget-seconds', type=float, default=5,
+                          help="Fail if importing matplotlib and drawing take longer (median)")
+
+    p_startup = sub.add_parser('startup', help="Import and skipped-run time of the monitor in fresh interpreters")
+    p_startup.add_argument('--runs', type=int, default=10)
+    p_startup.add_argument('--max-import-ms', type=float, default=100,
+                           help="Fail if importing klse_monitor takes longer (median)")
+
+    p_pipeline = sub.add_parser('pipeline', help="Fetch, filter, format and send on synthetic days")
+    p_pipeline.add_argument('--counts', type=int, nargs='+', default=[10, 1000, 100_000],
+                            help="Dataset sizes to run (up to 1,000,000)")
+    p_pipeline.add_argument('--rows-per-page', type=int, default=500)
+    p_pipeline.add_argument('--skew', type=float, default=1.1, help="Zipf skew of stocks and analysts")
+    p_pipeline.add_argument('--malformed-pct', type=float, default=2.0, help="Percent of malformed upside cells")
+    p_pipeline.add_argument('--output', default='benchmark_results.json', help="Where to write the JSON report")
+    p_pipeline.add_argument('--compare', help="Earlier JSON report to compare against")
+
+    args = parser.parse_args()
+    if args.command == 'parser':
+        pages = load_pages(args.dir, args.pages, args.rows_per_page)
+        print_results(f"Listing parser ({len(pages)} pages)", bench_parser(pages))
+    elif args.command == 'records':
+        print_results(f"Records ({args.count:,} rows)", bench_records(args.count))
+    elif args.command == 'columnar':
+        print_results(f"Ranking ({args.count:,} rows)", bench_columnar(args.count))
+    elif args.command == 'render':
+        print_results(f"Rendering ({args.count:,} rows, {args.stocks:,} stocks, {args.destinations} destinations)",
+                      bench_render(args.count, args.stocks, args.destinations, args.changed_pct))
+    elif args.command == 'rules':
+        print_results(f"Alert rules ({args.rules:,} rules, {args.count:,} rows)", bench_rules(args.rules, args.count))
+    elif args.command == 'modes':
+        print_results(f"Pipeline modes ({args.count:,} rows, {args.destinations} destinations, "
+                      f"{args.latency * 1000:.0f} ms latency)",
+                      bench_modes(args.count, args.rows_per_page, args.destinations, args.latency,
+                                  args.parse_executor))
+    elif args.command == 'charts':
+        report = bench_charts(args.count, args.stocks, runs=args.runs)
+        print(f"\nCharts ({args.count:,} rows, {args.stocks:,} stocks, {report['charts']} charts "
+              f"of {report['bars']} bars, median of {args.runs})")
+        print(f"  import matplotlib     {report['import_ms']:7.1f} ms")
+        print(f"  draw into empty cache {report['draw_ms']:7.1f} ms  (budget {args.budget_seconds * 1000:.0f} ms)")
+        print(f"  identical day, cached {report['cached_ms']:7.1f} ms")
+        if report['import_ms'] + report['draw_ms'] > args.budget_seconds * 1000:
+            sys.exit("Chart regression: drawing over budget")
+    elif args.command == 'startup':
+        report = bench_startup(args.runs)
+        print(f"\nStartup (median of {args.runs} fresh interpreters)")
+        print(f"  import klse_monitor   {report['import_ms']:7.1f} ms  (-X importtime, budget {args.max_import_ms:.0f} ms)")
+        print(f"  skipped weekend run   {report['skipped_run_ms']:7.1f} ms  (wall, interpreter included)")
+        print(f"  bare interpreter      {report['bare_interpreter_ms']:7.1f} ms")
+        print(f"  heavy modules loaded  {', '.join(report['heavy_modules_loaded']) or 'none'}")
+        if report['heavy_modules_loaded'] or report['import_ms'] > args.max_import_ms:
+            sys.exit("Startup regression: heavy modules loaded or import over budget")
+    elif args.command == 'pipeline':
+        report = pipeline_report(args.counts, rows_per_page=args.rows_per_page, skew=args.skew,
+                                 malformed_pct=args.malformed_pct)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        baseline = None
+        if args.compare:
+            with open(args.compare, 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+        print_pipeline(report, baseline)
+        print(f"\nWrote {args.output}")
+    elif args.command == 'backtest':
+        print_results(f"Backtest ({args.calls:,} calls, {args.stocks:,} stocks, {args.years} years)",
+                      bench_backtest(args.stocks, args.years, args.calls, args.horizon))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""
+Chart images for KLSE Target Price Monitor
+Renders top mover upside and analyst consensus bars as PNGs on matplotlib's headless
+Agg canvas, cached on disk by a fingerprint of the charted numbers.
+
+Author: cming401
+License: MIT
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from metrics import METRICS
+from models import PriceCall, to_records
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DIR = '.cache/charts'
+# Bump when the drawing changes, so PNGs cached by older code are redrawn
+CHART_VERSION = 1
+# More bars than this are unreadable on a phone and only cost render time
+MAX_BARS = 25
+
+# One charted stock: code, best upside %, then its buy, hold and sell call counts
+Row = Tuple[str, float, int, int, int]
+
+
+class Chart(NamedTuple):
+    """A rendered PNG and the caption to send with it."""
+
+    path: str
+    caption: str
+
+
+def chart_rows(data_list: Sequence, top_n: int, threshold: float = 0.0) -> List[Row]:
+    """The `top_n` stocks by best upside, ranked as in the report's Top Movers, with their
+    call counts. The upside threshold applies as in the report, including its fallback
+    to every record when nothing clears it."""
+    if not data_list:
+        return []
+    from columnar import RecordBatch
+    batch = RecordBatch(data_list)
+    mask = batch.upside_mask(threshold)
+    if not mask.any():
+        mask = batch.all_mask()
+    rows = []
+    for best, code, items in batch.rank_groups(mask, limit=top_n):
+        calls = [rec.call for rec in items]
+        rows.append((code, round(best, 2), calls.count(PriceCall.BUY),
+                     calls.count(PriceCall.HOLD), calls.count(PriceCall.SELL)))
+    return rows
+
+
+def _backend():
+    """matplotlib's Figure and Agg canvas, imported on the first render.
+
+    Figures are drawn on their own canvas rather than through pyplot, so no GUI
+    backend or global figure state is ever loaded.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    return Figure, FigureCanvasAgg
+
+
+def _draw_upside(ax, rows: List[Row]):
+    codes = [row[0] for row in reversed(rows)]
+    values = [row[1] for row in reversed(rows)]
+    bars = ax.barh(codes, values, color=['#2e7d32' if v >= 0 else '#c62828' for v in values])
+    ax.bar_label(bars, fmt='%.1f%%', padding=3, fontsize=8)
+    ax.axvline(0, color='#555555', linewidth=0.8)
+    ax.margins(x=0.18)
+    ax.set_xlabel("Upside to target (%)")
+    ax.set_title(f"Top {len(rows)} upside", loc='left')
+
+
+def _draw_consensus(ax, rows: List[Row]):
+    codes = [row[0] for row in reversed(rows)]
+    left = [0] * len(codes)
+    for column, label, color in ((2, 'Buy', '#2e7d32'), (3, 'Hold', '#f9a825'), (4, 'Sell', '#c62828')):
+        counts = [row[column] for row in reversed(rows)]
+        ax.barh(codes, counts, left=left, color=color, label=label)
+        left = [a + b for a, b in zip(left, counts)]
+    ax.xaxis.get_major_locator().set_params(integer=True)
+    # Above the plot, right of the title, so it never covers a bar
+    ax.legend(loc='lower right', bbox_to_anchor=(1.0, 1.0), ncol=3, fontsize=8, frameon=False)
+    ax.set_xlabel("Analyst calls")
+    ax.set_title("Analyst consensus", loc='left')
+
+
+# Chart name -> drawing function, in the order the charts are sent
+CHARTS: Dict[str, Callable] = {
+    'upside': _draw_upside,
+    'consensus': _draw_consensus,
+}
+
+
+class ChartRenderer:
+    """Draws the report's charts, reusing PNGs already drawn for the same numbers.
+
+    Each chart's file is named by a hash of the rows it shows, so a day whose top
+    movers and call counts match an earlier run's is served from disk without
+    importing matplotlib. Drawing stops once `budget_seconds` are spent and the
+    charts finished by then are sent; at most MAX_BARS stocks are drawn however
+    many were published, so the cost does not grow with the day's calls.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_DIR, top_n: int = 10, budget_seconds: float = 5.0,
+                 width: float = 6.0, dpi: int = 100, max_files: int = 200,
+                 in_use: Optional[Callable[[], Set[str]]] = None):
+        self.cache_dir = cache_dir
+        self.top_n = max(1, min(int(top_n), MAX_BARS))
+        self.budget_seconds = float(budget_seconds)
+        self.width = float(width)
+        self.dpi = int(dpi)
+        self.max_files = int(max_files)
+        # Absolute paths pruning must keep, such as charts still queued for upload
+        self.in_use = in_use
+        self.available = True
+
+    @classmethod
+    def from_config(cls, charts_cfg: dict, in_use: Optional[Callable[[], Set[str]]] = None) -> 'ChartRenderer':
+        """Build the renderer from the `charts` config section."""
+        return cls(
+            cache_dir=charts_cfg.get('cache_dir', DEFAULT_DIR),
+            top_n=charts_cfg.get('top_n', 10),
+            budget_seconds=charts_cfg.get('budget_seconds', 5.0),
+            width=charts_cfg.get('width', 6.0),
+            dpi=charts_cfg.get('dpi', 100),
+            max_files=charts_cfg.get('max_files', 200),
+            in_use=in_use,
+        )
+
+    def fingerprint(self, rows: List[Row]) -> str:
+        """Hash of everything that decides the pixels: the rows and the drawing settings."""
+        key = json.dumps([CHART_VERSION, self.width, self.dpi, rows], separators=(',', ':'))
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def charts(self, data_list: Sequence, caption: str, threshold: float = 0.0) -> List[Chart]:
+        """PNG charts of the top movers in `data_list`, drawing only those not cached."""
+        rows = chart_rows(data_list, self.top_n, threshold)
+        if not rows:
+            return []
+        digest = self.fingerprint(rows)
+        paths = {name: os.path.join(self.cache_dir, f"{digest[:20]}-{name}.png") for name in CHARTS}
+        missing = [name for name, path in paths.items() if not os.path.exists(path)]
+        METRICS.inc('chart_cache_hits', len(paths) - len(missing))
+        if missing:
+            with METRICS.timer('charts'):
+                self._render(rows, {name: paths[name] for name in missing})
+        return [Chart(path, caption if i == 0 else '')
+                for i, path in enumerate(path for path in paths.values() if os.path.exists(path))]
+
+    def _render(self, rows: List[Row], todo: Dict[str, str]):
+        if not self.available:
+            return
+        started = time.perf_counter()
+        try:
+            Figure, FigureCanvasAgg = _backend()
+        except ImportError as e:
+            logger.error(f"Charts need matplotlib (pip install matplotlib), sending text only: {e}")
+            self.available = False
+            return
+
+        # Fixed margins in inches, so bars keep their thickness whatever the stock count
+        height = 1.1 + 0.3 * len(rows)
+        names = list(todo)
+        drawn = 0
+        for i, name in enumerate(names):
+            spent = time.perf_counter() - started
+            if spent > self.budget_seconds:
+                logger.warning(f"Chart budget of {self.budget_seconds}s spent after {spent:.2f}s, "
+                               f"not drawing {', '.join(names[i:])}")
+                break
+            path = todo[name]
+            fig = Figure(figsize=(self.width, height), dpi=self.dpi)
+            FigureCanvasAgg(fig)
+            fig.subplots_adjust(left=1.3 / self.width, right=1 - 0.3 / self.width,
+                                bottom=0.55 / height, top=1 - 0.35 / height)
+            CHARTS[name](fig.add_subplot(), rows)
+            png = io.BytesIO()
+            # No software/date metadata, so identical rows give identical bytes
+            fig.savefig(png, format='png', metadata={'Software': None})
+            self._write(path, png.getvalue())
+            METRICS.inc('charts_rendered')
+            drawn += 1
+        logger.info(f"Rendered {drawn} chart(s) for {len(rows)} stocks "
+                    f"in {time.perf_counter() - started:.2f}s")
+        self.prune()
+
+    def _write(self, path: str, data: bytes):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write chart {path}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def prune(self):
+        """Delete the oldest PNGs beyond `max_files`, keeping any still in use."""
+        try:
+            entries = [entry for entry in os.scandir(self.cache_dir) if entry.name.endswith('.png')]
+        except OSError:
+            return
+        if len(entries) <= self.max_files:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        stale = entries[:len(entries) - self.max_files]
+        if self.in_use is not None:
+            in_use = self.in_use()
+            stale = [entry for entry in stale if os.path.abspath(entry.path) not in in_use]
+        for entry in stale:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+
+def main():
+    """Render the charts for a JSON file of target price records."""
+    parser = argparse.ArgumentParser(description="Render top mover charts for target price records")
+    parser.add_argument('data', help="JSON file holding a list of target price records")
+    parser.add_argument('--config', default='config.json', help="Config file with a charts section")
+    parser.add_argument('--threshold', type=float, default=0.0, help="Minimum upside %% to chart")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    charts_cfg = {}
+    if os.path.exists(args.config):
+        with open(args.config, 'r', encoding='utf-8') as f:
+            charts_cfg = json.load(f).get('charts', {})
+    with open(args.data, 'r', encoding='utf-8') as f:
+        data_list = json.load(f)
+    for chart in ChartRenderer.from_config(charts_cfg).charts(to_records(data_list), '', args.threshold):
+        print(chart.path)
+
+
+if __name__ == "__main__":
+    main()
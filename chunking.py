@@ -0,0 +1,131 @@
+"""
+Message chunking for KLSE Target Price Monitor
+Packs message blocks into Telegram-sized parts without breaking HTML tags.
+
+Author: cming401
+License: MIT
+"""
+
+from typing import Iterable, List, Optional, Tuple
+
+TELEGRAM_LIMIT = 4096
+# Longest HTML entity the renderer writes, e.g. '&#128200;', with room to spare
+MAX_ENTITY = 10
+
+# A piece of message text and the tag it must sit inside ('pre'), or None for top level
+Block = Tuple[str, Optional[str]]
+
+
+def _open(tag: Optional[str]) -> str:
+    return f"<{tag}>" if tag else ''
+
+
+def _close(tag: Optional[str]) -> str:
+    return f"</{tag}>" if tag else ''
+
+
+def _cut(line: str, cap: int) -> int:
+    """Where to cut a line longer than `cap`: at `cap`, or earlier so an HTML entity or tag
+    is not split across parts. Entities are short, so only the last few characters are checked."""
+    cut = cap
+    amp = line.rfind('&', max(0, cap - MAX_ENTITY), cap)
+    if amp != -1 and ';' not in line[amp:cap]:
+        semi = line.find(';', amp)
+        if semi != -1 and semi - amp < MAX_ENTITY:
+            cut = amp
+    lt = line.rfind('<', 0, cut)
+    if lt > line.rfind('>', 0, cut):
+        cut = lt
+    # A single entity or tag longer than the part cannot be kept whole
+    return cut or cap
+
+
+def _hard_split(text: str, room: int, first_room: int) -> List[str]:
+    """Split one oversized block on line boundaries (or mid-line as a last resort, outside
+    entities and tags).
+
+    The first piece gets `first_room` characters, so it can top up a part already in progress.
+    """
+    pieces: List[str] = []
+    current: List[str] = []
+    size = 0
+    cap = first_room
+    for line in text.splitlines(keepends=True):
+        if size + len(line) > cap and (current or len(line) <= room):
+            pieces.append(''.join(current))
+            current, size, cap = [], 0, room
+        while len(line) > cap:
+            cut = _cut(line, cap)
+            pieces.append(line[:cut])
+            line = line[cut:]
+            cap = room
+        current.append(line)
+        size += len(line)
+    if current:
+        pieces.append(''.join(current))
+    return [piece for piece in pieces if piece]
+
+
+def split_blocks(blocks: Iterable[Block], limit: int = TELEGRAM_LIMIT) -> List[str]:
+    """Pack blocks into parts of at most `limit` characters in one pass.
+
+    Blocks are never cut unless a single block exceeds the limit on its own. Consecutive
+    blocks sharing a tag share one `<tag>...</tag>` span; a span open at a part boundary is
+    closed there and reopened at the start of the next part, so every part is balanced.
+    """
+    parts: List[str] = []
+    buf: List[str] = []
+    size = 0
+    current: Optional[str] = None
+
+    def flush():
+        nonlocal buf, size, current
+        if buf:
+            buf.append(_close(current))
+            parts.append(''.join(buf))
+        buf, size, current = [], 0, None
+
+    def transition(tag: Optional[str]) -> int:
+        if tag == current:
+            return 0
+        return len(_close(current)) + len(_open(tag))
+
+    for text, tag in blocks:
+        if not text:
+            continue
+        if len(_open(tag)) + len(text) + len(_close(tag)) > limit:
+            # Too big for any part: top up the current part, then continue in fresh ones
+            first_room = limit - size - transition(tag) - len(_close(tag))
+            pieces = _hard_split(text, limit - len(_open(tag)) - len(_close(tag)), max(0, first_room))
+        else:
+            if size + transition(tag) + len(text) + len(_close(tag)) > limit and buf:
+                flush()
+            pieces = [text]
+        for i, piece in enumerate(pieces):
+            if i or size + transition(tag) + len(piece) + len(_close(tag)) > limit:
+                flush()
+            if tag != current:
+                buf.append(_close(current))
+                buf.append(_open(tag))
+                size += transition(tag)
+                current = tag
+            buf.append(piece)
+            size += len(piece)
+    flush()
+    return parts
+
+
+def join_blocks(blocks: Iterable[Block]) -> str:
+    """Render all blocks as one message with balanced tag spans."""
+    parts = split_blocks(blocks, limit=float('inf'))
+    return parts[0] if parts else ''
+
+
+def truncate_blocks(blocks: Iterable[Block], limit: int = TELEGRAM_LIMIT,
+                    note: str = "\n\n… (truncated to fit Telegram limit)") -> str:
+    """Keep as many whole blocks as fit in one message, ending with `note` if any were dropped."""
+    blocks = list(blocks)
+    whole = split_blocks(blocks, limit)
+    if len(whole) <= 1:
+        return whole[0] if whole else ''
+    return split_blocks(blocks, limit - len(note))[0] + note
@@ -0,0 +1,107 @@
+"""
+Columnar record batches for KLSE Target Price Monitor
+Stores records as NumPy arrays so thresholding, ranking and counts are vectorized.
+
+Author: cming401
+License: MIT
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from models import PriceCall, TargetPrice, to_records
+
+# Integer codes for the call column; -1 marks an unrecognised call
+CALL_CODES = {PriceCall.BUY: 0, PriceCall.HOLD: 1, PriceCall.SELL: 2}
+CALL_ORDER = [PriceCall.BUY, PriceCall.HOLD, PriceCall.SELL]
+
+RankedGroup = Tuple[float, str, List[TargetPrice]]
+
+
+def _encode(values: Iterable, count: int) -> Tuple[np.ndarray, List]:
+    """Dictionary-encode values into int32 codes, labels in first-appearance order."""
+    index: Dict = {}
+    codes = np.fromiter((index.setdefault(v, len(index)) for v in values), dtype=np.int32, count=count)
+    return codes, list(index)
+
+
+def _floats(values: Iterable[Optional[float]], count: int) -> np.ndarray:
+    return np.fromiter((np.nan if v is None else v for v in values), dtype=np.float64, count=count)
+
+
+class RecordBatch:
+    """A batch of TargetPrice records held column-wise.
+
+    Stock codes and analysts are dictionary-encoded to int32, calls to int8 and
+    prices/upside to float64 (NaN where unparseable). The original records are
+    kept for rendering the rows that survive ranking.
+    """
+
+    def __init__(self, data_list: Iterable[Union[TargetPrice, Dict]]):
+        self.records: List[TargetPrice] = to_records(data_list)
+        n = len(self.records)
+        self.codes, self.code_labels = _encode((r.get('stock_code', 'N/A') for r in self.records), n)
+        self.analysts, self.analyst_labels = _encode((r.get('analyst', 'N/A') for r in self.records), n)
+        self.calls = np.fromiter((CALL_CODES.get(r.call, -1) for r in self.records), dtype=np.int8, count=n)
+        self.current = _floats((r.current for r in self.records), n)
+        self.target = _floats((r.target for r in self.records), n)
+        self.upside = _floats((r.upside_pct for r in self.records), n)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def all_mask(self) -> np.ndarray:
+        return np.ones(len(self.records), dtype=bool)
+
+    def upside_mask(self, threshold: float) -> np.ndarray:
+        """Rows whose upside percent parsed and is at least `threshold`."""
+        with np.errstate(invalid='ignore'):
+            return self.upside >= threshold
+
+    def group_max_upside(self, mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """Per stock code, the highest upside among masked rows, floored at 0 (unparsed counts as 0)."""
+        sel = np.flatnonzero(self.all_mask() if mask is None else mask)
+        out = np.zeros(len(self.code_labels), dtype=np.float64)
+        np.maximum.at(out, self.codes[sel], np.nan_to_num(self.upside[sel], nan=0.0))
+        return out
+
+    def rank_groups(self, mask: Optional[np.ndarray] = None, limit: Optional[int] = None) -> List[RankedGroup]:
+        """Group masked rows by stock, ordered by max upside then first appearance.
+
+        Returns (max_pct, stock_code, records) tuples like the formatters build, with
+        only the first `limit` groups materialized.
+        """
+        sel = np.flatnonzero(self.all_mask() if mask is None else mask)
+        if not len(sel):
+            return []
+        group_codes = self.codes[sel]
+        n_groups = len(self.code_labels)
+
+        best = self.group_max_upside(mask)
+        first = np.full(n_groups, len(self.records), dtype=np.int64)
+        np.minimum.at(first, group_codes, sel)
+        present = np.flatnonzero(first < len(self.records))
+        order = present[np.lexsort((first[present], -best[present]))]
+        if limit is not None:
+            order = order[:limit]
+
+        # Bucket the masked rows by code with one stable sort, then slice out the wanted groups
+        by_code = sel[np.argsort(group_codes, kind='stable')]
+        counts = np.bincount(group_codes, minlength=n_groups)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        ranked: List[RankedGroup] = []
+        for code in order:
+            rows = by_code[starts[code]:starts[code] + counts[code]]
+            ranked.append((float(best[code]), self.code_labels[code], [self.records[i] for i in rows]))
+        return ranked
+
+    def top_movers(self, count: int, mask: Optional[np.ndarray] = None) -> List[RankedGroup]:
+        """The `count` stocks with the highest upside."""
+        return self.rank_groups(mask, limit=count)
+
+    def call_counts(self, mask: Optional[np.ndarray] = None) -> Dict[PriceCall, int]:
+        """Number of BUY/HOLD/SELL rows among the masked rows."""
+        calls = self.calls if mask is None else self.calls[mask]
+        counts = np.bincount(calls[calls >= 0], minlength=len(CALL_ORDER))
+        return {call: int(counts[i]) for i, call in enumerate(CALL_ORDER)}
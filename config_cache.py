@@ -0,0 +1,99 @@
+"""
+Config snapshot for KLSE Target Price Monitor
+Validates config.json once and keeps it as a marshal snapshot for short cron runs.
+
+Author: cming401
+License: MIT
+"""
+
+import json
+import logging
+import marshal
+import os
+import tempfile
+import zlib
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = '.cache'
+# Bump when validation changes, so snapshots made by older code are rebuilt
+SNAPSHOT_VERSION = 2
+
+REQUIRED_TELEGRAM = ('bot_token', 'channel_id', 'chat_id')
+SECTIONS = (
+    'telegram', 'message', 'data_source', 'history', 'rollups', 'delta', 'analytics',
+    'backtest', 'schedule', 'metrics', 'alerts', 'quotes', 'pipeline', 'charts',
+)
+
+
+class ConfigError(ValueError):
+    """The configuration file is readable JSON but not a usable configuration."""
+
+
+def validate_config(config) -> dict:
+    """Check the shape the monitor relies on; raises ConfigError naming the first problem."""
+    if not isinstance(config, dict):
+        raise ConfigError("top level must be a JSON object")
+    for section in SECTIONS:
+        if section in config and not isinstance(config[section], dict):
+            raise ConfigError(f"'{section}' must be a JSON object")
+    if 'telegram' not in config:
+        raise ConfigError("missing 'telegram' section")
+    missing = [key for key in REQUIRED_TELEGRAM if key not in config['telegram']]
+    if missing:
+        raise ConfigError(f"'telegram' is missing {', '.join(missing)}")
+    return config
+
+
+def snapshot_path(config_file: str, directory: str = SNAPSHOT_DIR) -> str:
+    """Snapshot file for a config path; each config file gets its own."""
+    digest = zlib.crc32(os.path.abspath(config_file).encode('utf-8'))
+    return os.path.join(directory, f"config-{digest:08x}.snapshot")
+
+
+def load_config(config_file: str, snapshot_dir: Optional[str] = SNAPSHOT_DIR) -> dict:
+    """Load and validate `config_file`, reusing the snapshot while the file is unchanged.
+
+    The snapshot is keyed on the file's size and modification time, so an edited
+    config is re-read and re-validated on the next run. Without `snapshot_dir` the
+    file is always parsed. Raises FileNotFoundError, json.JSONDecodeError or ConfigError.
+    """
+    stat = os.stat(config_file)
+    key = (SNAPSHOT_VERSION, os.path.abspath(config_file), stat.st_mtime_ns, stat.st_size)
+    path = snapshot_path(config_file, snapshot_dir) if snapshot_dir else None
+    if path:
+        try:
+            with open(path, 'rb') as f:
+                cached_key, config = marshal.load(f)
+            if tuple(cached_key) == key:
+                return config
+        except (OSError, EOFError, ValueError, TypeError):
+            pass
+
+    with open(config_file, 'r', encoding='utf-8') as f:
+        config = validate_config(json.load(f))
+    if path:
+        _write_snapshot(path, key, config)
+    return config
+
+
+def _write_snapshot(path: str, key: tuple, config: dict):
+    directory = os.path.dirname(os.path.abspath(path))
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    except OSError as e:
+        logger.debug(f"Not snapshotting config: {e}")
+        return
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            marshal.dump((key, config), f)
+        os.replace(tmp_path, path)
+    except (OSError, ValueError) as e:
+        # ValueError: a value marshal cannot store; the config still loads, just unsnapshotted
+        logger.debug(f"Not snapshotting config: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
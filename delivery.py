@@ -0,0 +1,166 @@
+"""
+Multi-destination delivery for KLSE Target Price Monitor
+Renders each distinct message configuration once and fans it out to many chats.
+
+Author: cming401
+License: MIT
+"""
+
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from telegram_sender import FAILED, QUEUED, SENT, TelegramSender
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Destination:
+    """A chat or channel with its own message settings."""
+
+    chat_id: str
+    message_cfg: Dict = field(default_factory=dict)
+    name: Optional[str] = None
+
+    @property
+    def label(self) -> str:
+        return self.name or str(self.chat_id)
+
+
+@dataclass
+class DeliveryResult:
+    """Outcome of sending one rendered message (all of its parts) to one destination."""
+
+    destination: Destination
+    status: str
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        """Sent, or queued in the outbox for the next run."""
+        return self.status != FAILED
+
+    @property
+    def delivered(self) -> bool:
+        """Every part was accepted by Telegram; queued parts have not reached the chat yet."""
+        return self.status == SENT
+
+
+# One part of a message: text, or an album of (photo path, caption) pairs
+Part = Union[str, Sequence[Tuple[str, str]]]
+# A rendered message ready to send: destination, ordered parts, sendMessage parameters
+Job = Tuple[Destination, List[Part], Dict]
+
+
+def load_destinations(config: dict) -> List[Destination]:
+    """Read `telegram.destinations`, defaulting to the configured channel and chat.
+
+    Each destination's `message` block is layered over the global `message` block.
+    """
+    telegram_cfg = config['telegram']
+    base_cfg = config.get('message', {})
+    entries = telegram_cfg.get('destinations')
+    if entries is None:
+        entries = [{'chat_id': telegram_cfg.get('channel_id'), 'name': 'channel'}]
+        if telegram_cfg.get('chat_id'):
+            entries.append({'chat_id': telegram_cfg['chat_id'], 'name': 'chat'})
+    destinations = []
+    for entry in entries:
+        if not entry.get('chat_id'):
+            continue
+        merged = dict(base_cfg)
+        merged.update(entry.get('message', {}))
+        destinations.append(Destination(str(entry['chat_id']), merged, entry.get('name')))
+    return destinations
+
+
+def config_key(message_cfg: Dict) -> str:
+    """Stable key for a message configuration, so identical settings render once."""
+    return json.dumps(message_cfg, sort_keys=True, default=str)
+
+
+class FanOut:
+    """Sends rendered messages to many destinations on a bounded worker pool."""
+
+    def __init__(self, sender: TelegramSender, max_workers: int = 8):
+        self.sender = sender
+        self.max_workers = max(1, max_workers)
+
+    def send_one(self, destination: Destination, parts: List[Part], params: Dict) -> DeliveryResult:
+        """Send a message's parts in order; reply markup only rides on the last text part.
+
+        Once a part is left queued, the sender queues the parts after it behind it in the
+        outbox, so the chat still receives them in order on the next flush.
+
+        A rejected photo album is logged but does not fail the delivery, since the text
+        already carries the whole report.
+        """
+        status = SENT
+        last_params = params
+        params = {k: v for k, v in params.items() if k != 'reply_markup'}
+        last_text = max((i for i, part in enumerate(parts) if isinstance(part, str)), default=-1)
+        for i, part in enumerate(parts):
+            try:
+                if isinstance(part, str):
+                    part_status = self.sender.send_message(
+                        destination.chat_id, part, **(last_params if i == last_text else params))
+                else:
+                    part_status = self.sender.send_photos(destination.chat_id, part)
+            except Exception as e:
+                return DeliveryResult(destination, FAILED, str(e))
+            if part_status == FAILED and not isinstance(part, str):
+                logger.warning(f"Photos for {destination.label} rejected, sending the text only")
+                continue
+            if part_status == FAILED:
+                return DeliveryResult(destination, FAILED, f"part {i + 1}/{len(parts)} rejected")
+            if part_status == QUEUED:
+                status = QUEUED
+        return DeliveryResult(destination, status)
+
+    def deliver(self, destinations: List[Destination],
+                render: Callable[[Dict], List[Part]],
+                params_for: Callable[[Dict], Dict]) -> List[DeliveryResult]:
+        """Render once per distinct message config, then send to every destination concurrently.
+
+        `render` returns the message as one or more ordered parts. A slow or rate-limited
+        chat only occupies its own worker; results come back in destination order.
+        """
+        return self.send(list(self.iter_jobs(destinations, render, params_for)))
+
+    def iter_jobs(self, destinations: List[Destination],
+                  render: Callable[[Dict], List[Part]],
+                  params_for: Callable[[Dict], Dict]) -> Iterator[Job]:
+        """(destination, parts, params) jobs in destination order, rendering each distinct
+        message config the first time a destination needs it."""
+        rendered: Dict[str, tuple] = {}
+        for destination in destinations:
+            key = config_key(destination.message_cfg)
+            if key not in rendered:
+                rendered[key] = (render(destination.message_cfg), params_for(destination.message_cfg))
+            yield (destination, *rendered[key])
+        logger.info(f"Rendered {len(rendered)} message variant(s) for {len(destinations)} destination(s)")
+
+    def send(self, jobs: List[Job]) -> List[DeliveryResult]:
+        """Send already rendered (destination, parts, params) jobs concurrently; results in job order."""
+        if not jobs:
+            return []
+        workers = min(self.max_workers, len(jobs))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(self.send_one, *job) for job in jobs]
+            results = [future.result() for future in futures]
+        self.log_results(results)
+        return results
+
+    @staticmethod
+    def log_results(results: List[DeliveryResult]):
+        """Log each destination's outcome."""
+        for result in results:
+            if result.status == SENT:
+                logger.info(f"Delivered to {result.destination.label}")
+            elif result.ok:
+                logger.warning(f"Queued for {result.destination.label}, will retry on the next run")
+            else:
+                logger.error(f"Delivery to {result.destination.label} failed{': ' + result.error if result.error else ''}")
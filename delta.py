@@ -0,0 +1,210 @@
+"""
+Delta tracking for KLSE Target Price Monitor
+Remembers published calls so each run only sends new or revised targets.
+
+Author: cming401
+License: MIT
+"""
+
+import datetime
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from models import TargetPrice, parse_price
+from scheduler import MYT
+
+logger = logging.getLogger(__name__)
+
+CallKey = Tuple[str, str]
+
+# Destination of callers that send to one place, and of indexes from before per-destination tracking
+DEFAULT_DESTINATION = ''
+DEFAULT_RETENTION_DAYS = 90
+INDEX_VERSION = 2
+
+
+def call_key(rec: TargetPrice) -> CallKey:
+    """Identity of an analyst's call on a stock."""
+    return (rec.stock_code or '', rec.analyst or '')
+
+
+def fingerprint(rec: TargetPrice) -> str:
+    """Hash of the fields that make a call worth publishing again when they change."""
+    raw = '|'.join([rec.stock_code or '', rec.analyst or '', rec.target_price or '',
+                    (rec.price_call or '').upper()])
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]
+
+
+def latest_calls(data_list: Iterable[Union[TargetPrice, Dict]]) -> List[TargetPrice]:
+    """One call per (stock_code, analyst): the first listed, as the listing is newest first.
+
+    The index keeps one entry per call key, so diffing or marking several targets for a
+    key would report each as a revision of the other on every run.
+    """
+    latest: Dict[CallKey, TargetPrice] = {}
+    for item in data_list:
+        rec = TargetPrice.coerce(item)
+        latest.setdefault(call_key(rec), rec)
+    return list(latest.values())
+
+
+def _iso_date(date: Optional[str]) -> str:
+    """An entry's YYYY-MM-DD date, or '9999-12-31' for one that is missing or unparsed, so it is kept."""
+    try:
+        return datetime.date.fromisoformat(date).isoformat()
+    except (TypeError, ValueError):
+        return '9999-12-31'
+
+
+@dataclass(frozen=True)
+class Revision:
+    """How a call changed since it was last published."""
+
+    old_target: Optional[str]
+    new_target: Optional[str]
+    old_call: Optional[str]
+    new_call: Optional[str]
+
+    def describe(self) -> str:
+        """Human readable summary, e.g. 'Target raised from RM10.90 to RM11.40'."""
+        parts = []
+        if self.old_target != self.new_target:
+            old, new = parse_price(self.old_target), parse_price(self.new_target)
+            verb = 'revised'
+            if old is not None and new is not None:
+                verb = 'raised' if new > old else 'cut' if new < old else 'revised'
+            parts.append(f"target {verb} from RM{self.old_target} to RM{self.new_target}")
+        if (self.old_call or '').upper() != (self.new_call or '').upper():
+            old_call = (self.old_call or 'N/A').upper()
+            new_call = (self.new_call or 'N/A').upper()
+            parts.append(f"call changed from {old_call} to {new_call}")
+        summary = ', '.join(parts)
+        return summary[:1].upper() + summary[1:]
+
+
+@dataclass
+class DeltaResult:
+    """Outcome of diffing one fetch against the published index."""
+
+    changed: List[TargetPrice] = field(default_factory=list)
+    revisions: Dict[CallKey, Revision] = field(default_factory=dict)
+    new_count: int = 0
+    unchanged_count: int = 0
+
+
+class PublishedIndex:
+    """Fingerprints of already published calls per destination, persisted as a JSON file.
+
+    For each destination chat, every (stock_code, analyst) pair maps to the fingerprint,
+    target price and call last sent there, so a re-run can tell new calls from
+    revisions and repeats, and a chat that missed a send still gets those calls on the
+    next run. Entries for calls older than `retention_days` only served revision notes
+    and are dropped on save. An index written by earlier versions, shared by every
+    destination, is kept as the starting point of destinations not seen since.
+    """
+
+    def __init__(self, path: str = 'published_index.json', retention_days: int = DEFAULT_RETENTION_DAYS):
+        self.path = path
+        self.retention_days = retention_days
+        self.destinations: Dict[str, Dict[str, Dict[str, str]]] = {}
+        self.legacy: Dict[str, Dict[str, str]] = {}
+        self.load()
+
+    @staticmethod
+    def _entry_key(key: CallKey) -> str:
+        return '\t'.join(key)
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            data = {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable published index {self.path}: {e}")
+            data = {}
+        if data.get('version') == INDEX_VERSION:
+            self.destinations = data.get('destinations', {})
+            self.legacy = data.get('legacy', {})
+        else:
+            self.destinations = {}
+            self.legacy = data
+
+    def entries(self, destination: str = DEFAULT_DESTINATION) -> Dict[str, Dict[str, str]]:
+        """The calls published to one destination."""
+        entries = self.destinations.get(destination)
+        return self.legacy if entries is None else entries
+
+    def prune(self, today: Optional[datetime.date] = None):
+        """Drop entries for calls dated more than `retention_days` before `today` (default: today in MYT)."""
+        if not self.retention_days:
+            return
+        today = today or datetime.datetime.now(MYT).date()
+        cutoff = (today - datetime.timedelta(days=self.retention_days)).isoformat()
+        pruned = 0
+        for entries in (self.legacy, *self.destinations.values()):
+            stale = [key for key, entry in entries.items() if _iso_date(entry.get('date')) < cutoff]
+            for key in stale:
+                del entries[key]
+            pruned += len(stale)
+        if pruned:
+            logger.info(f"Pruned {pruned} published calls older than {self.retention_days} days")
+
+    def save(self):
+        self.prune()
+        data = {'version': INDEX_VERSION, 'destinations': self.destinations}
+        if self.legacy:
+            data['legacy'] = self.legacy
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def contains(self, rec: TargetPrice, destination: str = DEFAULT_DESTINATION) -> bool:
+        """Whether this exact call, same target and call, was already published to `destination`."""
+        entry = self.entries(destination).get(self._entry_key(call_key(rec)))
+        return entry is not None and entry['fingerprint'] == fingerprint(rec)
+
+    def diff(self, data_list: Iterable[Union[TargetPrice, Dict]],
+             destination: str = DEFAULT_DESTINATION) -> DeltaResult:
+        """Split a fetch into new and revised calls, skipping ones already published to `destination`."""
+        entries = self.entries(destination)
+        result = DeltaResult()
+        for rec in latest_calls(data_list):
+            fp = fingerprint(rec)
+            key = call_key(rec)
+            entry = entries.get(self._entry_key(key))
+            if entry is None:
+                result.new_count += 1
+            elif entry['fingerprint'] == fp:
+                result.unchanged_count += 1
+                continue
+            else:
+                result.revisions[key] = Revision(entry.get('target_price'), rec.target_price,
+                                                 entry.get('price_call'), rec.price_call)
+            result.changed.append(rec)
+        logger.info(f"Delta for {destination or 'default'}: {result.new_count} new, "
+                    f"{len(result.revisions)} revised, {result.unchanged_count} already published")
+        return result
+
+    def mark_published(self, data_list: Iterable[Union[TargetPrice, Dict]],
+                       destination: str = DEFAULT_DESTINATION, save: bool = True):
+        """Record calls as sent to `destination`, and persist the index unless `save` is False."""
+        entries = self.destinations.get(destination)
+        if entries is None:
+            entries = self.destinations[destination] = dict(self.legacy)
+        for rec in latest_calls(data_list):
+            entries[self._entry_key(call_key(rec))] = {
+                'fingerprint': fingerprint(rec),
+                'target_price': rec.target_price,
+                'price_call': rec.price_call,
+                'date': rec.date,
+            }
+        if save:
+            self.save()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Local fake Telegram Bot API for KLSE Target Price Monitor
+Accepts sendMessage-style calls and photo uploads, records them and can simulate rate limiting.
+
+Author: cming401
+License: MIT
+"""
+
+import argparse
+import json
+import threading
+import time
+from email import policy
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+
+class FakeBotHandler(BaseHTTPRequestHandler):
+    """Handles POST /bot<token>/<method> like the Bot API."""
+
+    server_version = 'FakeTelegram/1.0'
+
+    def _reply(self, status: int, payload: dict, headers: Optional[dict] = None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, str(value))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        parts = urlparse(self.path).path.strip('/').split('/')
+        if len(parts) != 2 or not parts[0].startswith('bot'):
+            self._reply(404, {'ok': False, 'error_code': 404, 'description': 'Not Found'})
+            return
+        method = parts[1]
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length)
+        content_type = self.headers.get('Content-Type', '')
+        files: Dict[str, int] = {}
+        if content_type.startswith('application/json'):
+            params = json.loads(raw or b'{}')
+        elif content_type.startswith('multipart/form-data'):
+            params, files = _parse_multipart(content_type, raw)
+        else:
+            params = {k: v[0] for k, v in parse_qs(raw.decode('utf-8')).items()}
+
+        fake = self.server.fake_cfg
+        with self.server.lock:
+            fake['requests'] += 1
+            every = fake['rate_limit_every']
+            limited = every and fake['requests'] % every == 0
+        if fake['latency']:
+            time.sleep(fake['latency'])
+        if limited:
+            retry_after = fake['retry_after']
+            self._reply(429, {
+                'ok': False, 'error_code': 429,
+                'description': f"Too Many Requests: retry after {retry_after}",
+                'parameters': {'retry_after': retry_after},
+            }, {'Retry-After': retry_after})
+            return
+        if not params.get('chat_id'):
+            self._reply(400, {'ok': False, 'error_code': 400, 'description': 'Bad Request: chat_id is empty'})
+            return
+        with self.server.lock:
+            self.server.messages.append({'method': method, 'params': params, 'files': files, 'at': time.time()})
+            message_id = len(self.server.messages)
+        self._reply(200, {'ok': True, 'result': {'message_id': message_id,
+                                                 'chat': {'id': params.get('chat_id')}}})
+
+    def log_message(self, format, *args):
+        if self.server.fake_cfg['verbose']:
+            super().log_message(format, *args)
+
+
+def _parse_multipart(content_type: str, raw: bytes) -> Tuple[Dict[str, str], Dict[str, int]]:
+    """Form fields of a multipart upload, and the byte size of each uploaded file."""
+    message = BytesParser(policy=policy.HTTP).parsebytes(
+        b'Content-Type: ' + content_type.encode('latin-1') + b'\r\n\r\n' + raw)
+    params, files = {}, {}
+    for part in message.iter_parts():
+        name = part.get_param('name', header='content-disposition')
+        body = part.get_payload(decode=True) or b''
+        if part.get_filename():
+            files[name] = len(body)
+        else:
+            params[name] = body.decode('utf-8')
+    return params, files
+
+
+def start_fake_telegram(port: int = 0, rate_limit_every: int = 0, retry_after: float = 1,
+                        latency: float = 0.0, verbose: bool = False) -> Tuple[ThreadingHTTPServer, str]:
+    """Start the fake Bot API on a background thread; returns the server and its api_base.
+
+    Every `rate_limit_every`-th request is answered with 429 and `retry_after`.
+    Accepted calls are appended to `server.messages`, uploads as their byte sizes.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', port), FakeBotHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.messages = []
+    server.fake_cfg = {
+        'rate_limit_every': rate_limit_every,
+        'retry_after': retry_after,
+        'latency': latency,
+        'verbose': verbose,
+        'requests': 0,
+    }
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, bound_port = server.server_address[:2]
+    return server, f"http://{host}:{bound_port}"
+
+
+def main():
+    """Run the fake Bot API in the foreground."""
+    parser = argparse.ArgumentParser(description="Serve a fake Telegram Bot API")
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--rate-limit-every', type=int, default=0, help="Answer every Nth request with 429")
+    parser.add_argument('--retry-after', type=float, default=1)
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds of delay per request")
+    args = parser.parse_args()
+
+    server, api_base = start_fake_telegram(args.port, args.rate_limit_every, args.retry_after,
+                                           args.latency, verbose=True)
+    print(f"Fake Bot API at {api_base} (set telegram.api_base to this)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
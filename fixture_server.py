@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Local HTML Fixture Server for KLSE Target Price Monitor
+Serves price target listing pages so the scraper can be exercised offline.
+
+Author: cming401
+License: MIT
+"""
+
+import argparse
+import hashlib
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+LISTING_PATH = '/web/pricetarget/latest'
+
+STOCKS = [
+    ('ARMADA', 'BUMI ARMADA BERHAD'), ('BNASTRA', 'BINASTRA CORPORATION BERHAD'),
+    ('GAMUDA', 'GAMUDA BHD'), ('GOLDETF', 'TRADEPLUS SHARIAH GOLD TRACKER'),
+    ('IOICORP', 'IOI CORPORATION BHD'), ('MAYBANK', 'MALAYAN BANKING BHD'),
+    ('MISC', 'MISC BHD'), ('MNHLDG', 'MN HOLDINGS BERHAD'),
+    ('SUNCON', 'SUNWAY CONSTRUCTION GROUP BERHAD'), ('WCT', 'WCT HOLDINGS BERHAD'),
+    ('YINSON', 'YINSON HOLDINGS BHD'), ('TENAGA', 'TENAGA NASIONAL BHD'),
+    ('PBBANK', 'PUBLIC BANK BHD'), ('CIMB', 'CIMB GROUP HOLDINGS BERHAD'),
+]
+ANALYSTS = ['RHB-OSK', 'TA', 'AmInvest', 'BIMB', 'MAYBANK', 'PUBLIC BANK', 'KENANGA', 'CGS-CIMB']
+CALLS = ['BUY', 'BUY', 'BUY', 'HOLD', 'SELL']
+
+
+def render_listing(rows: List[Tuple]) -> str:
+    """Render listing rows as an i3investor-style HTML table.
+
+    Rows are (date, code, name, current, target, call, analyst), optionally followed by
+    the upside cell text; otherwise the upside is computed from the prices.
+    """
+    parts = [
+        '<html><head><title>Price Target</title></head><body>',
+        '<table id="pricetarget"><thead><tr>',
+        '<th>Date</th><th>Stock</th><th>Last Price</th><th>Target Price</th>',
+        '<th>Upside/Downside</th><th>Price Call</th><th>Source</th>',
+        '</tr></thead><tbody>',
+    ]
+    for row in rows:
+        date, code, name, cur, tgt, call, analyst = row[:7]
+        if len(row) > 7:
+            upside = row[7]
+        else:
+            diff = tgt - cur
+            upside = f"{diff:+.2f} ({diff / cur * 100:.2f}%)"
+        parts.append(
+            f'<tr><td>{date}</td>'
+            f'<td><a href="/web/stock/overview/{code}" title="{name}">{code}</a></td>'
+            f'<td>{cur:.2f}</td><td>{tgt:.2f}</td>'
+            f'<td>{upside}</td>'
+            f'<td>{call}</td><td>{analyst}</td></tr>'
+        )
+    parts.append('</tbody></table></body></html>')
+    return ''.join(parts)
+
+
+def synthetic_page(page: int, rows_per_page: int, date: Optional[str] = None) -> str:
+    """Generate a deterministic listing page; later pages hold older dates."""
+    rng = random.Random(f"{page}:{date}")
+    if date is None:
+        day = time.localtime(time.time() - (page - 1) * 86400)
+        date = time.strftime('%d/%m/%Y', day)
+    rows = []
+    for _ in range(rows_per_page):
+        code, name = rng.choice(STOCKS)
+        cur = round(rng.uniform(0.2, 12.0), 2)
+        tgt = round(cur * rng.uniform(0.8, 1.6), 2)
+        rows.append((date, code, name, cur, tgt, rng.choice(CALLS), rng.choice(ANALYSTS)))
+    return render_listing(rows)
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    """Serves synthetic or saved listing pages."""
+
+    server_version = 'KLSEFixture/1.0'
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        if parsed.path != LISTING_PATH:
+            self.send_error(404)
+            return
+        query = parse_qs(parsed.query)
+        page = int(query.get('page', ['1'])[0])
+        date = query.get('date', [None])[0]
+        cfg = self.server.fixture_cfg
+        if cfg['latency']:
+            time.sleep(cfg['latency'])
+
+        if cfg['directory']:
+            path = os.path.join(cfg['directory'], f"page_{page}.html")
+            if not os.path.exists(path):
+                self.send_error(404)
+                return
+            with open(path, 'rb') as f:
+                body = f.read()
+        elif page > cfg['pages']:
+            body = render_listing([]).encode('utf-8')
+        else:
+            body = synthetic_page(page, cfg['rows_per_page'], date).encode('utf-8')
+
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.fixture_cfg['verbose']:
+            super().log_message(format, *args)
+
+
+def start_fixture_server(port: int = 0, pages: int = 30, rows_per_page: int = 50,
+                         latency: float = 0.0, directory: Optional[str] = None,
+                         verbose: bool = False) -> Tuple[ThreadingHTTPServer, str]:
+    """Start the fixture server on a background thread and return it with its listing URL."""
+    server = ThreadingHTTPServer(('127.0.0.1', port), FixtureHandler)
+    server.daemon_threads = True
+    server.fixture_cfg = {
+        'pages': pages,
+        'rows_per_page': rows_per_page,
+        'latency': latency,
+        'directory': directory,
+        'verbose': verbose,
+    }
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, bound_port = server.server_address[:2]
+    return server, f"http://{host}:{bound_port}{LISTING_PATH}"
+
+
+def main():
+    """Run the fixture server in the foreground."""
+    parser = argparse.ArgumentParser(description="Serve KLSE price target fixture pages")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--pages', type=int, default=30, help="Number of synthetic pages")
+    parser.add_argument('--rows-per-page', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds of delay per request")
+    parser.add_argument('--dir', help="Serve saved page_<n>.html files from this directory")
+    args = parser.parse_args()
+
+    server, url = start_fixture_server(args.port, args.pages, args.rows_per_page,
+                                       args.latency, args.dir, verbose=True)
+    print(f"Serving fixtures at {url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Historical target price store for KLSE Target Price Monitor
+Persists every target price call in a local SQLite database.
+
+Author: cming401
+License: MIT
+"""
+
+import datetime
+import logging
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from models import TargetPrice
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS target_prices (
+    date            TEXT NOT NULL,
+    stock_code      TEXT NOT NULL,
+    analyst         TEXT NOT NULL,
+    target_price    TEXT NOT NULL,
+    stock_name      TEXT,
+    current_price   TEXT,
+    upside_downside TEXT,
+    price_call      TEXT,
+    target          REAL,
+    current         REAL,
+    upside_pct      REAL,
+    first_seen      TEXT NOT NULL,
+    last_seen       TEXT NOT NULL,
+    PRIMARY KEY (date, stock_code, analyst, target_price)
+);
+CREATE INDEX IF NOT EXISTS idx_target_prices_date ON target_prices (date);
+CREATE INDEX IF NOT EXISTS idx_target_prices_stock_date ON target_prices (stock_code, date);
+CREATE INDEX IF NOT EXISTS idx_target_prices_analyst_date ON target_prices (analyst, date);
+"""
+
+UPSERT = """
+INSERT INTO target_prices (
+    date, stock_code, analyst, target_price, stock_name, current_price,
+    upside_downside, price_call, target, current, upside_pct, first_seen, last_seen
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (date, stock_code, analyst, target_price) DO UPDATE SET
+    stock_name = excluded.stock_name,
+    current_price = excluded.current_price,
+    upside_downside = excluded.upside_downside,
+    price_call = excluded.price_call,
+    current = excluded.current,
+    upside_pct = excluded.upside_pct,
+    last_seen = excluded.last_seen
+"""
+
+RECORD_COLUMNS = ('date', 'stock_code', 'stock_name', 'current_price', 'target_price',
+                  'upside_downside', 'price_call', 'analyst')
+
+
+def _records(rows) -> List[TargetPrice]:
+    # Empty key columns were stored for absent fields; read them back as absent
+    return [TargetPrice.from_dict({k: v for k, v in zip(RECORD_COLUMNS, row) if v not in (None, '')})
+            for row in rows]
+
+
+class HistoryStore:
+    """SQLite (WAL mode) store of all target price calls, deduplicated on date/stock/analyst/target."""
+
+    def __init__(self, path: str = 'klse_history.db'):
+        self.path = path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+
+    def upsert(self, data_list: Iterable[Union[TargetPrice, Dict]]) -> int:
+        """Insert new calls and refresh known ones in one transaction; returns rows written."""
+        now = datetime.datetime.now().isoformat(timespec='seconds')
+        rows = []
+        for item in data_list:
+            rec = TargetPrice.coerce(item)
+            rows.append((
+                rec.date or '', rec.stock_code or '', rec.analyst or '', rec.target_price or '',
+                rec.stock_name, rec.current_price, rec.upside_downside, rec.price_call,
+                rec.target, rec.current, rec.upside_pct, now, now,
+            ))
+        if not rows:
+            return 0
+        with self._lock, self.conn:
+            self.conn.executemany(UPSERT, rows)
+        logger.info(f"Stored {len(rows)} target price records in {self.path}")
+        return len(rows)
+
+    @staticmethod
+    def _where(start_date: Optional[str] = None, end_date: Optional[str] = None,
+               stock_code: Optional[str] = None, analyst: Optional[str] = None) -> Tuple[str, List[str]]:
+        clauses = []
+        params: List[str] = []
+        if stock_code:
+            clauses.append('stock_code = ?')
+            params.append(stock_code)
+        if analyst:
+            clauses.append('analyst = ?')
+            params.append(analyst)
+        if start_date:
+            clauses.append('date >= ?')
+            params.append(start_date)
+        if end_date:
+            clauses.append('date <= ?')
+            params.append(end_date)
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+    def query(self, start_date: Optional[str] = None, end_date: Optional[str] = None,
+              stock_code: Optional[str] = None, analyst: Optional[str] = None) -> List[TargetPrice]:
+        """Fetch calls in a date range, optionally for one stock or analyst, in insertion order."""
+        where, params = self._where(start_date, end_date, stock_code, analyst)
+        sql = f"SELECT {', '.join(RECORD_COLUMNS)} FROM target_prices{where} ORDER BY rowid"
+        with self._lock:
+            return _records(self.conn.execute(sql, params))
+
+    def call_rows(self, start_date: Optional[str] = None,
+                  end_date: Optional[str] = None) -> List[Tuple[str, str, str, Optional[float], Optional[float]]]:
+        """(date, stock_code, analyst, target, current) for every call in date order, for bulk analysis."""
+        where, params = self._where(start_date, end_date)
+        sql = f"SELECT date, stock_code, analyst, target, current FROM target_prices{where} ORDER BY date"
+        with self._lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def records_for_date(self, date: str) -> List[TargetPrice]:
+        """Calls published on one YYYY-MM-DD date, in insertion order.
+
+        An analyst revising a target intraday leaves a row per target; only the latest is
+        returned, so a superseded target is never reported. That is the one still listed
+        most recently, then the one first seen most recently, then, for rows first seen in
+        the same fetch, the one listed first, as the listing is newest first.
+        """
+        sql = (f"SELECT {', '.join(RECORD_COLUMNS)} FROM target_prices t WHERE date = ? AND rowid = ("
+               "SELECT rowid FROM target_prices u WHERE u.date = t.date AND u.stock_code = t.stock_code "
+               "AND u.analyst = t.analyst ORDER BY last_seen DESC, first_seen DESC, rowid LIMIT 1) ORDER BY rowid")
+        with self._lock:
+            return _records(self.conn.execute(sql, (date,)))
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,126 @@
+"""
+On-disk HTTP page cache for KLSE Target Price Monitor
+Stores ETag/Last-Modified validators with the parsed records of each page.
+
+Author: cming401
+License: MIT
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PageCache:
+    """One JSON file per page URL, evicted by age and total size."""
+
+    def __init__(self, directory: str = '.cache/pages', max_age_hours: float = 72,
+                 max_size_mb: float = 50):
+        self.directory = directory
+        self.max_age = float(max_age_hours) * 3600
+        self.max_bytes = int(float(max_size_mb) * 1024 * 1024)
+        os.makedirs(self.directory, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, cache_cfg: Optional[dict]) -> Optional['PageCache']:
+        """Build a cache from the `data_source.cache` block, or None if disabled."""
+        cfg = cache_cfg or {}
+        if not cfg.get('enabled', True):
+            return None
+        return cls(cfg.get('dir', '.cache/pages'),
+                   cfg.get('max_age_hours', 72),
+                   cfg.get('max_size_mb', 50))
+
+    def _path(self, url: str) -> str:
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, url: str) -> Optional[Dict]:
+        """Return the cached entry for `url`, or None if missing, expired or unreadable."""
+        path = self._path(url)
+        try:
+            if self.max_age and time.time() - os.path.getmtime(path) > self.max_age:
+                os.remove(path)
+                return None
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry if entry.get('url') == url else None
+
+    def conditional_headers(self, entry: Optional[Dict]) -> Dict[str, str]:
+        """Build If-None-Match / If-Modified-Since headers from a cached entry."""
+        headers: Dict[str, str] = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def put(self, url: str, etag: Optional[str], last_modified: Optional[str], records: List[Dict]):
+        """Store validators and parsed records for `url` atomically."""
+        entry = {
+            'url': url,
+            'etag': etag,
+            'last_modified': last_modified,
+            'fetched_at': time.time(),
+            'records': records,
+        }
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, self._path(url))
+        except OSError as e:
+            logger.warning(f"Could not write page cache entry for {url}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def touch(self, url: str):
+        """Mark an entry as revalidated so age eviction restarts from now."""
+        try:
+            os.utime(self._path(url))
+        except OSError:
+            pass
+
+    def evict(self):
+        """Drop expired entries, then the least recently validated ones until under the size cap."""
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if self.max_age and now - stat.st_mtime > self.max_age:
+                self._remove(path)
+            else:
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        if not self.max_bytes or total <= self.max_bytes:
+            return
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def _remove(self, path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
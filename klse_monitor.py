@@ -7,13 +7,37 @@ Author: cming401
 License: MIT
 """
 
+from __future__ import annotations
+
+import argparse
 import json
 import datetime
 import logging
 import os
-import requests
-from typing import List, Dict, Optional
-from zoneinfo import ZoneInfo
+import sys
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, List, Dict, Optional, Tuple
+
+from chunking import Block, join_blocks, split_blocks, truncate_blocks
+from config_cache import ConfigError, load_config
+from delta import DEFAULT_RETENTION_DAYS, CallKey, DeltaResult, PublishedIndex, Revision, fingerprint, latest_calls
+from metrics import METRICS
+from models import TargetPrice, parse_upside, to_records
+from renderer import MessageRenderer
+from rules import Rule, RuleMatcher, alert_blocks, group_by_chat
+from scheduler import MYT, MonitorDaemon
+
+# Modules pulling in requests, lxml, NumPy or SQLite are imported where they are first
+# used, so a weekend cron run exits before loading any of them
+if TYPE_CHECKING:
+    from analytics import ConsensusEngine
+    from charts import ChartRenderer
+    from delivery import DeliveryResult, Destination, FanOut, Job, Part
+    from history_store import HistoryStore
+    from quotes import QuoteRefresher
+    from rollups import DailyRollups
+    from scraper import TargetPriceScraper
+    from sources import DataSource
+    from telegram_sender import TelegramSender
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -23,17 +47,94 @@ logger = logging.getLogger(__name__)
 class KLSETargetPriceMonitor:
     def __init__(self, config_file='config.json'):
         """Initialize the monitor with configuration file."""
-        self.config = self.load_config(config_file)
+        self._scraper: Optional[TargetPriceScraper] = None
+        self._source: Optional[DataSource] = None
+        self._history: Optional[HistoryStore] = None
+        self._rollups: Optional[DailyRollups] = None
+        self._published: Optional[PublishedIndex] = None
+        self._analytics: Optional[ConsensusEngine] = None
+        self._accuracy: Optional[Tuple[float, Dict[str, float]]] = None
+        self._alerts: Optional[RuleMatcher] = None
+        self._alerted: Optional[PublishedIndex] = None
+        self._quotes: Optional[QuoteRefresher] = None
+        self._charts: Optional[ChartRenderer] = None
+        self._sender: Optional[TelegramSender] = None
+        self.renderer = MessageRenderer()
+        self.using_sample_data = False
+        self.apply_config(self.load_config(config_file))
+        
+    def apply_config(self, config: dict):
+        """Apply a loaded configuration, dropping resources whose settings changed."""
+        old = getattr(self, 'config', {})
+        self.config = config
         self.telegram_token = self.config['telegram']['bot_token']
         self.telegram_channel = self.config['telegram']['channel_id']
         self.telegram_chat_id = self.config['telegram']['chat_id']
         self.message_cfg = self.config.get('message', {})
+        self.source_cfg = self.config.get('data_source', {})
+        self.history_cfg = self.config.get('history', {})
+        self.delta_cfg = self.config.get('delta', {})
+        self.analytics_cfg = self.config.get('analytics', {})
+        self.backtest_cfg = self.config.get('backtest', {})
+        self.schedule_cfg = self.config.get('schedule', {})
+        self.pipeline_cfg = self.config.get('pipeline', {})
+        METRICS.configure(self.config.get('metrics', {}))
+        
+        # Warm resources are kept across reloads unless their own settings changed
+        if old.get('data_source') != config.get('data_source'):
+            if self._scraper is not None:
+                self._scraper.close()
+                self._scraper = None
+            self._source = None
+        if self._history is not None and old.get('history') != config.get('history'):
+            self._history.close()
+            self._history = None
+        if self._rollups is not None and old.get('history') != config.get('history'):
+            self._rollups.close()
+            self._rollups = None
+        if old.get('delta') != config.get('delta'):
+            self._published = None
+        if old.get('analytics') != config.get('analytics'):
+            self._analytics = None
+        if old.get('alerts') != config.get('alerts'):
+            self._alerts = None
+            self._alerted = None
+        if self._quotes is not None and old.get('quotes') != config.get('quotes'):
+            self._quotes.close()
+            self._quotes = None
+        if old.get('charts') != config.get('charts'):
+            self._charts = None
+        if self._sender is not None and old.get('telegram') != config.get('telegram'):
+            self._sender.close()
+            self._sender = None
+    
+    def reload_config(self, config_file: str = 'config.json'):
+        """Re-read the configuration file and apply it."""
+        self.apply_config(self.load_config(config_file))
+    
+    def close(self):
+        """Release pooled connections and open stores."""
+        if self._scraper is not None:
+            self._scraper.close()
+            self._scraper = None
+        self._source = None
+        if self._history is not None:
+            self._history.close()
+            self._history = None
+        if self._rollups is not None:
+            self._rollups.close()
+            self._rollups = None
+        if self._quotes is not None:
+            self._quotes.close()
+            self._quotes = None
+        if self._sender is not None:
+            self._sender.close()
+            self._sender = None
         
     def load_config(self, config_file: str) -> dict:
-        """Load configuration from JSON file."""
+        """Load configuration from JSON file, through the validated snapshot while it is unchanged."""
         try:
-            with open(config_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return load_config(config_file)
         except FileNotFoundError:
             logger.error(f"Configuration file {config_file} not found!")
             logger.error("Please copy config.json.example to config.json and configure your settings.")
@@ -41,10 +142,13 @@ class KLSETargetPriceMonitor:
         except json.JSONDecodeError as e:
             logger.error(f"Invalid JSON in configuration file: {e}")
             raise
+        except ConfigError as e:
+            logger.error(f"Invalid configuration in {config_file}: {e}")
+            raise
     
     def get_today_date(self) -> str:
-        """Get today's date in YYYY-MM-DD format."""
-        return datetime.date.today().strftime('%Y-%m-%d')
+        """Get today's date in Malaysia in YYYY-MM-DD format."""
+        return datetime.datetime.now(MYT).strftime('%Y-%m-%d')
     
     def get_sample_data(self) -> List[Dict]:
         """Get sample KLSE target price data."""
@@ -176,330 +280,639 @@ class KLSETargetPriceMonitor:
         
         return sample_data
     
-    def fetch_target_prices(self) -> List[Dict]:
-        """Fetch KLSE target price data."""
+    def get_scraper(self) -> TargetPriceScraper:
+        """Get the scraper, creating its pooled session on first use."""
+        if self._scraper is None:
+            from scraper import TargetPriceScraper
+            self._scraper = TargetPriceScraper(self.source_cfg)
+        return self._scraper
+
+    def get_source(self) -> Optional[DataSource]:
+        """Get the source selected by data_source.type: scraper (the default when a url is set),
+        files or sample; None when nothing is configured."""
+        if self._source is None:
+            from sources import FileSource, SampleSource, ScraperSource
+            kind = self.source_cfg.get('type') or ('scraper' if self.source_cfg.get('url') else None)
+            if kind == 'scraper':
+                self._source = ScraperSource(self.get_scraper())
+            elif kind == 'files':
+                self._source = FileSource(self.source_cfg.get('files', {}))
+            elif kind == 'sample':
+                self._source = SampleSource(self.get_sample_data)
+            elif kind is not None:
+                raise ValueError(f"Unknown data_source.type {kind!r}")
+        return self._source
+
+    def get_history(self) -> Optional[HistoryStore]:
+        """Get the history store, or None if history is disabled."""
+        if self._history is None and self.history_cfg.get('enabled', True):
+            from history_store import HistoryStore
+            self._history = HistoryStore(self.history_cfg.get('path', 'klse_history.db'))
+        return self._history
+
+    def get_rollups(self) -> Optional[DailyRollups]:
+        """Get the daily rollups kept in the history database, or None if history is disabled."""
+        if self._rollups is None and self.history_cfg.get('enabled', True):
+            from rollups import DailyRollups
+            self._rollups = DailyRollups(self.history_cfg.get('path', 'klse_history.db'))
+        return self._rollups
+
+    def update_rollups(self, data_list: Iterable[TargetPrice]):
+        """Rebuild the rollups of the days a run stored calls for."""
+        if not self.config.get('rollups', {}).get('enabled', True):
+            return
+        rollups = self.get_rollups()
+        if rollups is not None:
+            rollups.update({rec.date for rec in data_list})
+
+    def build_digest(self, days: int, end: Optional[str] = None, limit: int = 10):
+        """Digest of the `days` days ending on `end` (default today), catching up stale rollups first."""
+        rollups = self.get_rollups()
+        if rollups is None:
+            raise RuntimeError("Digests need history.enabled")
+        end = end or self.get_today_date()
+        start = (datetime.date.fromisoformat(end) - datetime.timedelta(days=days - 1)).isoformat()
+        rollups.build_missing(start, end)
+        return rollups.digest(start, end, limit)
+
+    def get_quote_refresher(self) -> Optional[QuoteRefresher]:
+        """Get the live quote refresher, or None if quotes are disabled."""
+        quotes_cfg = self.config.get('quotes', {})
+        if self._quotes is None and quotes_cfg.get('enabled', False):
+            from quotes import QuoteRefresher
+            self._quotes = QuoteRefresher.from_config(quotes_cfg)
+        return self._quotes
+
+    def refresh_quotes(self, data_list: List[TargetPrice]) -> List[TargetPrice]:
+        """Records at live prices with their upsides recomputed; unchanged if quotes are off."""
+        refresher = self.get_quote_refresher()
+        if refresher is None or not data_list:
+            return data_list
+        return refresher.refresh(data_list)
+
+    def get_published_index(self) -> Optional[PublishedIndex]:
+        """Get the index of already published calls, or None if delta sending is disabled."""
+        if self._published is None and self.delta_cfg.get('enabled', True):
+            self._published = PublishedIndex(self.delta_cfg.get('path', 'published_index.json'),
+                                             int(self.delta_cfg.get('retention_days', DEFAULT_RETENTION_DAYS)))
+        return self._published
+    
+    def get_analytics(self) -> Optional[ConsensusEngine]:
+        """Get the consensus engine with its saved state, or None if analytics are disabled."""
+        if self._analytics is None and self.analytics_cfg.get('enabled', False):
+            from analytics import ConsensusEngine
+            self._analytics = ConsensusEngine.load(self.analytics_cfg.get('path', 'consensus_state.json'),
+                                                   self.analytics_cfg.get('windows'))
+        return self._analytics
+    
+    def get_analyst_accuracy(self, message_cfg: dict) -> Optional[Dict[str, float]]:
+        """Backtested hit rate per analyst from the cached scores, if the message shows them.
+
+        Scores come from `python backtest.py`; the file is re-read only when it changes.
+        """
+        if not message_cfg.get('show_analyst_accuracy', False):
+            return None
+        path = self.backtest_cfg.get('scores_path', 'analyst_scores.json')
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None
+        if self._accuracy is None or self._accuracy[0] != mtime:
+            from backtest import load_scores
+            scores = load_scores(path) or {}
+            min_calls = int(self.backtest_cfg.get('min_evaluated_calls', 5))
+            self._accuracy = (mtime, {name: score.hit_rate for name, score in scores.items()
+                                      if score.hit_rate is not None and score.evaluated >= min_calls})
+        return self._accuracy[1]
+    
+    def update_analytics(self, history: HistoryStore):
+        """Fold newly stored calls into the consensus aggregates and save them."""
+        analytics = self.get_analytics()
+        if analytics is None:
+            return
+        changed = analytics.refresh(history)
+        analytics.save(self.analytics_cfg.get('path', 'consensus_state.json'))
+        logger.info(f"Consensus updated for {changed} calls across {len(analytics.books)} stocks")
+
+    def fetch_target_prices(self, fetch: Optional[Callable[[DataSource], List[Dict]]] = None) -> List[TargetPrice]:
+        """Fetch KLSE target price data, through `fetch(source)` when given."""
         try:
             logger.info("Fetching KLSE target price data...")
             
-            # TODO: Implement actual web scraping here
-            # For now, using sample data
-            logger.info("Using sample data...")
-            data_list = self.get_sample_data()
+            data_list: List[Dict] = []
+            self.using_sample_data = False
+            source = self.get_source()
+            if source is not None:
+                try:
+                    data_list = fetch(source) if fetch else source.fetch(self.get_today_date())
+                except Exception as e:
+                    logger.error(f"Failed to fetch from the {source.name} source: {e}")
+                self.using_sample_data = source.is_sample
             
-            logger.info(f"Successfully fetched {len(data_list)} target price records")
-            return data_list
+            if not data_list and not self.using_sample_data and self.source_cfg.get('fallback_to_sample', True):
+                logger.info("Using sample data...")
+                data_list = self.get_sample_data()
+                self.using_sample_data = True
+            
+            records = to_records(data_list)
+            logger.info(f"Successfully fetched {len(records)} target price records")
+            return records
             
         except Exception as e:
             logger.error(f"Failed to fetch data: {e}")
             return []
     
-    def filter_today_data(self, data_list: List[Dict]) -> List[Dict]:
+    def filter_today_data(self, data_list: Iterable[Dict]) -> List[Dict]:
         """Filter data for today's date."""
         today = self.get_today_date()
         today_data = [item for item in data_list if item['date'] == today]
         logger.info(f"Found {len(today_data)} target price records for today ({today})")
         return today_data
     
-    def format_message(self, data_list: List[Dict]) -> str:
-        """Format data into Telegram message."""
-        if not data_list:
-            return f"📊 KLSE Target Price Update\n🗓️ Date: {self.get_today_date()}\n\nNo new target prices available"
-        
-        today = self.get_today_date()
-        message = f"📊 KLSE Target Price Update\n🗓️ Date: {today}\n\n"
-        
-        # Group by stock code
-        stock_groups = {}
-        for item in data_list:
-            stock_code = item.get('stock_code', 'N/A')
-            if stock_code not in stock_groups:
-                stock_groups[stock_code] = []
-            stock_groups[stock_code].append(item)
-        
-        # Sort groups by highest upside percentage
-        sorted_groups = []
-        for stock_code, items in stock_groups.items():
-            # Find the highest upside for this stock
-            max_upside = 0
-            for item in items:
-                upside_text = item.get('upside_downside', '0')
-                if '(' in upside_text:
-                    try:
-                        upside_pct = float(upside_text.split('(')[1].split('%')[0])
-                        max_upside = max(max_upside, upside_pct)
-                    except:
-                        pass
-            sorted_groups.append((max_upside, stock_code, items))
-        
-        # Sort by upside percentage (descending)
-        sorted_groups.sort(key=lambda x: x[0], reverse=True)
-        
-        for i, (_, stock_code, items) in enumerate(sorted_groups, 1):
-            # Get stock name from first item
-            stock_name = items[0].get('stock_name', 'N/A')
-            
-            # Get recommendation emoji from first item
-            price_call = items[0].get('price_call', '').upper()
-            call_emoji = {
-                'BUY': '🟢',
-                'HOLD': '🟡',
-                'SELL': '🔴'
-            }.get(price_call, '⚪')
-            
-            message += f"{i}. {call_emoji} {stock_code} - {stock_name}\n"
-            
-            # Add each target price for this stock
-            for item in items:
-                current_price = item.get('current_price', 'N/A')
-                target_price = item.get('target_price', 'N/A')
-                upside_text = item.get('upside_downside', '')
-                analyst = item.get('analyst', 'N/A')
-                price_call_text = item.get('price_call', 'N/A')
-                
-                # Determine trend emoji
-                if '+' in upside_text:
-                    trend_emoji = "📈"
-                elif '-' in upside_text:
-                    trend_emoji = "📉"
-                else:
-                    trend_emoji = "➡️"
-                
-                # Convert recommendation to English
-                call_english = {
-                    'BUY': 'Buy',
-                    'HOLD': 'Hold',
-                    'SELL': 'Sell'
-                }.get(price_call_text.upper(), price_call_text)
-                
-                message += f"   💰 Current: RM{current_price} 🎯 Target: RM{target_price} {trend_emoji} Change: {upside_text}\n"
-                message += f"   🏢 Analyst: {analyst} ({call_english})\n"
-            
-            message += "\n"
-        
-        # Add summary statistics
-        buy_count = sum(1 for item in data_list if item.get('price_call', '').upper() == 'BUY')
-        hold_count = sum(1 for item in data_list if item.get('price_call', '').upper() == 'HOLD')
-        sell_count = sum(1 for item in data_list if item.get('price_call', '').upper() == 'SELL')
-        
-        message += f"📊 Daily Summary:\n"
-        message += f"   🟢 Buy: {buy_count} stocks\n"
-        message += f"   🟡 Hold: {hold_count} stocks\n"
-        message += f"   🔴 Sell: {sell_count} stocks\n"
-        message += f"   📈 Total: {len(data_list)} stocks\n\n"
-        message += f"🔗 Source: https://klse.i3investor.com/web/pricetarget/latest"
-        
-        return message
+    def _markdown_blocks(self, data_list: List[Dict],
+                         revisions: Optional[Dict[CallKey, Revision]] = None,
+                         message_cfg: Optional[dict] = None) -> List[Block]:
+        """Build the plain-text report as blocks: header, one per stock, summary."""
+        cfg = self.message_cfg if message_cfg is None else message_cfg
+        return self.renderer.markdown_blocks(data_list, self.get_today_date(), revisions,
+                                             self.get_analyst_accuracy(cfg))
+
+    def format_message(self, data_list: List[Dict], revisions: Optional[Dict[CallKey, Revision]] = None) -> str:
+        """Format data into Telegram message, annotating revised calls."""
+        return join_blocks(self._markdown_blocks(data_list, revisions))
 
     def _parse_upside_pct(self, upside_text: str) -> Optional[float]:
         """Extract percentage number from text like '+0.29 (20.71%)'."""
-        try:
-            if '(' in upside_text and '%' in upside_text:
-                return float(upside_text.split('(')[1].split('%')[0])
-        except Exception:
-            pass
-        return None
-
-    def format_message_html(self, data_list: List[Dict]) -> str:
-        """Format data into an HTML Telegram message with top movers and filtering."""
-        def esc(s: Optional[str]) -> str:
-            s = s or ''
-            return s.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+        return parse_upside(upside_text)[1]
 
+    def _html_blocks(self, data_list: List[Dict],
+                     revisions: Optional[Dict[CallKey, Revision]] = None,
+                     message_cfg: Optional[dict] = None) -> List[Block]:
+        """Build the HTML report as blocks; movers rows and per-stock entries sit inside <pre>."""
+        cfg = self.message_cfg if message_cfg is None else message_cfg
         # Time in MYT for clarity
-        now_myt = datetime.datetime.now(ZoneInfo("Asia/Kuala_Lumpur"))
-        today_str = now_myt.strftime("%Y-%m-%d %H:%M MYT")
-
-        if not data_list:
-            return f"<b>📊 KLSE Target Price Update</b>\n<i>{today_str}</i>\n\nNo new target prices available."
-
-        # Apply threshold filter
-        threshold = float(self.message_cfg.get('upside_threshold_pct', 0) or 0)
-        filtered: List[Dict] = []
-        for item in data_list:
-            pct = self._parse_upside_pct(item.get('upside_downside', ''))
-            if pct is None:
-                continue
-            if pct >= threshold:
-                filtered.append(item)
-
-        omitted_count = max(0, len(data_list) - len(filtered))
-        if not filtered:
-            # Fall back to original if filter removes everything
-            filtered = data_list
-            omitted_count = 0
-
-        # Group by stock code
-        stock_groups: Dict[str, List[Dict]] = {}
-        for it in filtered:
-            stock_groups.setdefault(it.get('stock_code', 'N/A'), []).append(it)
-
-        ranked = []
-        for code, items in stock_groups.items():
-            max_pct = 0.0
-            for it in items:
-                pct = self._parse_upside_pct(it.get('upside_downside', '')) or 0.0
-                max_pct = max(max_pct, pct)
-            ranked.append((max_pct, code, items))
-        ranked.sort(key=lambda x: x[0], reverse=True)
-
-        # Header
-        header = f"<b>📊 KLSE Target Price Update</b>\n<i>{today_str}</i>\n\n"
-
-        # Top movers section
-        body = ""
-        if self.message_cfg.get('include_top_movers', True):
-            count = int(self.message_cfg.get('top_movers_count', 3) or 3)
-            top = ranked[:count]
-            if top:
-                body += "<b>🔥 Top Movers</b>\n<pre>"
-                for i, (pct, code, items) in enumerate(top, 1):
-                    name = esc(items[0].get('stock_name', 'N/A'))
-                    call = items[0].get('price_call', '').upper()
-                    emoji = {'BUY': '🟢', 'HOLD': '🟡', 'SELL': '🔴'}.get(call, '⚪')
-                    it = items[0]
-                    cur = it.get('current_price', 'N/A')
-                    tgt = it.get('target_price', 'N/A')
-                    up = it.get('upside_downside', '')
-                    body += f"{i}. {emoji} {code:7} {name}\n"
-                    body += f"    Cur RM{cur:>6}  Tgt RM{tgt:>6}  {up:>12}\n"
-                body += "</pre>\n\n"
-
-        # Full list
-        max_items = int(self.message_cfg.get('max_items', 50) or 50)
-        body += "<b>📋 Full List</b>\n<pre>"
-        shown = 0
-        for rank, (_, code, items) in enumerate(ranked, 1):
-            if shown >= max_items:
-                break
-            name = esc(items[0].get('stock_name', 'N/A'))
-            call = items[0].get('price_call', '').upper()
-            emoji = {'BUY': '🟢', 'HOLD': '🟡', 'SELL': '🔴'}.get(call, '⚪')
-            multi = f" ({len(items)} analysts)" if len(items) > 1 else ""
-            body += f"{rank:2}. {emoji} {code:7} {name}{multi}\n"
-            for it in items:
-                up = it.get('upside_downside', '')
-                trend = "📈" if '+' in up else ("📉" if '-' in up else "➡️")
-                cur = it.get('current_price', 'N/A')
-                tgt = it.get('target_price', 'N/A')
-                analyst = esc(it.get('analyst', 'N/A'))
-                body += f"    Cur RM{cur:>6}  Tgt RM{tgt:>6}  {trend} {up:>12}  {analyst}\n"
-            body += "\n"
-            shown += 1
-        body += "</pre>\n"
-
-        # Summary
-        buy = sum(1 for d in filtered if d.get('price_call', '').upper() == 'BUY')
-        hold = sum(1 for d in filtered if d.get('price_call', '').upper() == 'HOLD')
-        sell = sum(1 for d in filtered if d.get('price_call', '').upper() == 'SELL')
-        summary = f"<b>📊 Daily Summary</b>\n" \
-                  f"🟢 Buy: {buy}  🟡 Hold: {hold}  🔴 Sell: {sell}\n" \
-                  f"📈 Total records: {len(filtered)}\n"
-        if omitted_count:
-            summary += f"⚠️ Omitted {omitted_count} below {threshold:.0f}% upside\n"
-        summary += "\n" + \
-                   f"🔗 <a href=\"https://klse.i3investor.com/web/pricetarget/latest\">Source</a>"
-
-        message = header + body + summary
-
-        # Ensure message within Telegram limit; truncate if needed
-        max_chars = 4096
-        if len(message) > max_chars:
-            message = message[:max_chars - 50] + "\n\n… (truncated to fit Telegram limit)"
-
-        return message
+        today_str = datetime.datetime.now(MYT).strftime("%Y-%m-%d %H:%M MYT")
+        return self.renderer.html_blocks(data_list, today_str, cfg, revisions, self.get_analyst_accuracy(cfg))
+
+    def format_message_html(self, data_list: List[Dict],
+                            revisions: Optional[Dict[CallKey, Revision]] = None,
+                            message_cfg: Optional[dict] = None) -> str:
+        """Format data into an HTML Telegram message with top movers, filtering and revision notes.
+
+        If the message is over Telegram's limit, whole stocks are dropped from the end so
+        no tag is left open.
+        """
+        return truncate_blocks(self._html_blocks(data_list, revisions, message_cfg))
     
-    def send_to_telegram(self, message: str) -> bool:
-        """Send message to Telegram channel."""
-        url = f"https://api.telegram.org/bot{self.telegram_token}/sendMessage"
-        parse_mode = (self.message_cfg.get('parse_mode') or 'Markdown').strip()
-        reply_markup = None
-        if self.message_cfg.get('include_buttons', True):
-            reply_markup = json.dumps({
+    def get_sender(self) -> TelegramSender:
+        """Get the Telegram sender, creating its pooled session and outbox on first use."""
+        if self._sender is None:
+            from telegram_sender import TelegramSender
+            self._sender = TelegramSender.from_config(self.config['telegram'])
+        return self._sender
+
+    def build_messages(self, data_list: List[Dict], revisions: Optional[Dict[CallKey, Revision]] = None,
+                       message_cfg: Optional[dict] = None) -> List[str]:
+        """Format data for a message config: split into ordered parts when split_long_messages
+        is set, otherwise one message truncated on a stock boundary."""
+        cfg = self.message_cfg if message_cfg is None else message_cfg
+        with METRICS.timer('format'):
+            if (cfg.get('parse_mode') or 'Markdown').upper() == 'HTML':
+                blocks = self._html_blocks(data_list, revisions, cfg)
+            else:
+                blocks = self._markdown_blocks(data_list, revisions, cfg)
+            if cfg.get('split_long_messages', False):
+                return split_blocks(blocks)
+            return [truncate_blocks(blocks)]
+
+    def get_chart_renderer(self) -> Optional[ChartRenderer]:
+        """Get the chart renderer, or None if charts are disabled."""
+        charts_cfg = self.config.get('charts', {})
+        if self._charts is None and charts_cfg.get('enabled', False):
+            from charts import ChartRenderer
+            # Charts queued in the outbox are uploaded on a later run, so pruning keeps them
+            self._charts = ChartRenderer.from_config(charts_cfg, lambda: self.get_sender().queued_files())
+        return self._charts
+
+    def build_charts(self, data_list: List[Dict], message_cfg: Optional[dict] = None) -> List[Part]:
+        """The top movers chart album for a message config, as one message part; empty when
+        charts are off for it or nothing could be drawn."""
+        cfg = self.message_cfg if message_cfg is None else message_cfg
+        charts = self.get_chart_renderer()
+        if charts is None or not data_list or not cfg.get('include_charts', True):
+            return []
+        caption = f"📊 KLSE top movers, {datetime.datetime.now(MYT).strftime('%Y-%m-%d')}"
+        threshold = float(cfg.get('upside_threshold_pct', 0) or 0)
+        album = charts.charts(data_list, caption, threshold)
+        return [album] if album else []
+
+    def message_params(self, message_cfg: Optional[dict] = None) -> dict:
+        """sendMessage parameters (parse mode, buttons) for a message config."""
+        cfg = self.message_cfg if message_cfg is None else message_cfg
+        data = {
+            'parse_mode': (cfg.get('parse_mode') or 'Markdown').strip(),
+            'disable_web_page_preview': True
+        }
+        if cfg.get('include_buttons', True):
+            data['reply_markup'] = json.dumps({
                 "inline_keyboard": [[
                     {"text": "View Source", "url": "https://klse.i3investor.com/web/pricetarget/latest"}
                 ]]
             })
+        return data
 
-        data = {
-            'chat_id': self.telegram_channel,
-            'text': message,
-            'parse_mode': parse_mode,
-            'disable_web_page_preview': True
-        }
-        if reply_markup:
-            data['reply_markup'] = reply_markup
-
-        tries = 3
-        for attempt in range(1, tries + 1):
-            try:
-                response = requests.post(url, data=data, timeout=20)
-                response.raise_for_status()
-                result = response.json()
-                if result.get('ok'):
-                    logger.info("Message sent successfully to Telegram channel")
-                    return True
-                else:
-                    logger.error(f"Telegram API error: {result}")
-                    return False
-            except requests.RequestException as e:
-                logger.error(f"Network error sending Telegram message (attempt {attempt}/{tries}): {e}")
-                if attempt < tries:
-                    # small backoff
-                    try:
-                        import time
-                        time.sleep(1.5 * attempt)
-                    except Exception:
-                        pass
-                else:
-                    return False
-            except Exception as e:
-                logger.error(f"Failed to send Telegram message: {e}")
-                return False
+    def send_to_telegram(self, message: str, chat_id: Optional[str] = None) -> bool:
+        """Send message to Telegram channel, or to `chat_id` when given."""
+        from telegram_sender import FAILED, QUEUED, SENT
+        try:
+            status = self.get_sender().send_message(chat_id or self.telegram_channel, message,
+                                                    **self.message_params())
+        except Exception as e:
+            logger.error(f"Failed to send Telegram message: {e}")
+            return False
+        if status == SENT:
+            logger.info("Message sent successfully to Telegram channel")
+        elif status == QUEUED:
+            logger.warning("Telegram unreachable, message kept in the outbox for the next run")
+        return status != FAILED
+
+    def get_fanout(self) -> FanOut:
+        """Fan-out over the shared sender, sized by telegram.fanout_workers."""
+        from delivery import FanOut
+        return FanOut(self.get_sender(), int(self.config['telegram'].get('fanout_workers', 8)))
+
+    def report_jobs(self, data_list: List[Dict],
+                    deltas: Optional[Dict[str, DeltaResult]] = None) -> Iterator[Job]:
+        """The report as (destination, parts, params) jobs; the chart album, when enabled,
+        follows the text.
+
+        With `deltas`, each destination gets only its own new and revised calls, and
+        destinations with nothing new get no job. Destinations with the same calls and
+        revisions form one group, rendered once per distinct message config.
+        """
+        from delivery import load_destinations
+        fanout = self.get_fanout()
+        destinations = load_destinations(self.config)
+        if deltas is None:
+            yield from fanout.iter_jobs(
+                destinations,
+                lambda cfg: self.build_messages(data_list, None, cfg) + self.build_charts(data_list, cfg),
+                self.message_params,
+            )
+            return
+
+        groups: Dict[tuple, List[Destination]] = {}
+        for destination in destinations:
+            delta = deltas.get(destination.chat_id)
+            if delta is None or not delta.changed:
+                continue
+            key = (frozenset(fingerprint(rec) for rec in delta.changed),
+                   frozenset(delta.revisions.items()))
+            groups.setdefault(key, []).append(destination)
+        for (changed, _), group in groups.items():
+            calls = _select(data_list, changed)
+            revisions = deltas[group[0].chat_id].revisions
+            yield from fanout.iter_jobs(
+                group,
+                lambda cfg: self.build_messages(calls, revisions, cfg) + self.build_charts(calls, cfg),
+                self.message_params,
+            )
+
+    def deliver(self, data_list: List[Dict],
+                deltas: Optional[Dict[str, DeltaResult]] = None) -> List[DeliveryResult]:
+        """Render the report and send it to every destination, or with `deltas` to each
+        destination its own new and revised calls."""
+        return self.get_fanout().send(list(self.report_jobs(data_list, deltas)))
     
+    def get_alert_matcher(self) -> Optional[RuleMatcher]:
+        """Get the compiled alert rules, or None if alerts are disabled."""
+        alerts_cfg = self.config.get('alerts', {})
+        if self._alerts is None and alerts_cfg.get('enabled', False):
+            self._alerts = RuleMatcher.from_config(alerts_cfg)
+            logger.info(f"Compiled {len(self._alerts)} alert rules")
+        return self._alerts
+
+    def get_alert_index(self) -> Optional[PublishedIndex]:
+        """Get the index of calls already alerted to each subscriber, or None if alerts are disabled.
+
+        It is kept apart from the report's published index, so subscribers are tracked
+        even when delta sending is off.
+        """
+        alerts_cfg = self.config.get('alerts', {})
+        if self._alerted is None and alerts_cfg.get('enabled', False):
+            self._alerted = PublishedIndex(alerts_cfg.get('path', 'alerted_index.json'),
+                                           int(alerts_cfg.get('retention_days', DEFAULT_RETENTION_DAYS)))
+        return self._alerted
+
+    def alert_matches(self, data_list: List[TargetPrice]) -> Dict[str, List[Tuple[Rule, TargetPrice]]]:
+        """Each subscriber's rule matches among the calls not alerted to them yet.
+
+        Sample data is never alerted.
+        """
+        matcher = self.get_alert_matcher()
+        if matcher is None or not data_list or self.using_sample_data:
+            return {}
+        matches = matcher.match(data_list)
+        alerted = self.get_alert_index()
+        if alerted is not None:
+            matches = [(rule, rec) for rule, rec in matches if not alerted.contains(rec, rule.chat_id)]
+        METRICS.inc('alerts', len(matches))
+        return group_by_chat(matches)
+
+    def alert_jobs(self, chat_matches: Dict[str, List[Tuple[Rule, TargetPrice]]]) -> List[Job]:
+        """One alert job per subscriber with matches."""
+        if not chat_matches:
+            return []
+        from delivery import Destination
+        params = {'parse_mode': 'HTML', 'disable_web_page_preview': True}
+        jobs = [(Destination(chat_id, name=f"alerts:{chat_id}"), split_blocks(alert_blocks(matches)), params)
+                for chat_id, matches in chat_matches.items()]
+        logger.info(f"{sum(map(len, chat_matches.values()))} alert match(es) for {len(jobs)} subscriber(s)")
+        return jobs
+
+    def complete_alerts(self, chat_matches: Dict[str, List[Tuple[Rule, TargetPrice]]],
+                        results: List[DeliveryResult]):
+        """Record the calls alerted to each subscriber whose alert was accepted."""
+        alerted = self.get_alert_index()
+        if alerted is None or not results:
+            return
+        for result in results:
+            chat_id = result.destination.chat_id
+            if self._accepted(result) and chat_id in chat_matches:
+                alerted.mark_published([rec for _, rec in chat_matches[chat_id]], chat_id, save=False)
+        alerted.save()
+
+    def send_alerts(self, data_list: List[TargetPrice]) -> int:
+        """Match new calls against every subscriber's rules and send each subscriber one alert
+        for the calls not alerted to them before; returns the number of subscribers alerted."""
+        chat_matches = self.alert_matches(data_list)
+        jobs = self.alert_jobs(chat_matches)
+        if jobs:
+            self.complete_alerts(chat_matches, self.get_fanout().send(jobs))
+        return len(jobs)
+
+    def _accepted(self, result: DeliveryResult) -> bool:
+        """Telegram accepted the message, or the outbox holds it for the next run's flush."""
+        return result.delivered or (result.ok and self.get_sender().outbox is not None)
+
     def is_weekday(self) -> bool:
-        """Check if today is a weekday."""
-        return datetime.date.today().weekday() < 5  # Monday=0, Sunday=6
+        """Check if today is a weekday in Malaysia."""
+        return datetime.datetime.now(MYT).weekday() < 5  # Monday=0, Sunday=6
     
     def run_monitor(self):
         """Execute the monitoring task."""
+        METRICS.start_run()
+        outcome = 'error'
         try:
-            logger.info("Starting KLSE target price monitoring task...")
-            
-            # Check if today is a weekday
-            if not self.is_weekday():
-                logger.info("Today is weekend, skipping monitoring")
-                return
-            
-            # Fetch target price data
-            all_data = self.fetch_target_prices()
-            
-            if not all_data:
-                logger.warning("No data retrieved")
-                return
-            
-            # Filter today's data
-            today_data = self.filter_today_data(all_data)
-            
-            # Format message
-            use_html = (self.message_cfg.get('parse_mode', 'Markdown').upper() == 'HTML')
-            message = self.format_message_html(today_data) if use_html else self.format_message(today_data)
-            
-            # Send to Telegram
-            success = self.send_to_telegram(message)
-            
-            if success:
-                logger.info("Monitoring task completed successfully")
+            if self.pipeline_cfg.get('mode', 'sync') == 'async':
+                from pipeline import AsyncPipeline
+                outcome = AsyncPipeline(self, self.pipeline_cfg).run()
             else:
-                logger.error("Monitoring task failed")
-                
+                outcome = self._run_monitor()
         except Exception as e:
             logger.error(f"Error in monitoring task: {e}")
+        finally:
+            METRICS.finish_run(outcome)
+
+    def _run_monitor(self) -> str:
+        """The monitoring task; returns the run outcome recorded in the metrics."""
+        if not self.begin_run():
+            return 'skipped'
+        
+        # Fetch target price data
+        with METRICS.timer('fetch'):
+            all_data = self.fetch_target_prices()
+        
+        outcome, today_data, deltas, published = self.select_calls(all_data)
+        if outcome is not None:
+            return outcome
+        
+        # Subscriber alerts look at the new and revised calls only
+        with METRICS.timer('alerts'):
+            self.send_alerts(today_data)
+        
+        # Format and send to every destination
+        with METRICS.timer('deliver'):
+            results = self.deliver(today_data, deltas)
+        return self.complete_run(deltas, published, results)
+
+    def begin_run(self) -> bool:
+        """Start a run: False on a skipped weekend, otherwise flush what earlier runs left queued."""
+        logger.info("Starting KLSE target price monitoring task...")
+        
+        # Check if today is a weekday
+        if self.schedule_cfg.get('weekdays_only', True) and not self.is_weekday():
+            logger.info("Today is weekend, skipping monitoring")
+            return False
+        
+        # Deliver anything left queued by an earlier run first
+        with METRICS.timer('flush'):
+            self.get_sender().flush()
+        return True
+
+    def select_calls(self, all_data: List[TargetPrice]) -> Tuple[Optional[str], List[TargetPrice],
+                                                                 Optional[Dict[str, DeltaResult]],
+                                                                 Optional[PublishedIndex]]:
+        """Store fetched calls and pick the ones to send: (outcome if the run ends here,
+        calls to send at live prices, each destination's delta by chat id, published index).
+
+        The calls to send are those new or revised for at least one destination; the
+        deltas are None when every destination gets them all.
+        """
+        METRICS.inc('records', len(all_data), kind='fetched')
+        
+        if not all_data:
+            logger.warning("No data retrieved")
+            return 'no_data', [], None, None
+        
+        # Persist real data and read today's calls back through the date index;
+        # sample data is never written to history
+        history = None if self.using_sample_data else self.get_history()
+        if history is not None:
+            with METRICS.timer('store'):
+                history.upsert(all_data)
+            with METRICS.timer('analytics'):
+                self.update_analytics(history)
+            with METRICS.timer('rollups'):
+                self.update_rollups(all_data)
+            with METRICS.timer('filter'):
+                today_data = history.records_for_date(self.get_today_date())
+            logger.info(f"Found {len(today_data)} target price records for today in history")
+        else:
+            with METRICS.timer('filter'):
+                today_data = latest_calls(self.filter_today_data(all_data))
+        METRICS.inc('records', len(today_data), kind='today')
+        
+        # Keep only calls that are new or revised since the last successful send to each
+        # destination; the sample is sent in full and never marked as published
+        published = None if self.using_sample_data else self.get_published_index()
+        deltas = None
+        if published is not None and today_data:
+            from delivery import load_destinations
+            with METRICS.timer('delta'):
+                deltas = {d.chat_id: published.diff(today_data, d.chat_id) for d in load_destinations(self.config)}
+                changed = {fingerprint(rec) for delta in deltas.values() for rec in delta.changed}
+                today_data = _select(today_data, changed)
+            if not today_data:
+                logger.info("No new or revised target prices since last run, nothing to send")
+                return 'unchanged', [], None, published
+        METRICS.inc('records', len(today_data), kind='changed')
+        
+        # The listing's prices are from when each call was published; bring them up to date
+        with METRICS.timer('quotes'):
+            today_data = self.refresh_quotes(today_data)
+        return None, today_data, deltas, published
+
+    def complete_run(self, deltas: Optional[Dict[str, DeltaResult]], published: Optional[PublishedIndex],
+                     results: List[DeliveryResult]) -> str:
+        """Mark sent calls as published and return the run outcome.
+
+        A destination's calls are marked once Telegram accepted its report, or once the
+        report is safe in the outbox, which delivers it on the next run's flush; marking
+        it there stops the next run from sending the same calls again. A chat whose send
+        failed, or that has no outbox to hold it, gets the calls on the next run.
+        """
+        delivered = sum(1 for r in results if r.delivered)
+        queued = sum(1 for r in results if r.ok and not r.delivered)
+        
+        if published is not None and deltas and (delivered or queued):
+            for result in results:
+                delta = deltas.get(result.destination.chat_id)
+                if delta is not None and self._accepted(result):
+                    published.mark_published(delta.changed, result.destination.chat_id, save=False)
+            published.save()
+        
+        if delivered:
+            if delivered < len(results):
+                logger.warning(f"Delivered to {delivered}/{len(results)} destinations")
+                return 'partial'
+            logger.info("Monitoring task completed successfully")
+            return 'ok'
+        if queued:
+            logger.warning(f"Telegram unreachable, report queued for {queued} destination(s)")
+            return 'queued'
+        logger.error("Monitoring task failed")
+        return 'failed'
+
+
+def _select(data_list: List[TargetPrice], fingerprints) -> List[TargetPrice]:
+    """Records whose fingerprint is in `fingerprints`, in order, each call once."""
+    selected, seen = [], set()
+    for rec in data_list:
+        fp = fingerprint(rec)
+        if fp in fingerprints and fp not in seen:
+            seen.add(fp)
+            selected.append(rec)
+    return selected
+
+
+def run_digest(monitor: KLSETargetPriceMonitor, args):
+    """Print or send a multi-day digest."""
+    from rollups import format_digest
+    days = {'week': 7, 'month': 30}.get(args.period, args.days)
+    digest = monitor.build_digest(days, args.end, args.limit)
+    title = {'week': 'Weekly digest', 'month': 'Monthly digest'}.get(args.period, f"{days}-day digest")
+    if not args.send:
+        print(format_digest(digest, title))
+        return
+    html = (monitor.message_cfg.get('parse_mode') or 'Markdown').upper() == 'HTML'
+    for part in split_blocks([(format_digest(digest, title, html=html), None)]):
+        if not monitor.send_to_telegram(part):
+            sys.exit(1)
+
+
+def run_rollup(monitor: KLSETargetPriceMonitor, args):
+    """Build stale daily rollups, or all of them with --rebuild."""
+    rollups = monitor.get_rollups()
+    if rollups is None:
+        sys.exit("Rollups need history.enabled")
+    built = rollups.rebuild() if args.rebuild else rollups.build_missing()
+    print(f"Rolled up {built} day(s)")
+
+
+def run_query(monitor: KLSETargetPriceMonitor, args):
+    """Print one stock's or analyst's activity from the rollups, with the calls behind it."""
+    rollups = monitor.get_rollups()
+    history = monitor.get_history()
+    if rollups is None or history is None:
+        sys.exit("Queries need history.enabled")
+    end = args.end or monitor.get_today_date()
+    start = (datetime.date.fromisoformat(end) - datetime.timedelta(days=args.days - 1)).isoformat()
+    rollups.build_missing(start, end)
+    if args.stock:
+        code = args.stock.upper()
+        print(f"{code}: {start} to {end}")
+        print(f"{'Date':10} {'Calls':>5} {'Anl':>4} {'Buy':>4} {'Hold':>4} {'Sell':>4} {'Up':>3} {'Dn':>3} "
+              f"{'AvgTgt':>8} {'MaxUp%':>7}")
+        for date, calls, analysts, buys, holds, sells, raises, cuts, mean, upside in rollups.stock_days(code, start, end):
+            upside_text = f"{upside:7.1f}" if upside is not None else f"{'N/A':>7}"
+            print(f"{date:10} {calls:5} {analysts:4} {buys:4} {holds:4} {sells:4} {raises:3} {cuts:3} "
+                  f"{mean or 0:8.3f} {upside_text}")
+        revisions = rollups.revisions(start, end, stock_code=code)
+        calls = history.query(start, end, stock_code=code) if args.calls else []
+    else:
+        print(f"{args.analyst}: {start} to {end}")
+        print(f"{'Date':10} {'Calls':>5} {'Stk':>4} {'Buy':>4} {'Hold':>4} {'Sell':>4} {'Up':>3} {'Dn':>3}")
+        for date, calls, stocks, buys, holds, sells, raises, cuts in rollups.analyst_days(args.analyst, start, end):
+            print(f"{date:10} {calls:5} {stocks:4} {buys:4} {holds:4} {sells:4} {raises:3} {cuts:3}")
+        revisions = rollups.revisions(start, end, analyst=args.analyst)
+        calls = history.query(start, end, analyst=args.analyst) if args.calls else []
+    if revisions:
+        print("\nRevisions:")
+        for date, code, analyst, prev, target, pct, prev_call, call in revisions:
+            change = f"{prev:.2f} -> {target:.2f} ({pct:+.1f}%)" if pct is not None else f"{target or 0:.2f}"
+            calls_text = f"  {prev_call} -> {call}" if prev_call != call else ''
+            print(f"  {date} {code:8} {analyst:16} {change}{calls_text}")
+    if calls:
+        print("\nCalls:")
+        for rec in calls:
+            print(f"  {rec.date} {rec.stock_code:8} {rec.get('analyst', 'N/A'):16} "
+                  f"{rec.get('current_price', 'N/A'):>7} -> {rec.target_price:>7} {rec.get('price_call', '')}")
 
 
 def main():
     """Main function."""
-    monitor = KLSETargetPriceMonitor()
-    monitor.run_monitor()
+    parser = argparse.ArgumentParser(description="KLSE Target Price Monitor")
+    parser.add_argument('--config', default='config.json', help="Path to the configuration file")
+    parser.add_argument('--daemon', action='store_true',
+                        help="Stay running and follow the schedule in the config file")
+    commands = parser.add_subparsers(dest='command')
+
+    digest = commands.add_parser('digest', help="Multi-day digest from the daily rollups")
+    digest.add_argument('--period', choices=['week', 'month'], help="Last 7 or 30 days")
+    digest.add_argument('--days', type=int, default=7, help="Days to cover, ending on --end")
+    digest.add_argument('--end', help="Last day (YYYY-MM-DD), defaults to today")
+    digest.add_argument('--limit', type=int, default=10, help="Rows per section")
+    digest.add_argument('--send', action='store_true', help="Send to the Telegram channel instead of printing")
+
+    query = commands.add_parser('query', help="One stock's or analyst's activity")
+    target = query.add_mutually_exclusive_group(required=True)
+    target.add_argument('--stock', help="Stock code")
+    target.add_argument('--analyst', help="Analyst name as stored")
+    query.add_argument('--days', type=int, default=30, help="Days to cover, ending on --end")
+    query.add_argument('--end', help="Last day (YYYY-MM-DD), defaults to today")
+    query.add_argument('--calls', action='store_true', help="Also list the individual calls")
+
+    rollup = commands.add_parser('rollup', help="Build missing daily rollups")
+    rollup.add_argument('--rebuild', action='store_true', help="Rebuild every day, not just stale ones")
+    args = parser.parse_args()
+
+    monitor = KLSETargetPriceMonitor(args.config)
+    if args.command:
+        try:
+            if args.command == 'digest':
+                run_digest(monitor, args)
+            elif args.command == 'query':
+                run_query(monitor, args)
+            else:
+                run_rollup(monitor, args)
+        finally:
+            monitor.close()
+    elif args.daemon:
+        MonitorDaemon(monitor, args.config).run_forever()
+    else:
+        monitor.run_monitor()
+        monitor.close()
 
 
 if __name__ == "__main__":
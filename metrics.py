@@ -0,0 +1,303 @@
+"""
+Run metrics for KLSE Target Price Monitor
+Stage timers, counters and a Telegram latency histogram, exported as a Prometheus
+textfile-collector file and an optional JSON log line per run.
+
+Author: cming401
+License: MIT
+"""
+
+import bisect
+import contextlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PREFIX = 'klse_monitor_'
+DEFAULT_TEXTFILE = 'klse_monitor.prom'
+# Telegram round trips: most land well under a second, 429 waits are not included
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+COUNTER_HELP = {
+    'records': "Target price records seen by the monitor, by kind.",
+    'alerts': "Alert rule matches sent to subscribers.",
+    'scraper_requests': "Listing pages requested.",
+    'scraper_not_modified': "Listing pages answered 304 Not Modified from the page cache.",
+    'bytes_received': "Listing page bytes downloaded.",
+    'quote_requests': "Quote provider requests made.",
+    'quote_cache_hits': "Stock codes priced from the quote cache.",
+    'quotes_fetched': "Stock codes priced by the quote provider.",
+    'quote_bytes_received': "Quote response bytes downloaded.",
+    'charts_rendered': "Chart images drawn.",
+    'chart_cache_hits': "Chart images reused from the chart cache.",
+    'telegram_sent': "Telegram requests accepted by the Bot API.",
+    'telegram_retries': "Telegram requests retried after a network or server error.",
+    'telegram_rate_limited': "Telegram requests answered 429 Too Many Requests.",
+    'telegram_bytes_sent': "Telegram request body bytes sent, retries included.",
+}
+HISTOGRAM_HELP = {
+    'telegram_request_seconds': "Telegram Bot API round trip time.",
+}
+
+# Labelled counter key: name plus sorted (label, value) pairs
+Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+_NULL_TIMER = contextlib.nullcontext()
+
+
+class _Histogram:
+    """Fixed-bucket histogram; bucket counts are per bucket, made cumulative on export."""
+
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * len(bounds)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.bounds, value)
+        if i < len(self.counts):
+            self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _Timer:
+    """Adds the time spent inside the block to a stage."""
+
+    __slots__ = ('metrics', 'stage', 'started')
+
+    def __init__(self, metrics: 'Metrics', stage: str):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.add_time(self.stage, time.perf_counter() - self.started)
+        return False
+
+
+class Metrics:
+    """Process-wide metrics registry.
+
+    Every recording method returns straight away while `enabled` is False, so
+    instrumented code pays one attribute check when metrics are off. Counters and
+    the histogram accumulate for the life of the process, as Prometheus expects;
+    stage times cover the current run only. Stages timed on worker threads
+    (download, parse) are summed across workers and can exceed the wall time.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.textfile_path: Optional[str] = None
+        self.json_log = False
+        self._lock = threading.Lock()
+        self.reset()
+
+    def configure(self, metrics_cfg: dict):
+        """Apply the `metrics` config section."""
+        self.enabled = bool(metrics_cfg.get('enabled', False))
+        self.textfile_path = metrics_cfg.get('textfile_path', DEFAULT_TEXTFILE) or None
+        self.json_log = bool(metrics_cfg.get('json_log', False))
+
+    def reset(self):
+        """Forget everything recorded so far."""
+        with self._lock:
+            self.counters: Dict[Key, float] = {}
+            self.histograms: Dict[str, _Histogram] = {}
+            self.stages: Dict[str, float] = {}
+            self._run_started: Optional[float] = None
+            self._run_baseline: Dict[Key, float] = {}
+            self.last_run: Optional[Dict] = None
+
+    # Recording
+
+    def inc(self, name: str, value: float = 1, **labels: str):
+        """Add to a counter."""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        """Record one histogram observation."""
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = _Histogram(buckets)
+            histogram.observe(value)
+
+    def add_time(self, stage: str, seconds: float):
+        """Add seconds to a stage of the current run."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def timer(self, stage: str):
+        """Context manager timing its block into `stage`."""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, stage)
+
+    def parse_stream(self, parse: Callable[[Iterable[bytes]], Iterable], chunks: Iterable[bytes]) -> List:
+        """Run `parse` over streamed chunks, splitting its time into download (waiting
+        for the next chunk) and parse (everything else), and counting bytes received."""
+        if not self.enabled:
+            return list(parse(chunks))
+        waited = 0.0
+        received = 0
+
+        def metered() -> Iterator[bytes]:
+            nonlocal waited, received
+            source = iter(chunks)
+            while True:
+                started = time.perf_counter()
+                chunk = next(source, None)
+                waited += time.perf_counter() - started
+                if chunk is None:
+                    return
+                received += len(chunk)
+                yield chunk
+
+        started = time.perf_counter()
+        items = list(parse(metered()))
+        total = time.perf_counter() - started
+        self.add_time('download', waited)
+        self.add_time('parse', total - waited)
+        self.inc('bytes_received', received)
+        return items
+
+    # Runs
+
+    def start_run(self):
+        """Mark the start of a monitoring run: stage times restart, counters keep going."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.stages = {}
+            self._run_started = time.perf_counter()
+            self._run_baseline = dict(self.counters)
+
+    def finish_run(self, outcome: str):
+        """Close the run: write the textfile and log the JSON line when configured."""
+        if not self.enabled or self._run_started is None:
+            return
+        with self._lock:
+            duration = time.perf_counter() - self._run_started
+            self._run_started = None
+            self.last_run = {
+                'timestamp': round(time.time(), 3),
+                'outcome': outcome,
+                'duration_seconds': round(duration, 4),
+                'stages': {stage: round(seconds, 4) for stage, seconds in self.stages.items()},
+                'counters': {
+                    _flat_name(key): value - self._run_baseline.get(key, 0)
+                    for key, value in sorted(self.counters.items())
+                    if value != self._run_baseline.get(key, 0)
+                },
+            }
+        if self.textfile_path:
+            try:
+                self.write_textfile(self.textfile_path)
+            except OSError as e:
+                logger.error(f"Failed to write metrics to {self.textfile_path}: {e}")
+        if self.json_log:
+            logger.info(json.dumps(self.last_run, separators=(',', ':')))
+
+    # Export
+
+    def render_prometheus(self) -> str:
+        """Everything recorded, in the Prometheus text exposition format."""
+        lines: List[str] = []
+        with self._lock:
+            by_name: Dict[str, List[Tuple[Tuple, float]]] = {}
+            for (name, labels), value in sorted(self.counters.items()):
+                by_name.setdefault(name, []).append((labels, value))
+            for name, samples in by_name.items():
+                metric = f"{PREFIX}{name}_total"
+                lines.append(f"# HELP {metric} {COUNTER_HELP.get(name, name.replace('_', ' ') + '.')}")
+                lines.append(f"# TYPE {metric} counter")
+                lines.extend(f"{metric}{_labels(labels)} {_number(value)}" for labels, value in samples)
+
+            for name, histogram in sorted(self.histograms.items()):
+                metric = PREFIX + name
+                lines.append(f"# HELP {metric} {HISTOGRAM_HELP.get(name, name.replace('_', ' ') + '.')}")
+                lines.append(f"# TYPE {metric} histogram")
+                cumulative = 0
+                for bound, count in zip(histogram.bounds, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{le="{_number(bound)}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{le="+Inf"}} {histogram.count}')
+                lines.append(f"{metric}_sum {_number(histogram.sum)}")
+                lines.append(f"{metric}_count {histogram.count}")
+
+            if self.stages:
+                metric = PREFIX + 'stage_seconds'
+                lines.append(f"# HELP {metric} Time spent in each stage of the last run.")
+                lines.append(f"# TYPE {metric} gauge")
+                lines.extend(f'{metric}{{stage="{stage}"}} {_number(seconds)}'
+                             for stage, seconds in sorted(self.stages.items()))
+
+            run = self.last_run
+            if run is not None:
+                lines.append(f"# HELP {PREFIX}last_run_timestamp_seconds Unix time the last run finished.")
+                lines.append(f"# TYPE {PREFIX}last_run_timestamp_seconds gauge")
+                lines.append(f"{PREFIX}last_run_timestamp_seconds {_number(run['timestamp'])}")
+                lines.append(f"# HELP {PREFIX}last_run_duration_seconds Wall time of the last run.")
+                lines.append(f"# TYPE {PREFIX}last_run_duration_seconds gauge")
+                lines.append(f"{PREFIX}last_run_duration_seconds {_number(run['duration_seconds'])}")
+                lines.append(f"# HELP {PREFIX}last_run_success Whether the last run finished without failing.")
+                lines.append(f"# TYPE {PREFIX}last_run_success gauge")
+                success = 0 if run['outcome'] in ('failed', 'error') else 1
+                lines.append(f'{PREFIX}last_run_success{{outcome="{run["outcome"]}"}} {success}')
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path: str):
+        """Write the exposition atomically, so the collector never reads a half-written file."""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.metrics-', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(self.render_prometheus())
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+
+def _labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _flat_name(key: Key) -> str:
+    """A counter key as one JSON field name, e.g. records{kind=fetched} -> records.fetched."""
+    name, labels = key
+    return '.'.join([name] + [str(value) for _, value in labels])
+
+
+METRICS = Metrics()
@@ -0,0 +1,173 @@
+"""
+Data model for KLSE Target Price Monitor
+A compact, typed target price record parsed once at ingestion.
+
+Author: cming401
+License: MIT
+"""
+
+from collections.abc import Mapping
+from dataclasses import dataclass
+from enum import Enum
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+# Keys of the dict shape produced by the scraper and update_data.py
+RECORD_KEYS = (
+    'date', 'stock_code', 'stock_name', 'current_price', 'target_price',
+    'upside_downside', 'price_call', 'analyst',
+)
+
+
+class PriceCall(str, Enum):
+    BUY = 'BUY'
+    HOLD = 'HOLD'
+    SELL = 'SELL'
+
+    @classmethod
+    def parse(cls, text: Optional[str]) -> Optional['PriceCall']:
+        """Map a recommendation string to a PriceCall, or None if unrecognised."""
+        try:
+            return cls((text or '').strip().upper())
+        except ValueError:
+            return None
+
+
+CALL_EMOJI = {PriceCall.BUY: '🟢', PriceCall.HOLD: '🟡', PriceCall.SELL: '🔴'}
+CALL_ENGLISH = {PriceCall.BUY: 'Buy', PriceCall.HOLD: 'Hold', PriceCall.SELL: 'Sell'}
+TREND_EMOJI = {1: '📈', -1: '📉', 0: '➡️'}
+
+
+def parse_price(text: Optional[str]) -> Optional[float]:
+    """Parse a price like '9.71' or 'RM1,234.50' into a float."""
+    if not text:
+        return None
+    try:
+        return float(str(text).replace('RM', '').replace(',', '').strip())
+    except ValueError:
+        return None
+
+
+def format_price(price: float) -> str:
+    """A price as the listing shows it: two decimals, three for half-sen steps like '0.455'."""
+    text = f"{price:.3f}"
+    return text[:-1] if text.endswith('0') else text
+
+
+def parse_upside(text: Optional[str]) -> Tuple[Optional[float], Optional[float]]:
+    """Split an upside string like '+0.29 (20.71%)' into (change, percent)."""
+    if not text:
+        return None, None
+    change: Optional[float] = None
+    pct: Optional[float] = None
+    head = text.split('(')[0].strip()
+    if head:
+        try:
+            change = float(head)
+        except ValueError:
+            pass
+    if '(' in text and '%' in text:
+        try:
+            pct = float(text.split('(')[1].split('%')[0])
+        except (ValueError, IndexError):
+            pass
+    return change, pct
+
+
+def trend_direction(text: Optional[str]) -> int:
+    """1 for an upside string containing '+', -1 for '-', else 0."""
+    text = text or ''
+    if '+' in text:
+        return 1
+    if '-' in text:
+        return -1
+    return 0
+
+
+@dataclass(frozen=True)
+class TargetPrice(Mapping):
+    """One analyst target price call.
+
+    The original strings are kept under the dict keys so the record can be read like
+    the dicts it replaces (`rec['upside_downside']`, `rec.get('analyst', 'N/A')`), while
+    the numeric fields are parsed once when the record is built.
+    """
+
+    __slots__ = (
+        'date', 'stock_code', 'stock_name', 'current_price', 'target_price',
+        'upside_downside', 'price_call', 'analyst',
+        'current', 'target', 'change', 'upside_pct', 'call', 'direction',
+    )
+
+    date: Optional[str]
+    stock_code: Optional[str]
+    stock_name: Optional[str]
+    current_price: Optional[str]
+    target_price: Optional[str]
+    upside_downside: Optional[str]
+    price_call: Optional[str]
+    analyst: Optional[str]
+    current: Optional[float]
+    target: Optional[float]
+    change: Optional[float]
+    upside_pct: Optional[float]
+    call: Optional[PriceCall]
+    direction: int
+
+    @classmethod
+    def from_dict(cls, item: Dict) -> 'TargetPrice':
+        """Build a record from the dict shape, parsing numbers and the call once."""
+        upside = item.get('upside_downside')
+        change, pct = parse_upside(upside)
+        return cls(
+            date=item.get('date'),
+            stock_code=item.get('stock_code'),
+            stock_name=item.get('stock_name'),
+            current_price=item.get('current_price'),
+            target_price=item.get('target_price'),
+            upside_downside=upside,
+            price_call=item.get('price_call'),
+            analyst=item.get('analyst'),
+            current=parse_price(item.get('current_price')),
+            target=parse_price(item.get('target_price')),
+            change=change,
+            upside_pct=pct,
+            call=PriceCall.parse(item.get('price_call')),
+            direction=trend_direction(upside),
+        )
+
+    @classmethod
+    def coerce(cls, item: Union['TargetPrice', Dict]) -> 'TargetPrice':
+        """Return `item` as a TargetPrice, converting dicts."""
+        return item if isinstance(item, cls) else cls.from_dict(item)
+
+    def with_current_price(self, price: float) -> 'TargetPrice':
+        """A copy at a new current price, with the upside recomputed against the target."""
+        item = self.to_dict()
+        item['current_price'] = format_price(price)
+        if self.target is not None and price > 0:
+            diff = self.target - price
+            item['upside_downside'] = f"{diff:+.2f} ({diff / price * 100:.2f}%)"
+        return TargetPrice.from_dict(item)
+
+    def to_dict(self) -> Dict[str, Optional[str]]:
+        """Return the plain dict shape, omitting keys that were absent."""
+        return {key: getattr(self, key) for key in RECORD_KEYS if getattr(self, key) is not None}
+
+    # Mapping interface over the original dict keys; absent keys behave like missing dict keys
+    def __getitem__(self, key: str):
+        if key in RECORD_KEYS:
+            value = getattr(self, key)
+            if value is not None:
+                return value
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return (key for key in RECORD_KEYS if getattr(self, key) is not None)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+
+def to_records(items: Iterable[Union[TargetPrice, Dict]]) -> List[TargetPrice]:
+    """Convert an iterable of dicts or records into records."""
+    return [TargetPrice.coerce(item) for item in items]
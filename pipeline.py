@@ -0,0 +1,198 @@
+"""
+Async pipeline for KLSE Target Price Monitor
+Runs a monitoring pass as asyncio stages joined by bounded queues: concurrent page
+downloads, parsing on an executor pool, and concurrent sends.
+
+Author: cming401
+License: MIT
+"""
+
+import asyncio
+import functools
+import logging
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Awaitable, Callable, Dict, Iterator, List, Optional
+
+from delivery import DeliveryResult, FanOut, Job
+from metrics import METRICS
+from scraper import TargetPriceScraper, parse_listing
+from sources import DataSource, ScraperSource
+
+if TYPE_CHECKING:
+    from klse_monitor import KLSETargetPriceMonitor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_SIZE = 8
+PARSE_EXECUTORS = ('thread', 'process')
+
+# Queue sentinel telling a consumer its producers are finished
+_DONE = object()
+
+
+class AsyncPipeline:
+    """One monitoring run as asyncio stages with backpressure.
+
+    Stages hand items over through queues of `queue_size` slots. When parsing falls
+    behind, downloaders wait for a free slot instead of piling page bodies up in
+    memory; when Telegram is slow, rendering waits for the send queue to drain.
+    Blocking work (HTTP, SQLite, rendering) runs on a thread pool and parsing on a
+    thread or process pool, so the event loop only moves items between stages.
+
+    The monitor's own steps do the storing, filtering and rendering, so the records,
+    the messages and their order within each chat are those of the sync run.
+    """
+
+    def __init__(self, monitor: 'KLSETargetPriceMonitor', pipeline_cfg: Optional[dict] = None):
+        cfg = pipeline_cfg or {}
+        self.monitor = monitor
+        self.queue_size = max(1, int(cfg.get('queue_size', DEFAULT_QUEUE_SIZE)))
+        self.parse_workers = max(1, int(cfg.get('parse_workers', 2)))
+        self.parse_executor = cfg.get('parse_executor', 'thread')
+        if self.parse_executor not in PARSE_EXECUTORS:
+            raise ValueError(f"pipeline.parse_executor must be one of {', '.join(PARSE_EXECUTORS)}, "
+                             f"got {self.parse_executor!r}")
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.io: Optional[Executor] = None
+        self.cpu: Optional[Executor] = None
+
+    def run(self) -> str:
+        """Run one monitoring pass on a fresh event loop; returns the run outcome."""
+        return asyncio.run(self._run())
+
+    async def _run(self) -> str:
+        monitor = self.monitor
+        fanout = monitor.get_fanout()
+        self.loop = asyncio.get_running_loop()
+        # Downloads and sends each get their full worker count, plus the thread running the fetch step
+        download_workers = int(monitor.source_cfg.get('max_workers', 4) or 4)
+        self.io = ThreadPoolExecutor(max_workers=download_workers + fanout.max_workers + 2,
+                                     thread_name_prefix='pipeline-io')
+        if self.parse_executor == 'process':
+            self.cpu = ProcessPoolExecutor(max_workers=self.parse_workers)
+        else:
+            self.cpu = ThreadPoolExecutor(max_workers=self.parse_workers, thread_name_prefix='pipeline-parse')
+        try:
+            if not await self._blocking(monitor.begin_run):
+                return 'skipped'
+
+            with METRICS.timer('fetch'):
+                all_data = await self._blocking(monitor.fetch_target_prices, self._fetch_from)
+
+            outcome, today_data, deltas, published = await self._blocking(monitor.select_calls, all_data)
+            if outcome is not None:
+                return outcome
+
+            # Alerts finish before the report starts, keeping each chat's messages in sync-run order
+            with METRICS.timer('alerts'):
+                chat_matches = await self._blocking(monitor.alert_matches, today_data)
+                alert_jobs = await self._blocking(monitor.alert_jobs, chat_matches)
+                if alert_jobs:
+                    alert_results = await self._send(fanout, iter(alert_jobs))
+                    await self._blocking(monitor.complete_alerts, chat_matches, alert_results)
+
+            with METRICS.timer('deliver'):
+                results = await self._send(fanout, monitor.report_jobs(today_data, deltas))
+            return await self._blocking(monitor.complete_run, deltas, published, results)
+        finally:
+            self.io.shutdown(wait=True)
+            self.cpu.shutdown(wait=True)
+
+    def _blocking(self, func: Callable, *args) -> Awaitable:
+        """Run a blocking call on the I/O pool."""
+        return self.loop.run_in_executor(self.io, functools.partial(func, *args))
+
+    async def _drain(self, producers: List[Awaitable], consumers: List[Awaitable], queue: asyncio.Queue):
+        """Run producers and consumers of one queue to completion.
+
+        Consumers are told to stop once every producer is done. The first failure in
+        either stage cancels the rest, so a producer blocked on a full queue never
+        waits on consumers that have died.
+        """
+        producer_tasks = [asyncio.ensure_future(p) for p in producers]
+        consumer_tasks = [asyncio.ensure_future(c) for c in consumers]
+
+        async def close():
+            await asyncio.gather(*producer_tasks)
+            for _ in consumer_tasks:
+                await queue.put(_DONE)
+
+        closer = asyncio.ensure_future(close())
+        tasks = [closer, *producer_tasks, *consumer_tasks]
+        try:
+            done, _ = await asyncio.wait([closer, *consumer_tasks], return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _fetch_from(self, source: DataSource) -> List[Dict]:
+        """Fetch step for monitor.fetch_target_prices, called on an I/O thread: listing pages go
+        through the async stages, other sources are read as in a sync run."""
+        if isinstance(source, ScraperSource):
+            return asyncio.run_coroutine_threadsafe(self._scrape(source.scraper), self.loop).result()
+        return source.fetch(self.monitor.get_today_date())
+
+    async def _scrape(self, scraper: TargetPriceScraper) -> List[Dict]:
+        """Download the latest pages concurrently and parse them on the parse pool; records
+        come back in page order, as from scraper.fetch_latest()."""
+        params = scraper.latest_params()
+        todo: asyncio.Queue = asyncio.Queue()
+        for item in enumerate(params):
+            todo.put_nowait(item)
+        downloaded: asyncio.Queue = asyncio.Queue(self.queue_size)
+        pages: Dict[int, List[Dict]] = {}
+
+        async def download():
+            while not todo.empty():
+                i, page_params = todo.get_nowait()
+                page = await self._blocking(scraper.download_page, page_params)
+                await downloaded.put((i, page))
+
+        async def parse():
+            while True:
+                item = await downloaded.get()
+                if item is _DONE:
+                    return
+                i, page = item
+                records = page.records
+                if records is None:
+                    with METRICS.timer('parse'):
+                        records = await self.loop.run_in_executor(self.cpu, parse_listing, page.body, page.encoding)
+                    await self._blocking(scraper.store_page, page, records)
+                pages[i] = records
+
+        await self._drain([download() for _ in range(min(scraper.max_workers, len(params)))],
+                          [parse() for _ in range(self.parse_workers)], downloaded)
+        scraper.finish(len(params))
+        return [record for i in range(len(params)) for record in pages[i]]
+
+    async def _send(self, fanout: FanOut, jobs: Iterator[Job]) -> List[DeliveryResult]:
+        """Send jobs on the fan-out's worker count, pulling the next job (rendering it if
+        needed) only when the send queue has room; results in job order."""
+        queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        results: Dict[int, DeliveryResult] = {}
+
+        async def produce():
+            i = 0
+            while True:
+                job = await self._blocking(next, jobs, None)
+                if job is None:
+                    return
+                await queue.put((i, job))
+                i += 1
+
+        async def consume():
+            while True:
+                item = await queue.get()
+                if item is _DONE:
+                    return
+                i, job = item
+                results[i] = await self._blocking(fanout.send_one, *job)
+
+        await self._drain([produce()], [consume() for _ in range(fanout.max_workers)], queue)
+        ordered = [results[i] for i in sorted(results)]
+        FanOut.log_results(ordered)
+        return ordered
@@ -0,0 +1,281 @@
+"""
+Live quotes for KLSE Target Price Monitor
+Refreshes current prices through a pluggable quote provider with batched lookups
+and a TTL cache kept in memory and on disk.
+
+Author: cming401
+License: MIT
+"""
+
+import argparse
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import requests
+
+from metrics import METRICS
+from models import TargetPrice
+from scraper import HostRateLimiter, build_session
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE = '.cache/quotes.json'
+DEFAULT_TTL = 300
+
+
+class QuoteProvider:
+    """Somewhere last traded prices come from, many stock codes per request."""
+
+    name = 'provider'
+    # Most codes a single request may ask for
+    max_batch = 50
+
+    def fetch(self, codes: List[str]) -> Dict[str, float]:
+        """Prices for as many of `codes` as the provider knows; unknown codes are left out."""
+        raise NotImplementedError
+
+    def close(self):
+        """Release anything the provider holds open."""
+
+
+class StubQuoteProvider(QuoteProvider):
+    """Offline provider answering from a fixed price table.
+
+    Prices come from `prices` and, when given, a JSON file of {code: price} at
+    `prices_path`. Every call to fetch() is recorded in `requests` so batching can be
+    checked without a network, and `latency` seconds are slept per request.
+    """
+
+    name = 'stub'
+
+    def __init__(self, stub_cfg: Optional[dict] = None):
+        cfg = stub_cfg or {}
+        self.max_batch = int(cfg.get('batch_size', self.max_batch))
+        self.latency = float(cfg.get('latency', 0))
+        self.prices: Dict[str, float] = {}
+        if cfg.get('prices_path'):
+            with open(cfg['prices_path'], 'r', encoding='utf-8') as f:
+                self.prices.update(json.load(f))
+        self.prices.update(cfg.get('prices', {}))
+        self.prices = {code.upper(): float(price) for code, price in self.prices.items()}
+        self.requests: List[List[str]] = []
+        self._lock = threading.Lock()
+
+    def fetch(self, codes: List[str]) -> Dict[str, float]:
+        with self._lock:
+            self.requests.append(list(codes))
+        if self.latency:
+            time.sleep(self.latency)
+        return {code: self.prices[code] for code in codes if code in self.prices}
+
+
+class HttpQuoteProvider(QuoteProvider):
+    """A JSON quote endpoint taking a comma-separated symbol list.
+
+    The request is `url?<symbol_param>=S1,S2,...`; the reply's list of quotes is found
+    by following the dotted `result_path`, and each quote gives its symbol and price
+    under `symbol_field` and `price_field`. `symbols` maps stock codes to the
+    provider's symbols, e.g. {"MAYBANK": "1155.KL"}; unmapped codes are sent as is.
+    """
+
+    name = 'http'
+
+    def __init__(self, http_cfg: dict, session: Optional[requests.Session] = None):
+        if not http_cfg.get('url'):
+            raise ValueError("quotes.http.url is required")
+        self.url = http_cfg['url']
+        self.symbol_param = http_cfg.get('symbol_param', 'symbols')
+        self.result_path = [key for key in http_cfg.get('result_path', '').split('.') if key]
+        self.symbol_field = http_cfg.get('symbol_field', 'symbol')
+        self.price_field = http_cfg.get('price_field', 'price')
+        self.symbols = {code.upper(): symbol for code, symbol in http_cfg.get('symbols', {}).items()}
+        self.max_batch = int(http_cfg.get('batch_size', self.max_batch))
+        self.timeout = float(http_cfg.get('timeout', 10))
+        self.limiter = HostRateLimiter(float(http_cfg.get('requests_per_second', 2) or 0))
+        self.session = session or build_session(int(http_cfg.get('max_workers', 4)))
+
+    def fetch(self, codes: List[str]) -> Dict[str, float]:
+        codes_by_symbol = {self.symbols.get(code, code): code for code in codes}
+        self.limiter.wait(self.url)
+        response = self.session.get(self.url, params={self.symbol_param: ','.join(codes_by_symbol)},
+                                    timeout=self.timeout)
+        response.raise_for_status()
+        METRICS.inc('quote_bytes_received', len(response.content))
+        result = response.json()
+        for key in self.result_path:
+            result = result[key]
+
+        prices = {}
+        for quote in result:
+            code = codes_by_symbol.get(quote.get(self.symbol_field))
+            try:
+                price = float(quote.get(self.price_field))
+            except (TypeError, ValueError):
+                continue
+            if code is not None and price > 0:
+                prices[code] = price
+        return prices
+
+    def close(self):
+        self.session.close()
+
+
+class QuoteCache:
+    """Prices by stock code with the time they were fetched, persisted to one JSON file.
+
+    Lookups are served from memory; the file is read once and rewritten atomically
+    after a refresh adds prices, so quotes survive between cron runs. Entries older
+    than the TTL are misses and are dropped on save.
+    """
+
+    def __init__(self, path: Optional[str] = DEFAULT_CACHE, ttl: float = DEFAULT_TTL):
+        self.path = path
+        self.ttl = float(ttl)
+        self.entries: Dict[str, Tuple[float, float]] = {}
+        self.dirty = False
+        if path:
+            self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = {code: (float(price), float(at)) for code, (price, at) in json.load(f).items()}
+        except FileNotFoundError:
+            self.entries = {}
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable quote cache {self.path}: {e}")
+            self.entries = {}
+
+    def save(self):
+        if not self.path or not self.dirty:
+            return
+        now = time.time()
+        fresh = {code: entry for code, entry in self.entries.items() if now - entry[1] <= self.ttl}
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(fresh, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not write quote cache {self.path}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+        self.dirty = False
+
+    def lookup(self, codes: Iterable[str], now: Optional[float] = None) -> Tuple[Dict[str, float], List[str]]:
+        """Split `codes` into fresh cached prices and the codes still to fetch."""
+        now = time.time() if now is None else now
+        hits, missing = {}, []
+        for code in codes:
+            entry = self.entries.get(code)
+            if entry is not None and now - entry[1] <= self.ttl:
+                hits[code] = entry[0]
+            else:
+                missing.append(code)
+        return hits, missing
+
+    def update(self, prices: Dict[str, float], now: Optional[float] = None):
+        now = time.time() if now is None else now
+        for code, price in prices.items():
+            self.entries[code] = (price, now)
+        if prices:
+            self.dirty = True
+
+
+class QuoteRefresher:
+    """Replaces each record's current price with a live quote and recomputes its upside."""
+
+    def __init__(self, provider: QuoteProvider, cache: QuoteCache, max_workers: int = 4):
+        self.provider = provider
+        self.cache = cache
+        self.max_workers = max(1, max_workers)
+
+    @classmethod
+    def from_config(cls, quotes_cfg: dict) -> 'QuoteRefresher':
+        """Build the refresher from the `quotes` config section."""
+        kind = quotes_cfg.get('provider', 'stub')
+        if kind == 'stub':
+            provider: QuoteProvider = StubQuoteProvider(quotes_cfg.get('stub'))
+        elif kind == 'http':
+            provider = HttpQuoteProvider(quotes_cfg.get('http', {}))
+        else:
+            raise ValueError(f"Unknown quotes.provider {kind!r}")
+        cache = QuoteCache(quotes_cfg.get('cache_path', DEFAULT_CACHE), quotes_cfg.get('ttl_seconds', DEFAULT_TTL))
+        return cls(provider, cache, int(quotes_cfg.get('max_workers', 4)))
+
+    def quotes(self, codes: Iterable[str]) -> Dict[str, float]:
+        """Prices for the distinct `codes`: cached ones first, the rest in as few batches as
+        the provider allows, fetched concurrently. A failed batch is logged and left out."""
+        wanted = sorted({code.upper() for code in codes if code})
+        prices, missing = self.cache.lookup(wanted)
+        METRICS.inc('quote_cache_hits', len(prices))
+        if not missing:
+            return prices
+
+        size = max(1, self.provider.max_batch)
+        batches = [missing[i:i + size] for i in range(0, len(missing), size)]
+
+        def fetch(batch: List[str]) -> Dict[str, float]:
+            METRICS.inc('quote_requests')
+            try:
+                return self.provider.fetch(batch)
+            except (requests.RequestException, ValueError, KeyError, TypeError) as e:
+                logger.error(f"Quote request for {len(batch)} codes failed: {e}")
+                return {}
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as pool:
+            fetched: Dict[str, float] = {}
+            for result in pool.map(fetch, batches):
+                fetched.update(result)
+        self.cache.update(fetched)
+        self.cache.save()
+        METRICS.inc('quotes_fetched', len(fetched))
+        logger.info(f"Quotes: {len(prices)} cached, {len(fetched)}/{len(missing)} fetched "
+                    f"in {len(batches)} request(s)")
+        prices.update(fetched)
+        return prices
+
+    def refresh(self, records: List[TargetPrice]) -> List[TargetPrice]:
+        """Records with live current prices; those without a quote are returned unchanged."""
+        prices = self.quotes(rec.stock_code for rec in records)
+        refreshed = []
+        for rec in records:
+            price = prices.get((rec.stock_code or '').upper())
+            refreshed.append(rec if price is None else rec.with_current_price(price))
+        return refreshed
+
+    def close(self):
+        self.cache.save()
+        self.provider.close()
+
+
+def main():
+    """Print quotes for the given stock codes through the configured provider."""
+    parser = argparse.ArgumentParser(description="Look up live quotes for KLSE stock codes")
+    parser.add_argument('codes', nargs='+', help="Stock codes, e.g. MAYBANK GAMUDA")
+    parser.add_argument('--config', default='config.json', help="Config file with a quotes section")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    with open(args.config, 'r', encoding='utf-8') as f:
+        refresher = QuoteRefresher.from_config(json.load(f).get('quotes', {}))
+    try:
+        prices = refresher.quotes(args.codes)
+    finally:
+        refresher.close()
+    for code in sorted({code.upper() for code in args.codes}):
+        print(f"{code:10} {('RM%.3f' % prices[code]) if code in prices else 'no quote'}")
+
+
+if __name__ == "__main__":
+    main()
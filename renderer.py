@@ -0,0 +1,242 @@
+"""
+Message renderer for KLSE Target Price Monitor
+Compiled Markdown/HTML layouts with a cache of rendered per-stock fragments.
+
+Author: cming401
+License: MIT
+"""
+
+from collections import OrderedDict
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from chunking import Block
+from delta import CallKey, Revision, call_key
+from metrics import METRICS
+from models import CALL_EMOJI, CALL_ENGLISH, TREND_EMOJI, PriceCall, TargetPrice
+
+if TYPE_CHECKING:
+    from columnar import RecordBatch
+
+SOURCE_URL = "https://klse.i3investor.com/web/pricetarget/latest"
+
+# Layouts, compiled once into bound str.format methods
+MD_EMPTY = "📊 KLSE Target Price Update\n🗓️ Date: {date}\n\nNo new target prices available".format
+MD_HEADER = "📊 KLSE Target Price Update\n🗓️ Date: {date}\n\n".format
+MD_STOCK = "{emoji} {code} - {name}\n".format
+MD_CALL = ("   💰 Current: RM{cur} 🎯 Target: RM{tgt} {trend} Change: {up}\n"
+           "   🏢 Analyst: {analyst} ({call})\n").format
+MD_REVISION = "   🔁 {note}\n".format
+MD_SUMMARY = ("📊 Daily Summary:\n"
+              "   🟢 Buy: {buy} stocks\n"
+              "   🟡 Hold: {hold} stocks\n"
+              "   🔴 Sell: {sell} stocks\n"
+              "   📈 Total: {total} stocks\n\n"
+              "🔗 Source: " + SOURCE_URL).format
+
+HTML_EMPTY = "<b>📊 KLSE Target Price Update</b>\n<i>{when}</i>\n\nNo new target prices available.".format
+HTML_HEADER = "<b>📊 KLSE Target Price Update</b>\n<i>{when}</i>\n\n".format
+HTML_MOVERS_TITLE = "<b>🔥 Top Movers</b>\n"
+HTML_MOVER = "{emoji} {code:7} {name}\n    Cur RM{cur:>6}  Tgt RM{tgt:>6}  {up:>12}\n".format
+HTML_LIST_TITLE = "<b>📋 Full List</b>\n"
+HTML_STOCK = "{emoji} {code:7} {name}{multi}\n".format
+HTML_CALL = "    Cur RM{cur:>6}  Tgt RM{tgt:>6}  {trend} {up:>12}  {analyst}\n".format
+HTML_REVISION = "    🔁 {note}\n".format
+HTML_SUMMARY = ("<b>📊 Daily Summary</b>\n"
+                "🟢 Buy: {buy}  🟡 Hold: {hold}  🔴 Sell: {sell}\n"
+                "📈 Total records: {total}\n").format
+HTML_OMITTED = "⚠️ Omitted {omitted} below {threshold:.0f}% upside\n".format
+HTML_FOOTER = f"\n🔗 <a href=\"{SOURCE_URL}\">Source</a>"
+
+
+@lru_cache(maxsize=4096)
+def escape_html(text: Optional[str]) -> str:
+    """Escape text for Telegram HTML; stock and analyst names repeat, so results are cached."""
+    text = text or ''
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def analyst_label(analyst: str, hit_rate: Optional[float]) -> str:
+    """Analyst name with their backtested hit rate, when one is known."""
+    return analyst if hit_rate is None else f"{analyst} · {hit_rate * 100:.0f}% hit"
+
+
+class MessageRenderer:
+    """Builds report blocks from compiled layouts, reusing rendered stock fragments.
+
+    A stock's fragment is cached under its layout, code, records and revisions, so a
+    stock whose calls did not change is not rendered again on the next run or for the
+    next destination. Rank numbers are added when the report is assembled, which keeps
+    fragments valid when a stock moves up or down the list.
+    """
+
+    def __init__(self, cache_size: int = 4096):
+        self.cache_size = cache_size
+        self._fragments: 'OrderedDict[Hashable, str]' = OrderedDict()
+        self._last: Optional[Tuple[Sequence, int, 'RecordBatch']] = None
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def clear(self):
+        self._fragments.clear()
+        self._last = None
+
+    def _batch(self, data_list: Sequence) -> 'RecordBatch':
+        """Column batch for `data_list`, built once when several configs render the same run."""
+        last = self._last
+        if last is not None and last[0] is data_list and last[1] == len(data_list):
+            return last[2]
+        # NumPy is imported on the first render, not when the monitor starts
+        from columnar import RecordBatch
+        batch = RecordBatch(data_list)
+        self._last = (data_list, len(data_list), batch)
+        return batch
+
+    def _cached(self, key: Hashable, build, *args) -> str:
+        fragment = self._fragments.get(key)
+        if fragment is not None:
+            self._fragments.move_to_end(key)
+            self.stats['hits'] += 1
+            return fragment
+        self.stats['misses'] += 1
+        fragment = build(*args)
+        self._fragments[key] = fragment
+        if len(self._fragments) > self.cache_size:
+            self._fragments.popitem(last=False)
+        return fragment
+
+    @staticmethod
+    def _revisions_for(items: Sequence[TargetPrice],
+                       revisions: Optional[Dict[CallKey, Revision]]) -> Tuple[Optional[Revision], ...]:
+        if not revisions:
+            return ()
+        return tuple(revisions.get(call_key(rec)) for rec in items)
+
+    @staticmethod
+    def _rates_for(items: Sequence[TargetPrice],
+                   accuracy: Optional[Dict[str, float]]) -> Tuple[Optional[float], ...]:
+        if not accuracy:
+            return ()
+        return tuple(accuracy.get(rec.analyst) for rec in items)
+
+    # Markdown
+
+    @staticmethod
+    def _markdown_stock(code: str, items: Sequence[TargetPrice],
+                        notes: Tuple[Optional[Revision], ...], rates: Tuple[Optional[float], ...]) -> str:
+        first = items[0]
+        lines = [MD_STOCK(emoji=CALL_EMOJI.get(first.call, '⚪'), code=code,
+                          name=first.get('stock_name', 'N/A'))]
+        for i, rec in enumerate(items):
+            lines.append(MD_CALL(cur=rec.get('current_price', 'N/A'), tgt=rec.get('target_price', 'N/A'),
+                                 trend=TREND_EMOJI[rec.direction], up=rec.get('upside_downside', ''),
+                                 analyst=analyst_label(rec.get('analyst', 'N/A'), rates[i] if rates else None),
+                                 call=CALL_ENGLISH.get(rec.call, rec.get('price_call', 'N/A'))))
+            if notes and notes[i]:
+                lines.append(MD_REVISION(note=notes[i].describe()))
+        lines.append("\n")
+        return ''.join(lines)
+
+    def markdown_blocks(self, data_list: Sequence, date: str,
+                        revisions: Optional[Dict[CallKey, Revision]] = None,
+                        accuracy: Optional[Dict[str, float]] = None) -> List[Block]:
+        """Plain-text report blocks: header, one per stock (by highest upside), summary.
+
+        `accuracy` maps analysts to backtested hit rates to show next to their names.
+        """
+        if not data_list:
+            return [(MD_EMPTY(date=date), None)]
+
+        batch = self._batch(data_list)
+        blocks: List[Block] = [(MD_HEADER(date=date), None)]
+        for i, (_, code, items) in enumerate(batch.rank_groups(), 1):
+            notes = self._revisions_for(items, revisions)
+            rates = self._rates_for(items, accuracy)
+            fragment = self._cached(('md', code, tuple(items), notes, rates),
+                                    self._markdown_stock, code, items, notes, rates)
+            blocks.append((f"{i}. {fragment}", None))
+
+        counts = batch.call_counts()
+        blocks.append((MD_SUMMARY(buy=counts[PriceCall.BUY], hold=counts[PriceCall.HOLD],
+                                  sell=counts[PriceCall.SELL], total=len(batch)), None))
+        return blocks
+
+    # HTML
+
+    @staticmethod
+    def _html_mover(code: str, rec: TargetPrice) -> str:
+        return HTML_MOVER(emoji=CALL_EMOJI.get(rec.call, '⚪'), code=code,
+                          name=escape_html(rec.get('stock_name', 'N/A')),
+                          cur=rec.get('current_price', 'N/A'), tgt=rec.get('target_price', 'N/A'),
+                          up=rec.get('upside_downside', ''))
+
+    @staticmethod
+    def _html_stock(code: str, items: Sequence[TargetPrice],
+                    notes: Tuple[Optional[Revision], ...], rates: Tuple[Optional[float], ...]) -> str:
+        first = items[0]
+        lines = [HTML_STOCK(emoji=CALL_EMOJI.get(first.call, '⚪'), code=code,
+                            name=escape_html(first.get('stock_name', 'N/A')),
+                            multi=f" ({len(items)} analysts)" if len(items) > 1 else "")]
+        for i, rec in enumerate(items):
+            lines.append(HTML_CALL(cur=rec.get('current_price', 'N/A'), tgt=rec.get('target_price', 'N/A'),
+                                   trend=TREND_EMOJI[rec.direction], up=rec.get('upside_downside', ''),
+                                   analyst=escape_html(analyst_label(rec.get('analyst', 'N/A'),
+                                                                     rates[i] if rates else None))))
+            if notes and notes[i]:
+                lines.append(HTML_REVISION(note=escape_html(notes[i].describe())))
+        lines.append("\n")
+        return ''.join(lines)
+
+    def html_blocks(self, data_list: Sequence, when: str, message_cfg: dict,
+                    revisions: Optional[Dict[CallKey, Revision]] = None,
+                    accuracy: Optional[Dict[str, float]] = None) -> List[Block]:
+        """HTML report blocks; movers rows and per-stock entries sit inside <pre>."""
+        if not data_list:
+            return [(HTML_EMPTY(when=when), None)]
+
+        batch = self._batch(data_list)
+
+        # Apply threshold filter
+        threshold = float(message_cfg.get('upside_threshold_pct', 0) or 0)
+        mask = batch.upside_mask(threshold)
+        filtered_count = int(mask.sum())
+        omitted_count = max(0, len(batch) - filtered_count)
+        if not filtered_count:
+            # Fall back to original if filter removes everything
+            mask = batch.all_mask()
+            filtered_count = len(batch)
+            omitted_count = 0
+
+        # Group by stock code and rank by max upside; only groups that can be shown are built
+        top_count = int(message_cfg.get('top_movers_count', 3) or 3)
+        max_items = int(message_cfg.get('max_items', 50) or 50)
+        ranked = batch.rank_groups(mask, limit=max(top_count, max_items))
+
+        blocks: List[Block] = [(HTML_HEADER(when=when), None)]
+
+        if message_cfg.get('include_top_movers', True):
+            top = ranked[:top_count]
+            if top:
+                blocks.append((HTML_MOVERS_TITLE, None))
+                for i, (_, code, items) in enumerate(top, 1):
+                    fragment = self._cached(('mover', code, items[0]), self._html_mover, code, items[0])
+                    blocks.append((f"{i}. {fragment}", 'pre'))
+                blocks.append(("\n\n", None))
+
+        blocks.append((HTML_LIST_TITLE, None))
+        for rank, (_, code, items) in enumerate(ranked[:max_items], 1):
+            notes = self._revisions_for(items, revisions)
+            rates = self._rates_for(items, accuracy)
+            fragment = self._cached(('html', code, tuple(items), notes, rates),
+                                    self._html_stock, code, items, notes, rates)
+            blocks.append((f"{rank:2}. {fragment}", 'pre'))
+        blocks.append(("\n", None))
+
+        counts = batch.call_counts(mask)
+        summary = [HTML_SUMMARY(buy=counts[PriceCall.BUY], hold=counts[PriceCall.HOLD],
+                                sell=counts[PriceCall.SELL], total=filtered_count)]
+        if omitted_count:
+            METRICS.inc('records', omitted_count, kind='omitted')
+            summary.append(HTML_OMITTED(omitted=omitted_count, threshold=threshold))
+        summary.append(HTML_FOOTER)
+        blocks.append((''.join(summary), None))
+        return blocks
@@ -0,0 +1,388 @@
+"""
+Daily rollups for KLSE Target Price Monitor
+Per-day stock, analyst and revision aggregates kept next to the call history, so
+multi-day digests and queries read a few hundred summary rows instead of every call.
+
+Author: cming401
+License: MIT
+"""
+
+import datetime
+import logging
+import math
+import sqlite3
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from history_store import SCHEMA as HISTORY_SCHEMA
+from models import PriceCall
+from renderer import escape_html
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_SCHEMA = """
+CREATE INDEX IF NOT EXISTS idx_target_prices_stock_analyst_date ON target_prices (stock_code, analyst, date);
+CREATE TABLE IF NOT EXISTS rollup_days (
+    date     TEXT PRIMARY KEY,
+    calls    INTEGER NOT NULL,
+    built_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rollup_stock_daily (
+    date       TEXT NOT NULL,
+    stock_code TEXT NOT NULL,
+    stock_name TEXT,
+    calls      INTEGER NOT NULL,
+    analysts   INTEGER NOT NULL,
+    buys       INTEGER NOT NULL,
+    holds      INTEGER NOT NULL,
+    sells      INTEGER NOT NULL,
+    raises     INTEGER NOT NULL,
+    cuts       INTEGER NOT NULL,
+    target_sum REAL NOT NULL,
+    target_n   INTEGER NOT NULL,
+    max_upside REAL,
+    PRIMARY KEY (date, stock_code)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_rollup_stock_daily_stock ON rollup_stock_daily (stock_code, date);
+CREATE TABLE IF NOT EXISTS rollup_analyst_daily (
+    date     TEXT NOT NULL,
+    analyst  TEXT NOT NULL,
+    calls    INTEGER NOT NULL,
+    stocks   INTEGER NOT NULL,
+    buys     INTEGER NOT NULL,
+    holds    INTEGER NOT NULL,
+    sells    INTEGER NOT NULL,
+    raises   INTEGER NOT NULL,
+    cuts     INTEGER NOT NULL,
+    PRIMARY KEY (date, analyst)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_rollup_analyst_daily_analyst ON rollup_analyst_daily (analyst, date);
+CREATE TABLE IF NOT EXISTS rollup_revisions (
+    date            TEXT NOT NULL,
+    stock_code      TEXT NOT NULL,
+    analyst         TEXT NOT NULL,
+    stock_name      TEXT,
+    previous_target REAL,
+    target          REAL,
+    change_pct      REAL,
+    previous_call   TEXT,
+    price_call      TEXT,
+    call_change     INTEGER NOT NULL,
+    PRIMARY KEY (date, stock_code, analyst)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_rollup_revisions_stock ON rollup_revisions (stock_code, date);
+CREATE INDEX IF NOT EXISTS idx_rollup_revisions_analyst ON rollup_revisions (analyst, date);
+"""
+
+# Each call of the day with the same analyst's previous call on the stock
+DAY_CALLS = """
+SELECT t.stock_code, t.analyst, t.stock_name, t.target, t.upside_pct, t.price_call,
+    (SELECT p.target FROM target_prices p
+     WHERE p.stock_code = t.stock_code AND p.analyst = t.analyst AND p.date < t.date
+     ORDER BY p.date DESC, p.rowid DESC LIMIT 1),
+    (SELECT p.price_call FROM target_prices p
+     WHERE p.stock_code = t.stock_code AND p.analyst = t.analyst AND p.date < t.date
+     ORDER BY p.date DESC, p.rowid DESC LIMIT 1)
+FROM target_prices t
+WHERE t.date = ?
+ORDER BY t.rowid
+"""
+
+# Calls ranked so that a positive difference is an upgrade
+CALL_RANK = {PriceCall.SELL: 0, PriceCall.HOLD: 1, PriceCall.BUY: 2}
+
+
+class _StockDay:
+    __slots__ = ('name', 'calls', 'analysts', 'buys', 'holds', 'sells', 'raises', 'cuts',
+                 'target_sum', 'target_n', 'max_upside')
+
+    def __init__(self, name: Optional[str]):
+        self.name = name
+        self.calls = self.buys = self.holds = self.sells = self.raises = self.cuts = self.target_n = 0
+        self.analysts: Set[str] = set()
+        self.target_sum = 0.0
+        self.max_upside: Optional[float] = None
+
+
+class _AnalystDay:
+    __slots__ = ('calls', 'stocks', 'buys', 'holds', 'sells', 'raises', 'cuts')
+
+    def __init__(self):
+        self.calls = self.buys = self.holds = self.sells = self.raises = self.cuts = 0
+        self.stocks: Set[str] = set()
+
+
+@dataclass
+class Digest:
+    """Aggregates for a date range, read from the rollups."""
+    start: str
+    end: str
+    days: int = 0
+    calls: int = 0
+    stocks: int = 0
+    analysts: int = 0
+    buys: int = 0
+    holds: int = 0
+    sells: int = 0
+    raises: int = 0
+    cuts: int = 0
+    # (stock_code, stock_name, calls, raises, cuts, mean target)
+    most_covered: List[Tuple] = field(default_factory=list)
+    # (date, stock_code, stock_name, analyst, previous_target, target, change_pct)
+    top_raises: List[Tuple] = field(default_factory=list)
+    top_cuts: List[Tuple] = field(default_factory=list)
+    # (date, stock_code, stock_name, analyst, previous_call, price_call)
+    upgrades: List[Tuple] = field(default_factory=list)
+    downgrades: List[Tuple] = field(default_factory=list)
+    # (analyst, calls, stocks covered on the busiest day, buys, sells, raises, cuts)
+    active_analysts: List[Tuple] = field(default_factory=list)
+
+
+class DailyRollups:
+    """Per-day aggregates stored in the history database, rebuilt a day at a time.
+
+    A day is rebuilt from its own calls plus one indexed lookup per call for the
+    analyst's previous target, so refreshing the days a run touched costs about as
+    much as the run's upsert. Digests then sum at most one row per stock per day.
+    """
+
+    def __init__(self, path: str = 'klse_history.db'):
+        self.path = path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(HISTORY_SCHEMA)
+        self.conn.executescript(ROLLUP_SCHEMA)
+
+    def build_day(self, date: str) -> int:
+        """Recompute one day's rollups from the call history; returns the day's call count."""
+        stocks: Dict[str, _StockDay] = {}
+        analysts: Dict[str, _AnalystDay] = {}
+        revisions: Dict[Tuple[str, str], Tuple] = {}
+        calls = 0
+        with self._lock:
+            rows = self.conn.execute(DAY_CALLS, (date,)).fetchall()
+        for code, analyst, name, target, upside, call_text, prev_target, prev_call_text in rows:
+            calls += 1
+            call = PriceCall.parse(call_text)
+            prev_call = PriceCall.parse(prev_call_text)
+            stock = stocks.get(code)
+            if stock is None:
+                stock = stocks[code] = _StockDay(name)
+            desk = analysts.get(analyst)
+            if desk is None:
+                desk = analysts[analyst] = _AnalystDay()
+            stock.calls += 1
+            stock.analysts.add(analyst)
+            desk.calls += 1
+            desk.stocks.add(code)
+            if call is PriceCall.BUY:
+                stock.buys += 1
+                desk.buys += 1
+            elif call is PriceCall.HOLD:
+                stock.holds += 1
+                desk.holds += 1
+            elif call is PriceCall.SELL:
+                stock.sells += 1
+                desk.sells += 1
+            if target is not None:
+                stock.target_sum += target
+                stock.target_n += 1
+            if upside is not None and math.isfinite(upside) and (stock.max_upside is None or upside > stock.max_upside):
+                stock.max_upside = upside
+
+            if prev_target is None and prev_call is None:
+                continue
+            change_pct = None
+            if target is not None and prev_target:
+                change_pct = (target - prev_target) / prev_target * 100
+                if target > prev_target:
+                    stock.raises += 1
+                    desk.raises += 1
+                elif target < prev_target:
+                    stock.cuts += 1
+                    desk.cuts += 1
+            call_change = (CALL_RANK[call] - CALL_RANK[prev_call]) if call in CALL_RANK and prev_call in CALL_RANK else 0
+            if change_pct or call_change:
+                # The last call of the day for an analyst/stock wins
+                revisions[(code, analyst)] = (date, code, analyst, name, prev_target, target, change_pct,
+                                              prev_call_text, call_text, call_change)
+
+        now = datetime.datetime.now().isoformat(timespec='seconds')
+        with self._lock, self.conn:
+            for table in ('rollup_stock_daily', 'rollup_analyst_daily', 'rollup_revisions'):
+                self.conn.execute(f"DELETE FROM {table} WHERE date = ?", (date,))
+            self.conn.executemany(
+                "INSERT INTO rollup_stock_daily VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(date, code, s.name, s.calls, len(s.analysts), s.buys, s.holds, s.sells, s.raises, s.cuts,
+                  s.target_sum, s.target_n, s.max_upside) for code, s in stocks.items()])
+            self.conn.executemany(
+                "INSERT INTO rollup_analyst_daily VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(date, analyst, a.calls, len(a.stocks), a.buys, a.holds, a.sells, a.raises, a.cuts)
+                 for analyst, a in analysts.items()])
+            self.conn.executemany("INSERT INTO rollup_revisions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                  revisions.values())
+            if calls:
+                self.conn.execute("INSERT OR REPLACE INTO rollup_days VALUES (?, ?, ?)", (date, calls, now))
+            else:
+                self.conn.execute("DELETE FROM rollup_days WHERE date = ?", (date,))
+        return calls
+
+    def update(self, dates: Iterable[str]) -> int:
+        """Rebuild the given days, oldest first; returns how many were rebuilt."""
+        days = sorted(set(d for d in dates if d))
+        for date in days:
+            self.build_day(date)
+        if days:
+            logger.info(f"Rolled up {len(days)} day(s) up to {days[-1]}")
+        return len(days)
+
+    def stale_days(self, start: str = '0000-00-00', end: str = '9999-99-99') -> List[str]:
+        """Days in the range whose call count differs from their rollup's, or that have none yet.
+
+        Only the date index is read, so checking a month before a digest takes milliseconds.
+        """
+        span = (start, end)
+        with self._lock:
+            counts = dict(self.conn.execute(
+                "SELECT date, COUNT(*) FROM target_prices WHERE date BETWEEN ? AND ? GROUP BY date", span))
+            built = dict(self.conn.execute("SELECT date, calls FROM rollup_days WHERE date BETWEEN ? AND ?", span))
+        return sorted({d for d, n in counts.items() if built.get(d) != n} | (set(built) - set(counts)))
+
+    def build_missing(self, start: str = '0000-00-00', end: str = '9999-99-99') -> int:
+        """Bring the days in the range up to date with the call history."""
+        return self.update(self.stale_days(start, end))
+
+    def rebuild(self) -> int:
+        """Rebuild every day in the call history, e.g. after a backfill of older days."""
+        with self._lock, self.conn:
+            days = [d for (d,) in self.conn.execute("SELECT DISTINCT date FROM target_prices")]
+            for table in ('rollup_days', 'rollup_stock_daily', 'rollup_analyst_daily', 'rollup_revisions'):
+                self.conn.execute(f"DELETE FROM {table}")
+        return self.update(days)
+
+    def digest(self, start: str, end: str, limit: int = 10) -> Digest:
+        """Totals, most-covered stocks, biggest revisions and busiest analysts for a date range."""
+        digest = Digest(start, end)
+        span = (start, end)
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT COUNT(DISTINCT date), COALESCE(SUM(calls), 0), COUNT(DISTINCT stock_code), "
+                "COALESCE(SUM(buys), 0), COALESCE(SUM(holds), 0), COALESCE(SUM(sells), 0), "
+                "COALESCE(SUM(raises), 0), COALESCE(SUM(cuts), 0) "
+                "FROM rollup_stock_daily WHERE date BETWEEN ? AND ?", span).fetchone()
+            (digest.days, digest.calls, digest.stocks, digest.buys, digest.holds,
+             digest.sells, digest.raises, digest.cuts) = row
+            digest.analysts = self.conn.execute(
+                "SELECT COUNT(DISTINCT analyst) FROM rollup_analyst_daily WHERE date BETWEEN ? AND ?",
+                span).fetchone()[0]
+            digest.most_covered = self.conn.execute(
+                "SELECT stock_code, MAX(stock_name), SUM(calls), SUM(raises), SUM(cuts), "
+                "SUM(target_sum) / NULLIF(SUM(target_n), 0) "
+                "FROM rollup_stock_daily WHERE date BETWEEN ? AND ? "
+                "GROUP BY stock_code ORDER BY SUM(calls) DESC, stock_code LIMIT ?", span + (limit,)).fetchall()
+            revision_columns = "date, stock_code, stock_name, analyst, previous_target, target, change_pct"
+            digest.top_raises = self.conn.execute(
+                f"SELECT {revision_columns} FROM rollup_revisions WHERE date BETWEEN ? AND ? "
+                "AND change_pct > 0 ORDER BY change_pct DESC LIMIT ?", span + (limit,)).fetchall()
+            digest.top_cuts = self.conn.execute(
+                f"SELECT {revision_columns} FROM rollup_revisions WHERE date BETWEEN ? AND ? "
+                "AND change_pct < 0 ORDER BY change_pct LIMIT ?", span + (limit,)).fetchall()
+            call_columns = "date, stock_code, stock_name, analyst, previous_call, price_call"
+            digest.upgrades = self.conn.execute(
+                f"SELECT {call_columns} FROM rollup_revisions WHERE date BETWEEN ? AND ? "
+                "AND call_change > 0 ORDER BY date DESC, call_change DESC LIMIT ?", span + (limit,)).fetchall()
+            digest.downgrades = self.conn.execute(
+                f"SELECT {call_columns} FROM rollup_revisions WHERE date BETWEEN ? AND ? "
+                "AND call_change < 0 ORDER BY date DESC, call_change LIMIT ?", span + (limit,)).fetchall()
+            digest.active_analysts = self.conn.execute(
+                "SELECT analyst, SUM(calls), MAX(stocks), SUM(buys), SUM(sells), SUM(raises), SUM(cuts) "
+                "FROM rollup_analyst_daily WHERE date BETWEEN ? AND ? "
+                "GROUP BY analyst ORDER BY SUM(calls) DESC, analyst LIMIT ?", span + (limit,)).fetchall()
+        return digest
+
+    def stock_days(self, stock_code: str, start: str, end: str) -> List[Tuple]:
+        """(date, calls, analysts, buys, holds, sells, raises, cuts, mean target, max upside) per day."""
+        with self._lock:
+            return self.conn.execute(
+                "SELECT date, calls, analysts, buys, holds, sells, raises, cuts, "
+                "target_sum / NULLIF(target_n, 0), max_upside FROM rollup_stock_daily "
+                "WHERE stock_code = ? AND date BETWEEN ? AND ? ORDER BY date",
+                (stock_code, start, end)).fetchall()
+
+    def analyst_days(self, analyst: str, start: str, end: str) -> List[Tuple]:
+        """(date, calls, stocks, buys, holds, sells, raises, cuts) per day."""
+        with self._lock:
+            return self.conn.execute(
+                "SELECT date, calls, stocks, buys, holds, sells, raises, cuts FROM rollup_analyst_daily "
+                "WHERE analyst = ? AND date BETWEEN ? AND ? ORDER BY date",
+                (analyst, start, end)).fetchall()
+
+    def revisions(self, start: str, end: str, stock_code: Optional[str] = None,
+                  analyst: Optional[str] = None) -> List[Tuple]:
+        """(date, stock_code, analyst, previous_target, target, change_pct, previous_call, price_call)."""
+        clauses = ['date BETWEEN ? AND ?']
+        params: List[str] = [start, end]
+        if stock_code:
+            clauses.append('stock_code = ?')
+            params.append(stock_code)
+        if analyst:
+            clauses.append('analyst = ?')
+            params.append(analyst)
+        with self._lock:
+            return self.conn.execute(
+                "SELECT date, stock_code, analyst, previous_target, target, change_pct, previous_call, price_call "
+                f"FROM rollup_revisions WHERE {' AND '.join(clauses)} ORDER BY date, stock_code, analyst",
+                params).fetchall()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _price(value: Optional[float]) -> str:
+    return f"RM{value:.2f}" if value is not None else 'N/A'
+
+
+def format_digest(digest: Digest, title: str = 'Digest', html: bool = False) -> str:
+    """Render a digest as plain text, or as Telegram HTML with names escaped."""
+    esc = escape_html if html else (lambda text: text or '')
+    bold = (lambda text: f"<b>{text}</b>") if html else (lambda text: text)
+    lines = [bold(f"📊 {esc(title)}: {digest.start} to {digest.end}"),
+             f"{digest.calls} calls on {digest.stocks} stocks by {digest.analysts} analysts "
+             f"over {digest.days} trading day(s)",
+             f"🟢 {digest.buys} Buy  🟡 {digest.holds} Hold  🔴 {digest.sells} Sell  "
+             f"📈 {digest.raises} raised  📉 {digest.cuts} cut"]
+
+    if digest.top_raises:
+        lines += ['', bold("📈 Top target upgrades")]
+        lines += [f"{i}. {esc(code)} {_price(prev)} → {_price(target)} ({pct:+.1f}%) · {esc(analyst)} · {date}"
+                  for i, (date, code, _, analyst, prev, target, pct) in enumerate(digest.top_raises, 1)]
+    if digest.top_cuts:
+        lines += ['', bold("📉 Biggest target cuts")]
+        lines += [f"{i}. {esc(code)} {_price(prev)} → {_price(target)} ({pct:+.1f}%) · {esc(analyst)} · {date}"
+                  for i, (date, code, _, analyst, prev, target, pct) in enumerate(digest.top_cuts, 1)]
+    if digest.upgrades:
+        lines += ['', bold("⬆️ Call upgrades")]
+        lines += [f"{i}. {esc(code)} {esc(prev)} → {esc(call)} · {esc(analyst)} · {date}"
+                  for i, (date, code, _, analyst, prev, call) in enumerate(digest.upgrades, 1)]
+    if digest.downgrades:
+        lines += ['', bold("⬇️ Call downgrades")]
+        lines += [f"{i}. {esc(code)} {esc(prev)} → {esc(call)} · {esc(analyst)} · {date}"
+                  for i, (date, code, _, analyst, prev, call) in enumerate(digest.downgrades, 1)]
+    if digest.most_covered:
+        lines += ['', bold("🔎 Most covered stocks")]
+        lines += [f"{i}. {esc(code)} ({esc(name)}) · {calls} calls · avg target {_price(mean)}"
+                  for i, (code, name, calls, _, _, mean) in enumerate(digest.most_covered, 1)]
+    if digest.active_analysts:
+        lines += ['', bold("🏦 Most active analysts")]
+        lines += [f"{i}. {esc(analyst)} · {calls} calls · {raises} raised / {cuts} cut"
+                  for i, (analyst, calls, _, _, _, raises, cuts) in enumerate(digest.active_analysts, 1)]
+    return '\n'.join(lines)
@@ -0,0 +1,246 @@
+"""
+Alert rules for KLSE Target Price Monitor
+Per-subscriber watchlist rules compiled into an indexed matcher.
+
+Author: cming401
+License: MIT
+"""
+
+import bisect
+import logging
+import operator
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from chunking import Block
+from models import PriceCall, TargetPrice
+from renderer import escape_html
+
+logger = logging.getLogger(__name__)
+
+# Record attributes a threshold can test
+FIELDS = ('target', 'current', 'upside_pct', 'change')
+OPS: Dict[str, Callable[[float, float], bool]] = {
+    '>': operator.gt, '>=': operator.ge, '<': operator.lt, '<=': operator.le,
+}
+
+ALERT_HEADER = "🔔 <b>{count} alert(s)</b>\n".format
+ALERT_RULE = "\n<b>{name}</b>\n".format
+ALERT_CALL = "{emoji} {code} {call} · {analyst}\n    RM{cur} → RM{tgt}  {up}\n".format
+CALL_EMOJI = {PriceCall.BUY: '🟢', PriceCall.HOLD: '🟡', PriceCall.SELL: '🔴'}
+
+
+@dataclass(frozen=True)
+class Rule:
+    """One subscriber rule: every given condition must hold."""
+    name: str
+    chat_id: str
+    stocks: Optional[FrozenSet[str]] = None
+    analysts: Optional[FrozenSet[str]] = None
+    calls: Optional[FrozenSet[PriceCall]] = None
+    field: Optional[str] = None
+    op: Optional[str] = None
+    value: Optional[float] = None
+
+    @classmethod
+    def from_config(cls, entry: Dict, watchlists: Optional[Dict[str, List[str]]] = None) -> 'Rule':
+        """Build a rule from its config entry, resolving `watchlist` names into stocks."""
+        stocks = [s.strip().upper() for s in entry.get('stocks', []) if s.strip()]
+        if entry.get('watchlist'):
+            try:
+                stocks += [s.strip().upper() for s in (watchlists or {})[entry['watchlist']]]
+            except KeyError:
+                raise ValueError(f"unknown watchlist {entry['watchlist']!r}") from None
+        analysts = [a.strip().upper() for a in entry.get('analysts', []) if a.strip()]
+        calls = []
+        for text in entry.get('calls', []):
+            call = PriceCall.parse(text)
+            if call is None:
+                raise ValueError(f"unknown call {text!r}")
+            calls.append(call)
+
+        field, op, value = entry.get('field'), entry.get('op'), entry.get('value')
+        if field is not None or op is not None or value is not None:
+            if field not in FIELDS:
+                raise ValueError(f"field must be one of {', '.join(FIELDS)}, got {field!r}")
+            if op not in OPS:
+                raise ValueError(f"op must be one of {', '.join(OPS)}, got {op!r}")
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"value must be a number, got {value!r}") from None
+        if not entry.get('chat_id'):
+            raise ValueError("chat_id is required")
+        return cls(
+            name=entry.get('name') or _describe(stocks, analysts, calls, field, op, value),
+            chat_id=str(entry['chat_id']),
+            stocks=frozenset(stocks) or None,
+            analysts=frozenset(analysts) or None,
+            calls=frozenset(calls) or None,
+            field=field, op=op, value=value,
+        )
+
+    def matches(self, rec: TargetPrice) -> bool:
+        """Check every condition directly; the matcher's reference behaviour."""
+        if self.stocks is not None and (rec.stock_code or '').upper() not in self.stocks:
+            return False
+        if self.analysts is not None and (rec.analyst or '').upper() not in self.analysts:
+            return False
+        if self.calls is not None and rec.call not in self.calls:
+            return False
+        if self.field is not None:
+            actual = getattr(rec, self.field)
+            if actual is None or not OPS[self.op](actual, self.value):
+                return False
+        return True
+
+
+def _describe(stocks, analysts, calls, field, op, value) -> str:
+    parts = []
+    if stocks:
+        parts.append(', '.join(sorted(stocks)[:3]) + ('…' if len(stocks) > 3 else ''))
+    if calls:
+        parts.append('/'.join(sorted(c.value for c in calls)))
+    if field:
+        parts.append(f"{field} {op} {value:g}")
+    if analysts:
+        parts.append('from ' + ', '.join(sorted(analysts)))
+    return ' '.join(parts) or 'any call'
+
+
+class _Thresholds:
+    """Rules testing one field one way, sorted by value so the passing ones are a slice."""
+
+    __slots__ = ('values', 'rules', 'lower')
+
+    def __init__(self, rules: List[Rule], lower: bool):
+        rules = sorted(rules, key=lambda r: r.value)
+        self.values = [r.value for r in rules]
+        self.rules = rules
+        # Lower bounds (> and >=) pass when the record is above them, upper bounds when below
+        self.lower = lower
+
+    def passing(self, x: float) -> List[Rule]:
+        if self.lower:
+            # value < x passes '>', value <= x passes '>='; take the wider slice, recheck the edge
+            return self.rules[:bisect.bisect_right(self.values, x)]
+        return self.rules[bisect.bisect_left(self.values, x):]
+
+
+class _Bucket:
+    """Rules indexed under one key: unconditional ones plus per-field threshold ladders."""
+
+    __slots__ = ('plain', 'thresholds')
+
+    def __init__(self):
+        self.plain: List[Rule] = []
+        self.thresholds: List[Tuple[str, _Thresholds]] = []
+
+
+def _bucket_key(rule: Rule) -> Tuple[str, Tuple]:
+    """Index a rule under its most selective condition: stock, then analyst, then call."""
+    if rule.stocks is not None:
+        return 'stock', tuple(rule.stocks)
+    if rule.analysts is not None:
+        return 'analyst', tuple(rule.analysts)
+    if rule.calls is not None:
+        return 'call', tuple(rule.calls)
+    return 'any', (None,)
+
+
+class RuleMatcher:
+    """Compiled rule set matching a batch in about O(records + candidates).
+
+    Each rule is filed under one key of its most selective condition (a rule on
+    three stocks is filed under each of them), so a record only looks at the
+    buckets for its own stock, analyst and call. Inside a bucket, threshold rules
+    sit in value-sorted ladders and a bisect finds the slice that passes, so rules
+    that cannot match are never visited. Remaining conditions are checked on the
+    few candidates left.
+    """
+
+    def __init__(self, rules: Iterable[Rule]):
+        self.rules = list(rules)
+        grouped: Dict[Tuple[str, object], List[Rule]] = defaultdict(list)
+        for rule in self.rules:
+            kind, keys = _bucket_key(rule)
+            for key in keys:
+                grouped[(kind, key)].append(rule)
+
+        self.index: Dict[str, Dict[object, _Bucket]] = {'stock': {}, 'analyst': {}, 'call': {}, 'any': {}}
+        for (kind, key), rules in grouped.items():
+            bucket = _Bucket()
+            ladders: Dict[Tuple[str, bool], List[Rule]] = defaultdict(list)
+            for rule in rules:
+                if rule.field is None:
+                    bucket.plain.append(rule)
+                else:
+                    ladders[(rule.field, rule.op in ('>', '>='))].append(rule)
+            bucket.thresholds = [(field, _Thresholds(ladder, lower)) for (field, lower), ladder in ladders.items()]
+            self.index[kind][key] = bucket
+
+    @classmethod
+    def from_config(cls, alerts_cfg: Dict) -> 'RuleMatcher':
+        """Compile `alerts.rules`; a bad rule is reported with its position and skipped."""
+        watchlists = alerts_cfg.get('watchlists', {})
+        rules = []
+        for i, entry in enumerate(alerts_cfg.get('rules', []), 1):
+            try:
+                rules.append(Rule.from_config(entry, watchlists))
+            except ValueError as e:
+                logger.error(f"Skipping alert rule #{i}: {e}")
+        return cls(rules)
+
+    def _buckets(self, rec: TargetPrice) -> Iterable[_Bucket]:
+        index = self.index
+        for kind, key in (('stock', (rec.stock_code or '').upper()), ('analyst', (rec.analyst or '').upper()),
+                          ('call', rec.call), ('any', None)):
+            bucket = index[kind].get(key)
+            if bucket is not None:
+                yield bucket
+
+    def match(self, records: Iterable[TargetPrice]) -> List[Tuple[Rule, TargetPrice]]:
+        """(rule, record) for every rule each record satisfies, in record order."""
+        matches = []
+        for rec in records:
+            for bucket in self._buckets(rec):
+                for rule in bucket.plain:
+                    if rule.matches(rec):
+                        matches.append((rule, rec))
+                for field, ladder in bucket.thresholds:
+                    x = getattr(rec, field)
+                    if x is None:
+                        continue
+                    for rule in ladder.passing(x):
+                        if rule.matches(rec):
+                            matches.append((rule, rec))
+        return matches
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+
+def alert_blocks(matches: List[Tuple[Rule, TargetPrice]]) -> List[Block]:
+    """HTML alert message for one subscriber as blocks: header, then each rule's calls in <pre>."""
+    by_rule: Dict[Rule, List[TargetPrice]] = {}
+    for rule, rec in matches:
+        by_rule.setdefault(rule, []).append(rec)
+    blocks: List[Block] = [(ALERT_HEADER(count=len(matches)), None)]
+    for rule, records in by_rule.items():
+        blocks.append((ALERT_RULE(name=escape_html(rule.name)), None))
+        for rec in records:
+            blocks.append((ALERT_CALL(
+                emoji=CALL_EMOJI.get(rec.call, '⚪'), code=escape_html(rec.stock_code),
+                call=escape_html(rec.price_call or ''), analyst=escape_html(rec.analyst or 'N/A'),
+                cur=escape_html(rec.current_price or 'N/A'), tgt=escape_html(rec.target_price),
+                up=escape_html(rec.upside_downside or '')), 'pre'))
+    return blocks
+
+
+def group_by_chat(matches: List[Tuple[Rule, TargetPrice]]) -> Dict[str, List[Tuple[Rule, TargetPrice]]]:
+    """Matches per subscriber chat, in match order."""
+    chats: Dict[str, List[Tuple[Rule, TargetPrice]]] = {}
+    for rule, rec in matches:
+        chats.setdefault(rule.chat_id, []).append((rule, rec))
+    return chats
@@ -0,0 +1,130 @@
+"""
+In-process scheduler for KLSE Target Price Monitor
+Keeps one warm monitor running and triggers it from the `schedule` config block.
+
+Author: cming401
+License: MIT
+"""
+
+import datetime
+import logging
+import os
+import signal
+import threading
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Malaysia has kept UTC+8 without daylight saving since 1982, so a fixed offset is exact
+# and avoids loading the tz database on every short cron run
+MYT = datetime.timezone(datetime.timedelta(hours=8), 'MYT')
+
+
+def _parse_time(text: str) -> datetime.time:
+    hour, minute = text.strip().split(':')
+    return datetime.time(int(hour), int(minute))
+
+
+def scheduled_times(schedule_cfg: dict) -> List[datetime.time]:
+    """Daily run times from `schedule.times` (list) or `schedule.time` (single HH:MM)."""
+    times = schedule_cfg.get('times') or [schedule_cfg.get('time', '18:00')]
+    return sorted(_parse_time(t) for t in times)
+
+
+def is_trading_day(day: datetime.date, schedule_cfg: dict) -> bool:
+    """Whether the schedule runs on `day` (Monday to Friday when weekdays_only)."""
+    return not schedule_cfg.get('weekdays_only', True) or day.weekday() < 5
+
+
+def next_run(now: datetime.datetime, schedule_cfg: dict) -> datetime.datetime:
+    """The first scheduled or polling run strictly after `now` (an aware datetime in MYT)."""
+    now = now.astimezone(MYT)
+    candidates = []
+    for offset in range(8):
+        day = now.date() + datetime.timedelta(days=offset)
+        if not is_trading_day(day, schedule_cfg):
+            continue
+        for t in scheduled_times(schedule_cfg):
+            at = datetime.datetime.combine(day, t, tzinfo=MYT)
+            if at > now:
+                candidates.append(at)
+        if candidates:
+            break
+
+    interval = float(schedule_cfg.get('poll_interval_minutes', 0) or 0)
+    if interval > 0:
+        open_time, close_time = (_parse_time(t) for t in schedule_cfg.get('market_hours', ['09:00', '17:00']))
+        for offset in range(8):
+            day = now.date() + datetime.timedelta(days=offset)
+            if not is_trading_day(day, schedule_cfg):
+                continue
+            market_open = datetime.datetime.combine(day, open_time, tzinfo=MYT)
+            market_close = datetime.datetime.combine(day, close_time, tzinfo=MYT)
+            if now < market_open:
+                candidates.append(market_open)
+                break
+            if now < market_close:
+                candidates.append(min(now + datetime.timedelta(minutes=interval), market_close))
+                break
+
+    return min(candidates)
+
+
+class MonitorDaemon:
+    """Runs a monitor on schedule in one long-lived process, hot-reloading its config file."""
+
+    def __init__(self, monitor, config_file: str = 'config.json', tick_seconds: float = 30):
+        self.monitor = monitor
+        self.config_file = config_file
+        self.tick_seconds = tick_seconds
+        self._stop = threading.Event()
+        self._config_mtime = self._mtime()
+
+    def _mtime(self) -> Optional[float]:
+        try:
+            return os.path.getmtime(self.config_file)
+        except OSError:
+            return None
+
+    def _maybe_reload(self) -> bool:
+        """Reload the config if the file changed; returns True when it was reloaded."""
+        mtime = self._mtime()
+        if mtime is None or mtime == self._config_mtime:
+            return False
+        self._config_mtime = mtime
+        try:
+            self.monitor.reload_config(self.config_file)
+        except Exception as e:
+            logger.error(f"Keeping previous configuration, reload failed: {e}")
+            return False
+        logger.info(f"Reloaded configuration from {self.config_file}")
+        return True
+
+    def stop(self, *_):
+        logger.info("Stopping daemon...")
+        self._stop.set()
+
+    def run_forever(self):
+        """Sleep until each due time, run the monitor, repeat until stopped."""
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        due = next_run(datetime.datetime.now(MYT), self.monitor.schedule_cfg)
+        logger.info(f"Daemon started, next run at {due:%Y-%m-%d %H:%M} MYT")
+        while not self._stop.is_set():
+            if self._maybe_reload():
+                due = next_run(datetime.datetime.now(MYT), self.monitor.schedule_cfg)
+                logger.info(f"Next run at {due:%Y-%m-%d %H:%M} MYT")
+
+            now = datetime.datetime.now(MYT)
+            if now >= due:
+                if self.monitor.schedule_cfg.get('enabled', True):
+                    self.monitor.run_monitor()
+                else:
+                    logger.info("Schedule disabled, skipping run")
+                due = next_run(datetime.datetime.now(MYT), self.monitor.schedule_cfg)
+                logger.info(f"Next run at {due:%Y-%m-%d %H:%M} MYT")
+                continue
+
+            self._stop.wait(min(self.tick_seconds, (due - now).total_seconds()))
+        self.monitor.close()
@@ -0,0 +1,471 @@
+#!/usr/bin/env python3
+"""
+KLSE Target Price Scraper
+Fetches price target listings from i3investor over a pooled HTTP session.
+
+Author: cming401
+License: MIT
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Union
+from urllib.parse import urlparse
+
+import requests
+from lxml import etree
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from http_cache import PageCache
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_URL = "https://klse.i3investor.com/web/pricetarget/latest"
+USER_AGENT = "Mozilla/5.0 (compatible; KLSETargetPriceMonitor/1.0)"
+
+# Header keywords mapped to record fields; checked in order, first match wins
+HEADER_FIELDS = [
+    ('date', 'date'),
+    ('name', 'stock_name'),
+    ('stock', 'stock_code'),
+    ('target', 'target_price'),
+    ('upside', 'upside_downside'),
+    ('downside', 'upside_downside'),
+    ('call', 'price_call'),
+    ('price', 'current_price'),
+    ('source', 'analyst'),
+    ('analyst', 'analyst'),
+]
+
+DATE_FORMATS = ['%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d %b %Y', '%d-%b-%Y', '%d %B %Y', '%b %d, %Y']
+
+
+def build_session(pool_size: int = 4, retries: int = 2) -> requests.Session:
+    """Create a keep-alive session with a connection pool sized for the worker count."""
+    session = requests.Session()
+    retry = Retry(total=retries, backoff_factor=0.5,
+                  status_forcelist=[500, 502, 503, 504], allowed_methods=['GET'])
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({'User-Agent': USER_AGENT})
+    return session
+
+
+class HostRateLimiter:
+    """Spaces out requests to each host to at most `rate` requests per second."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self._next_slot: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url: str):
+        """Block until the host of `url` may be requested again."""
+        if not self.interval:
+            return
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+def normalize_date(text: str) -> str:
+    """Convert a listing date into YYYY-MM-DD, leaving unknown formats untouched."""
+    text = ' '.join(text.split())
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(text, fmt).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    return text
+
+
+def format_upside(current_price: str, target_price: str) -> str:
+    """Build an upside string like '+0.20 (44.44%)' from two prices."""
+    try:
+        cur = float(current_price)
+        tgt = float(target_price)
+    except (TypeError, ValueError):
+        return ''
+    if cur <= 0:
+        return ''
+    diff = tgt - cur
+    return f"{diff:+.2f} ({diff / cur * 100:.2f}%)"
+
+
+def _map_headers(headers: List[str]) -> List[Optional[str]]:
+    """Map table header labels to record field names."""
+    fields: List[Optional[str]] = []
+    for label in headers:
+        label = label.lower()
+        field = None
+        for keyword, name in HEADER_FIELDS:
+            if keyword in label and name not in fields:
+                field = name
+                break
+        fields.append(field)
+    return fields
+
+
+def _normalize_record(raw: Dict[str, str]) -> Optional[Dict]:
+    """Turn raw cell texts into the record shape used by the monitor."""
+    stock_code = raw.get('stock_code', '').strip()
+    target_price = raw.get('target_price', '').replace('RM', '').replace(',', '').strip()
+    if not stock_code or not target_price:
+        return None
+    current_price = raw.get('current_price', '').replace('RM', '').replace(',', '').strip()
+    upside = ' '.join(raw.get('upside_downside', '').split())
+    if not upside:
+        upside = format_upside(current_price, target_price)
+    return {
+        'date': normalize_date(raw.get('date', '')),
+        'stock_code': stock_code,
+        'stock_name': raw.get('stock_name', '').strip() or stock_code,
+        'current_price': current_price,
+        'target_price': target_price,
+        'upside_downside': upside,
+        'price_call': raw.get('price_call', '').strip().upper(),
+        'analyst': raw.get('analyst', '').strip(),
+    }
+
+
+class _ListingTarget:
+    """lxml parser target that turns listing table rows into records as they are read."""
+
+    def __init__(self):
+        self.rows: deque = deque()
+        self._table_depth = 0
+        self._fields: Optional[List[Optional[str]]] = None
+        self._skip_table = False
+        self._cells: List[tuple] = []
+        self._has_td = False
+        self._text: Optional[List[str]] = None
+        self._link: Optional[str] = None
+        self._link_text: Optional[List[str]] = None
+        self._title: Optional[str] = None
+
+    def start(self, tag, attrib):
+        if self._text is not None:
+            # Element boundaries separate words, as get_text(' ') does
+            self._text.append(' ')
+        if tag == 'table':
+            self._table_depth += 1
+            if self._table_depth == 1:
+                self._fields = None
+                self._skip_table = False
+        elif not self._table_depth or self._skip_table:
+            return
+        elif tag == 'tr':
+            self._cells, self._has_td = [], False
+        elif tag in ('td', 'th'):
+            self._has_td = self._has_td or tag == 'td'
+            self._text = []
+            self._link = None
+            self._title = attrib.get('title')
+        elif tag == 'a' and self._text is not None and self._link is None:
+            self._link_text = []
+            self._title = attrib.get('title') or self._title
+
+    def data(self, text):
+        if self._text is not None:
+            self._text.append(text)
+            if self._link_text is not None:
+                self._link_text.append(text)
+
+    def end(self, tag):
+        if self._text is not None:
+            self._text.append(' ')
+        if tag == 'table':
+            self._table_depth = max(0, self._table_depth - 1)
+        elif not self._table_depth or self._skip_table:
+            return
+        elif tag == 'a' and self._link_text is not None:
+            self._link = ' '.join(''.join(self._link_text).split())
+            self._link_text = None
+        elif tag in ('td', 'th') and self._text is not None:
+            self._cells.append((' '.join(''.join(self._text).split()), self._link, self._title))
+            self._text = None
+        elif tag == 'tr':
+            self._end_row()
+
+    def _end_row(self):
+        if self._fields is None:
+            self._fields = _map_headers([text for text, _, _ in self._cells])
+            if 'stock_code' not in self._fields or 'target_price' not in self._fields:
+                self._skip_table = True
+            return
+        if not self._has_td or len(self._cells) < len(self._fields):
+            return
+        raw: Dict[str, str] = {}
+        for field, (text, link, title) in zip(self._fields, self._cells):
+            if field is None:
+                continue
+            if field == 'stock_code':
+                raw['stock_code'] = link if link is not None else text
+                if title and 'stock_name' not in raw:
+                    raw['stock_name'] = title
+            else:
+                raw[field] = text
+        record = _normalize_record(raw)
+        if record:
+            self.rows.append(record)
+
+    def close(self):
+        return None
+
+
+def iter_listing(chunks: Iterable[Union[bytes, str]], encoding: Optional[str] = None) -> Iterator[Dict]:
+    """Stream-parse listing page chunks, yielding records without building a document tree."""
+    target = _ListingTarget()
+    parser = etree.HTMLParser(target=target, encoding=encoding)
+    for chunk in chunks:
+        if chunk:
+            parser.feed(chunk)
+            while target.rows:
+                yield target.rows.popleft()
+    parser.close()
+    while target.rows:
+        yield target.rows.popleft()
+
+
+def parse_listing(html: Union[bytes, str], encoding: Optional[str] = None) -> List[Dict]:
+    """Parse a price target listing page into records."""
+    return list(iter_listing([html], encoding))
+
+
+def parse_listing_bs4(html: str) -> List[Dict]:
+    """Parse a listing page through a full BeautifulSoup tree; kept as a benchmark baseline."""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, 'lxml')
+    records: List[Dict] = []
+    for table in soup.find_all('table'):
+        header_row = table.find('tr')
+        if header_row is None:
+            continue
+        headers = [c.get_text(' ', strip=True) for c in header_row.find_all(['th', 'td'])]
+        fields = _map_headers(headers)
+        if 'stock_code' not in fields or 'target_price' not in fields:
+            continue
+        for row in table.find_all('tr')[1:]:
+            cells = row.find_all('td')
+            if len(cells) < len(fields):
+                continue
+            raw: Dict[str, str] = {}
+            for field, cell in zip(fields, cells):
+                if field is None:
+                    continue
+                if field == 'stock_code':
+                    link = cell.find('a')
+                    raw['stock_code'] = (link or cell).get_text(' ', strip=True)
+                    title = (link.get('title') if link else None) or cell.get('title')
+                    if title and 'stock_name' not in raw:
+                        raw['stock_name'] = title
+                else:
+                    raw[field] = cell.get_text(' ', strip=True)
+            record = _normalize_record(raw)
+            if record:
+                records.append(record)
+    return records
+
+
+class Page(NamedTuple):
+    """A downloaded listing page: its body to parse, or the cached records on a 304."""
+
+    url: str
+    body: Optional[bytes] = None
+    encoding: Optional[str] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    records: Optional[List[Dict]] = None
+
+
+class TargetPriceScraper:
+    """Concurrent, rate-limited scraper for the i3investor price target listing."""
+
+    def __init__(self, source_cfg: Optional[dict] = None, session: Optional[requests.Session] = None,
+                 cache: Optional[PageCache] = None):
+        cfg = source_cfg or {}
+        self.url = cfg.get('url') or DEFAULT_URL
+        self.page_param = cfg.get('page_param', 'page')
+        self.date_param = cfg.get('date_param', 'date')
+        self.max_pages = int(cfg.get('max_pages', 1) or 1)
+        self.max_workers = int(cfg.get('max_workers', 4) or 4)
+        self.timeout = float(cfg.get('timeout', 20) or 20)
+        self.limiter = HostRateLimiter(float(cfg.get('requests_per_second', 4) or 0))
+        self.session = session or build_session(self.max_workers)
+        self.cache = cache if cache is not None else PageCache.from_config(cfg.get('cache'))
+        self.stats = {'requests': 0, 'not_modified': 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key: str):
+        with self._stats_lock:
+            self.stats[key] += 1
+        METRICS.inc('scraper_' + key)
+
+    def _request(self, params: Optional[dict]):
+        """Page URL, cached entry and conditional headers, after waiting for a request slot."""
+        url = requests.Request('GET', self.url, params=params).prepare().url
+        entry = self.cache.get(url) if self.cache else None
+        headers = self.cache.conditional_headers(entry) if self.cache else {}
+        self.limiter.wait(url)
+        self._count('requests')
+        return url, entry, headers
+
+    def fetch_page(self, params: Optional[dict] = None) -> List[Dict]:
+        """Fetch and parse a single listing page, revalidating any cached copy."""
+        url, entry, headers = self._request(params)
+        with self.session.get(url, headers=headers, timeout=self.timeout, stream=True) as response:
+            if response.status_code == 304 and entry is not None:
+                self._count('not_modified')
+                self.cache.touch(url)
+                return entry['records']
+            response.raise_for_status()
+            records = METRICS.parse_stream(lambda chunks: iter_listing(chunks, response.encoding),
+                                           response.iter_content(chunk_size=65536))
+
+        if self.cache:
+            self.cache.put(url, response.headers.get('ETag'),
+                           response.headers.get('Last-Modified'), records)
+        return records
+
+    def download_page(self, params: Optional[dict] = None) -> Page:
+        """Download a listing page without parsing it, so parsing can run elsewhere."""
+        url, entry, headers = self._request(params)
+        with METRICS.timer('download'):
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304 and entry is not None:
+            self._count('not_modified')
+            self.cache.touch(url)
+            return Page(url, records=entry['records'])
+        response.raise_for_status()
+        METRICS.inc('bytes_received', len(response.content))
+        return Page(url, response.content, response.encoding,
+                    response.headers.get('ETag'), response.headers.get('Last-Modified'))
+
+    def store_page(self, page: Page, records: List[Dict]):
+        """Cache the records parsed from a downloaded page."""
+        if self.cache:
+            self.cache.put(page.url, page.etag, page.last_modified, records)
+
+    def finish(self, pages: int):
+        """Evict old cache entries and log the fetch after a batch of pages."""
+        if self.cache:
+            self.cache.evict()
+        logger.info(f"Fetched {pages} pages "
+                    f"({self.stats['not_modified']}/{self.stats['requests']} not modified so far)")
+
+    def _iter_many(self, param_sets: List[Optional[dict]]) -> Iterator[Dict]:
+        """Fetch pages concurrently and yield their records in request order."""
+        if not param_sets:
+            return
+        workers = max(1, min(self.max_workers, len(param_sets)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for page_records in pool.map(self.fetch_page, param_sets):
+                yield from page_records
+        self.finish(len(param_sets))
+
+    def page_params(self, pages: Iterable[int]) -> List[Optional[dict]]:
+        """Request parameters for page numbers; page 1 is requested without a page parameter."""
+        return [None if page == 1 else {self.page_param: page} for page in pages]
+
+    def latest_params(self) -> List[Optional[dict]]:
+        """Request parameters for the configured number of latest pages."""
+        return self.page_params(range(1, self.max_pages + 1))
+
+    def iter_pages(self, pages: Iterable[int]) -> Iterator[Dict]:
+        """Yield records from the given page numbers."""
+        return self._iter_many(self.page_params(pages))
+
+    def iter_dates(self, dates: Iterable[str]) -> Iterator[Dict]:
+        """Yield records from one listing page per YYYY-MM-DD date."""
+        return self._iter_many([{self.date_param: d} for d in dates])
+
+    def iter_latest(self) -> Iterator[Dict]:
+        """Yield records from the configured number of latest pages."""
+        return self._iter_many(self.latest_params())
+
+    def fetch_pages(self, pages: Iterable[int]) -> List[Dict]:
+        """Fetch the given page numbers."""
+        return list(self.iter_pages(pages))
+
+    def fetch_dates(self, dates: Iterable[str]) -> List[Dict]:
+        """Fetch one listing page per YYYY-MM-DD date."""
+        return list(self.iter_dates(dates))
+
+    def fetch_latest(self) -> List[Dict]:
+        """Fetch the configured number of latest pages."""
+        return list(self.iter_latest())
+
+    def close(self):
+        """Release pooled connections."""
+        self.session.close()
+
+
+def date_range(start: str, end: str) -> List[str]:
+    """List the YYYY-MM-DD dates from start to end inclusive."""
+    first = datetime.date.fromisoformat(start)
+    last = datetime.date.fromisoformat(end)
+    return [(first + datetime.timedelta(days=n)).isoformat() for n in range((last - first).days + 1)]
+
+
+def main():
+    """Backfill command line entry point."""
+    parser = argparse.ArgumentParser(description="Backfill KLSE price targets")
+    parser.add_argument('--url', default=DEFAULT_URL, help="Listing URL")
+    parser.add_argument('--pages', type=int, default=1, help="Number of pages to fetch")
+    parser.add_argument('--from-date', help="Fetch one page per date starting here (YYYY-MM-DD)")
+    parser.add_argument('--to-date', help="Last date to fetch (YYYY-MM-DD), defaults to today")
+    parser.add_argument('--workers', type=int, default=8, help="Concurrent page fetches")
+    parser.add_argument('--rate', type=float, default=8, help="Requests per second per host")
+    parser.add_argument('--output', help="Write records to this JSON file instead of stdout")
+    parser.add_argument('--no-cache', action='store_true', help="Bypass the on-disk page cache")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    scraper = TargetPriceScraper({
+        'url': args.url,
+        'max_pages': args.pages,
+        'max_workers': args.workers,
+        'requests_per_second': args.rate,
+        'cache': {'enabled': not args.no_cache},
+    })
+    started = time.perf_counter()
+    out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    count = 0
+    try:
+        if args.from_date:
+            to_date = args.to_date or datetime.date.today().isoformat()
+            records = scraper.iter_dates(date_range(args.from_date, to_date))
+        else:
+            records = scraper.iter_latest()
+        # Stream records out as they are parsed instead of holding the whole backfill
+        out.write('[')
+        for record in records:
+            out.write(',\n  ' if count else '\n  ')
+            out.write(json.dumps(record, ensure_ascii=False))
+            count += 1
+        out.write('\n]\n')
+    finally:
+        scraper.close()
+        if out is not sys.stdout:
+            out.close()
+    logger.info(f"Fetched {count} records in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
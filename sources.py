@@ -0,0 +1,282 @@
+"""
+Data sources for KLSE Target Price Monitor
+The scraper, saved klse_data_<date>.json files and the built-in sample behind one interface.
+
+Author: cming401
+License: MIT
+"""
+
+import argparse
+import datetime
+import fnmatch
+import json
+import logging
+import os
+import re
+import tempfile
+from typing import Callable, Dict, Iterator, List, Optional, TextIO, Tuple
+
+from scraper import TargetPriceScraper
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATTERN = 'klse_data_*.json'
+DEFAULT_INDEX = '.cache/klse_data_index.json'
+CHUNK_SIZE = 1 << 16
+
+_DECODER = json.JSONDecoder()
+_SEPARATORS = re.compile(r'[\s,]*')
+_TOP_ARRAY = re.compile(r'\s*\[')
+_HEADER_DATE = re.compile(r'"date"\s*:\s*"(\d{4}-\d{2}-\d{2})"')
+_NAME_DATE = re.compile(r'(\d{4}-\d{2}-\d{2})')
+
+
+def iter_json_array(stream: TextIO, key: Optional[str] = 'data', chunk_size: int = CHUNK_SIZE) -> Iterator:
+    """Yield the items of the top-level `key` array of a JSON document one at a time,
+    or of the document itself when `key` is None and it is an array.
+
+    Only one chunk plus the item being decoded is held in memory, so a file of any
+    size is read in constant space, ijson-style, with the standard library decoder.
+    """
+    buffer = stream.read(chunk_size)
+    if key is None:
+        match = _TOP_ARRAY.match(buffer)
+        if not match:
+            raise ValueError("Expected a JSON array")
+    else:
+        marker = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+        match = marker.search(buffer)
+        while not match:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                return
+            # Keep a tail so a key split across chunks is still found
+            buffer = buffer[-256:] + chunk
+            match = marker.search(buffer)
+
+    pos = match.end()
+    eof = False
+    while True:
+        pos = _SEPARATORS.match(buffer, pos).end()
+        if pos < len(buffer):
+            if buffer[pos] == ']':
+                return
+            try:
+                item, end = _DECODER.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                # A value running to the end of the buffer may continue in the next chunk
+                if end < len(buffer) or eof:
+                    yield item
+                    pos = end
+                    continue
+        if eof:
+            raise ValueError(f"Unterminated '{key or 'top-level'}' array")
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+
+class FileIndex:
+    """Saved data files by name: size, mtime, date and record count.
+
+    Dates come from the file name, or the first chunk of the file when the name has
+    none, so picking the files for a date range never parses them. Record counts are
+    filled in the first time a file is read through, and kept until the file changes.
+    """
+
+    def __init__(self, directory: str, pattern: str = DEFAULT_PATTERN, path: Optional[str] = DEFAULT_INDEX):
+        self.directory = directory
+        self.pattern = pattern
+        self.path = path
+        self.entries: Dict[str, Dict] = {}
+        self.dirty = False
+        if path:
+            self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            self.entries = {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable file index {self.path}: {e}")
+            self.entries = {}
+
+    def save(self):
+        if not self.path or not self.dirty:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+    def refresh(self):
+        """Bring the index in line with the directory: stat every file, read headers of changed ones."""
+        seen = set()
+        try:
+            scan = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            scan = []
+        for entry in scan:
+            if not entry.is_file() or not fnmatch.fnmatch(entry.name, self.pattern):
+                continue
+            seen.add(entry.name)
+            stat = entry.stat()
+            known = self.entries.get(entry.name)
+            if known and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+                continue
+            self.entries[entry.name] = {
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'date': self._file_date(entry.path),
+                'records': None,
+            }
+            self.dirty = True
+        for name in set(self.entries) - seen:
+            del self.entries[name]
+            self.dirty = True
+
+    @staticmethod
+    def _file_date(path: str) -> Optional[str]:
+        match = _NAME_DATE.search(os.path.basename(path))
+        if match:
+            return match.group(1)
+        with open(path, 'r', encoding='utf-8') as f:
+            match = _HEADER_DATE.search(f.read(4096))
+        return match.group(1) if match else None
+
+    def files_between(self, start_date: str, end_date: str) -> List[Tuple[str, str]]:
+        """(date, file path) for files dated within the range, oldest first."""
+        return sorted((entry['date'], os.path.join(self.directory, name))
+                      for name, entry in self.entries.items()
+                      if entry['date'] and start_date <= entry['date'] <= end_date)
+
+    def record_count(self, start_date: str, end_date: str) -> Optional[int]:
+        """Records in the range, or None if some file has not been read yet."""
+        total = 0
+        for name, entry in self.entries.items():
+            if entry['date'] and start_date <= entry['date'] <= end_date:
+                if entry['records'] is None:
+                    return None
+                total += entry['records']
+        return total
+
+    def set_count(self, path: str, records: int):
+        entry = self.entries.get(os.path.basename(path))
+        if entry is not None and entry['records'] != records:
+            entry['records'] = records
+            self.dirty = True
+
+
+class DataSource:
+    """Somewhere target price records come from."""
+
+    name = 'source'
+    # Sample records are never written to history or marked as published data
+    is_sample = False
+
+    def fetch(self, today: str) -> List[Dict]:
+        """Records for a run on `today` (YYYY-MM-DD)."""
+        raise NotImplementedError
+
+    def close(self):
+        """Release anything the source holds open."""
+
+
+class ScraperSource(DataSource):
+    """The live listing, through the monitor's pooled scraper."""
+
+    name = 'scraper'
+
+    def __init__(self, scraper: TargetPriceScraper):
+        self.scraper = scraper
+
+    def fetch(self, today: str) -> List[Dict]:
+        return self.scraper.fetch_latest()
+
+
+class FileSource(DataSource):
+    """klse_data_<date>.json files written by update_data.py, read lazily by date range."""
+
+    name = 'files'
+
+    def __init__(self, files_cfg: dict):
+        self.days = max(1, int(files_cfg.get('days', 1)))
+        self.index = FileIndex(files_cfg.get('dir', '.'), files_cfg.get('pattern', DEFAULT_PATTERN),
+                               files_cfg.get('index_path', DEFAULT_INDEX))
+
+    def iter_file(self, path: str) -> Iterator[Dict]:
+        """Stream one file's records, noting the count in the index once it is read through."""
+        count = 0
+        with open(path, 'r', encoding='utf-8') as f:
+            for item in iter_json_array(f):
+                count += 1
+                yield item
+        self.index.set_count(path, count)
+
+    def iter_range(self, start_date: str, end_date: str) -> Iterator[Dict]:
+        """Stream records from every file dated within the range, oldest file first."""
+        self.index.refresh()
+        try:
+            for _, path in self.index.files_between(start_date, end_date):
+                try:
+                    yield from self.iter_file(path)
+                except (OSError, ValueError) as e:
+                    logger.error(f"Skipping unreadable data file {path}: {e}")
+        finally:
+            self.index.save()
+
+    def fetch(self, today: str) -> List[Dict]:
+        start = (datetime.date.fromisoformat(today) - datetime.timedelta(days=self.days - 1)).isoformat()
+        return list(self.iter_range(start, today))
+
+
+class SampleSource(DataSource):
+    """The monitor's built-in sample data."""
+
+    name = 'sample'
+    is_sample = True
+
+    def __init__(self, loader: Callable[[], List[Dict]]):
+        self.loader = loader
+
+    def fetch(self, today: str) -> List[Dict]:
+        return self.loader()
+
+
+def main():
+    """Index saved data files and print what a date range holds."""
+    parser = argparse.ArgumentParser(description="Inspect saved klse_data_<date>.json files")
+    parser.add_argument('--dir', default='.', help="Directory holding the data files")
+    parser.add_argument('--pattern', default=DEFAULT_PATTERN)
+    parser.add_argument('--index', default=DEFAULT_INDEX, help="File index path")
+    parser.add_argument('--from-date', default='0000-00-00', help="First date (YYYY-MM-DD)")
+    parser.add_argument('--to-date', default='9999-99-99', help="Last date (YYYY-MM-DD)")
+    parser.add_argument('--count', action='store_true', help="Read files not yet counted to fill in record counts")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    source = FileSource({'dir': args.dir, 'pattern': args.pattern, 'index_path': args.index})
+    source.index.refresh()
+    for date, path in source.index.files_between(args.from_date, args.to_date):
+        entry = source.index.entries[os.path.basename(path)]
+        if entry['records'] is None and args.count:
+            for _ in source.iter_file(path):
+                pass
+        records = entry['records']
+        print(f"{date}  {records if records is not None else '?':>8}  {path}")
+    total = source.index.record_count(args.from_date, args.to_date)
+    print(f"Total records: {total if total is not None else 'unknown (run with --count)'}")
+    source.index.save()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Synthetic datasets for KLSE Target Price Monitor
+Realistic price target days of any size for benchmarks and offline runs.
+
+Author: cming401
+License: MIT
+"""
+
+import itertools
+import os
+import random
+from collections import Counter
+from typing import Dict, Iterator, List, Tuple
+
+from fixture_server import ANALYSTS, STOCKS, render_listing
+
+# A listing row: date, code, name, current, target, call, analyst, upside text
+Row = Tuple[str, str, str, float, float, str, str, str]
+
+# Upside cells seen (or plausible) on the site that the parser has to survive
+MALFORMED_UPSIDE = [
+    '', '-', 'N/A', '—', '+0.20', '(12.50%)', '+0.2O (4.4%)', '+0.20 (44.44 %)',
+    '0.20 (44.44%', '+1,234.00 (10.00%)', '+∞ (inf%)', '<b>+0.20</b>',
+]
+CALL_WEIGHTS = [('BUY', 60), ('HOLD', 25), ('SELL', 8), ('TRADING BUY', 4), ('Outperform', 2), ('', 1)]
+
+
+def _universe(stocks: int, analysts: int) -> Tuple[List[Tuple[str, str]], List[str]]:
+    """The real fixture names first, topped up with generated ones."""
+    stock_list = list(STOCKS[:stocks]) + [(f"S{i:04d}", f"SYNTHETIC HOLDINGS {i} BERHAD")
+                                          for i in range(max(0, stocks - len(STOCKS)))]
+    analyst_list = ANALYSTS[:analysts] + [f"BROKER {i}" for i in range(max(0, analysts - len(ANALYSTS)))]
+    return stock_list, analyst_list
+
+
+def _zipf_weights(n: int, skew: float) -> List[float]:
+    """Cumulative weights where the k-th item is picked in proportion to 1 / k**skew."""
+    return list(itertools.accumulate(1.0 / (k ** skew) for k in range(1, n + 1)))
+
+
+def generate_rows(count: int, date: str, seed: int = 42, stocks: int = 800, analysts: int = 25,
+                  skew: float = 1.1, malformed_pct: float = 2.0) -> Iterator[Row]:
+    """Yield `count` listing rows for one day.
+
+    Stocks and analysts follow a Zipf-like distribution (`skew` 0 is uniform), so a few
+    big caps collect many calls while the long tail gets one. About `malformed_pct`
+    percent of upside cells are replaced by malformed text.
+    """
+    rng = random.Random(seed)
+    stock_list, analyst_list = _universe(stocks, analysts)
+    stock_weights = _zipf_weights(len(stock_list), skew)
+    analyst_weights = _zipf_weights(len(analyst_list), skew)
+    calls, call_weights = zip(*CALL_WEIGHTS)
+    call_weights = list(itertools.accumulate(call_weights))
+    # Each stock trades near its own price level
+    levels = [rng.lognormvariate(0.5, 1.0) for _ in stock_list]
+
+    batch = 4096
+    for offset in range(0, count, batch):
+        size = min(batch, count - offset)
+        picks = rng.choices(range(len(stock_list)), cum_weights=stock_weights, k=size)
+        brokers = rng.choices(analyst_list, cum_weights=analyst_weights, k=size)
+        call_picks = rng.choices(calls, cum_weights=call_weights, k=size)
+        for i, analyst, call in zip(picks, brokers, call_picks):
+            code, name = stock_list[i]
+            cur = round(max(0.005, levels[i] * rng.uniform(0.9, 1.1)), 3)
+            tgt = round(cur * rng.uniform(0.6, 1.8), 3)
+            if rng.random() * 100 < malformed_pct:
+                upside = rng.choice(MALFORMED_UPSIDE)
+            else:
+                diff = tgt - cur
+                upside = f"{diff:+.2f} ({diff / cur * 100:.2f}%)"
+            yield (date, code, name, cur, tgt, call, analyst, upside)
+
+
+def generate_dicts(count: int, date: str, **kwargs) -> Iterator[Dict]:
+    """Yield rows in the scraper's record dict shape (prices as 2-decimal strings)."""
+    for date_, code, name, cur, tgt, call, analyst, upside in generate_rows(count, date, **kwargs):
+        yield {
+            'date': date_,
+            'stock_code': code,
+            'stock_name': name,
+            'current_price': f"{cur:.2f}",
+            'target_price': f"{tgt:.2f}",
+            'upside_downside': upside,
+            'price_call': call,
+            'analyst': analyst,
+        }
+
+
+def write_pages(directory: str, rows: Iterator[Row], rows_per_page: int = 500) -> int:
+    """Write rows as page_<n>.html listing files for the fixture server; returns the page count."""
+    os.makedirs(directory, exist_ok=True)
+    pages = 0
+    while True:
+        chunk = list(itertools.islice(rows, rows_per_page))
+        if not chunk and pages:
+            return pages
+        pages += 1
+        with open(os.path.join(directory, f"page_{pages}.html"), 'w', encoding='utf-8') as f:
+            f.write(render_listing(chunk))
+        if len(chunk) < rows_per_page:
+            return pages
+
+
+def listing_date(iso_date: str) -> str:
+    """A YYYY-MM-DD date as the listing shows it (DD/MM/YYYY)."""
+    year, month, day = iso_date.split('-')
+    return f"{day}/{month}/{year}"
+
+
+def dataset_summary(rows: List[Row]) -> Dict[str, int]:
+    """Shape of a generated dataset, for benchmark reports."""
+    per_stock = Counter(row[1] for row in rows)
+    return {
+        'rows': len(rows),
+        'stocks': len(per_stock),
+        'analysts': len({row[6] for row in rows}),
+        'max_calls_per_stock': max(per_stock.values(), default=0),
+        'malformed_upside': sum(1 for row in rows if row[7] in MALFORMED_UPSIDE),
+    }
@@ -0,0 +1,326 @@
+"""
+Telegram sender for KLSE Target Price Monitor
+Rate-limited Bot API client with 429 handling and a durable outbox.
+
+Author: cming401
+License: MIT
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Sequence, Set, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_API_BASE = "https://api.telegram.org"
+
+# Outcomes of a send
+SENT = 'sent'
+QUEUED = 'queued'
+FAILED = 'failed'
+
+# Payload key holding {form field: file path} to upload; stored in the outbox with the rest
+FILES_KEY = '_files'
+# Most photos Telegram takes in one sendMediaGroup album
+MEDIA_GROUP_MAX = 10
+
+OUTBOX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id    TEXT NOT NULL,
+    method     TEXT NOT NULL,
+    payload    TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    attempts   INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, then take it."""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class Outbox:
+    """SQLite-backed queue of messages that have not been confirmed by Telegram yet."""
+
+    def __init__(self, path: str = 'telegram_queue.db'):
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(OUTBOX_SCHEMA)
+
+    def put(self, chat_id: str, method: str, payload: Dict) -> int:
+        with self._lock, self.conn:
+            cursor = self.conn.execute(
+                'INSERT INTO outbox (chat_id, method, payload, created_at) VALUES (?, ?, ?, ?)',
+                (str(chat_id), method, json.dumps(payload, ensure_ascii=False), time.time()))
+            return cursor.lastrowid
+
+    def pending(self):
+        with self._lock:
+            return self.conn.execute(
+                'SELECT id, chat_id, method, payload FROM outbox ORDER BY id').fetchall()
+
+    def files(self) -> Set[str]:
+        """Absolute paths of the files queued messages will upload."""
+        with self._lock:
+            rows = self.conn.execute('SELECT payload FROM outbox WHERE payload LIKE ?',
+                                     (f'%"{FILES_KEY}"%',)).fetchall()
+        paths = set()
+        for (payload,) in rows:
+            paths.update(os.path.abspath(path) for path in json.loads(payload).get(FILES_KEY, {}).values())
+        return paths
+
+    def attempted(self, message_id: int):
+        with self._lock, self.conn:
+            self.conn.execute('UPDATE outbox SET attempts = attempts + 1 WHERE id = ?', (message_id,))
+
+    def remove(self, message_id: int):
+        with self._lock, self.conn:
+            self.conn.execute('DELETE FROM outbox WHERE id = ?', (message_id,))
+
+    def close(self):
+        self.conn.close()
+
+
+class TelegramSender:
+    """Sends Bot API requests over a keep-alive session within Telegram's rate limits.
+
+    Every message is written to the outbox before it is sent and removed once Telegram
+    accepts it, so messages interrupted by a crash or an outage go out on the next flush.
+    """
+
+    def __init__(self, token: str, api_base: str = DEFAULT_API_BASE, queue_path: str = 'telegram_queue.db',
+                 per_chat_per_minute: float = 20, chat_burst: float = 3, global_per_second: float = 30,
+                 max_retries: int = 5, timeout: float = 20):
+        self.base_url = f"{api_base.rstrip('/')}/bot{token}"
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.global_bucket = TokenBucket(global_per_second, global_per_second)
+        self.chat_rate = per_chat_per_minute / 60.0
+        self.chat_burst = chat_burst
+        self._chat_buckets: Dict[str, TokenBucket] = {}
+        self._chat_lock = threading.Lock()
+        # Chats with a message left in the outbox; new messages to them queue behind it
+        self._stalled: Set[str] = set()
+        self.outbox = Outbox(queue_path) if queue_path else None
+        self.stats = {'sent': 0, 'retries': 0, 'rate_limited': 0}
+        self._stats_lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, telegram_cfg: dict) -> 'TelegramSender':
+        """Build a sender from the `telegram` config block."""
+        return cls(
+            telegram_cfg['bot_token'],
+            api_base=telegram_cfg.get('api_base', DEFAULT_API_BASE),
+            queue_path=telegram_cfg.get('queue_path', 'telegram_queue.db'),
+            per_chat_per_minute=float(telegram_cfg.get('per_chat_per_minute', 20)),
+            chat_burst=float(telegram_cfg.get('chat_burst', 3)),
+            global_per_second=float(telegram_cfg.get('global_per_second', 30)),
+            max_retries=int(telegram_cfg.get('max_retries', 5)),
+        )
+
+    def _count(self, key: str):
+        with self._stats_lock:
+            self.stats[key] += 1
+        METRICS.inc('telegram_' + key)
+
+    def _chat_bucket(self, chat_id: str) -> TokenBucket:
+        with self._chat_lock:
+            bucket = self._chat_buckets.get(chat_id)
+            if bucket is None:
+                bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+            return bucket
+
+    def _call(self, method: str, payload: Dict) -> str:
+        """POST one Bot API request, honouring 429 retry_after and backing off on network errors."""
+        chat_id = str(payload.get('chat_id', ''))
+        url = f"{self.base_url}/{method}"
+        data, files = payload, None
+        if FILES_KEY in payload:
+            data = {k: v for k, v in payload.items() if k != FILES_KEY}
+            try:
+                files = _read_files(payload[FILES_KEY])
+            except OSError as e:
+                logger.error(f"Cannot upload files for Telegram {method}: {e}")
+                return FAILED
+        for attempt in range(1, self.max_retries + 1):
+            self._chat_bucket(chat_id).acquire()
+            self.global_bucket.acquire()
+            started = time.perf_counter()
+            try:
+                response = self.session.post(url, data=data, files=files, timeout=self.timeout)
+            except requests.RequestException as e:
+                logger.error(f"Network error calling Telegram {method} (attempt {attempt}/{self.max_retries}): {e}")
+                if attempt < self.max_retries:
+                    self._count('retries')
+                    time.sleep(min(30.0, 1.5 * 2 ** (attempt - 1)))
+                continue
+            if METRICS.enabled:
+                METRICS.observe('telegram_request_seconds', time.perf_counter() - started)
+                METRICS.inc('telegram_bytes_sent', len(response.request.body or b''))
+
+            try:
+                result = response.json()
+            except ValueError:
+                result = {}
+            if response.status_code == 429:
+                retry_after = (result.get('parameters') or {}).get('retry_after') \
+                    or response.headers.get('Retry-After') or 1
+                self._count('rate_limited')
+                logger.warning(f"Telegram rate limited {method} for chat {chat_id}, retrying after {retry_after}s")
+                time.sleep(float(retry_after))
+                continue
+            if response.status_code >= 500:
+                logger.error(f"Telegram server error {response.status_code} (attempt {attempt}/{self.max_retries})")
+                if attempt < self.max_retries:
+                    self._count('retries')
+                    time.sleep(min(30.0, 1.5 * 2 ** (attempt - 1)))
+                continue
+            if result.get('ok'):
+                self._count('sent')
+                return SENT
+            logger.error(f"Telegram API error: {result or response.text}")
+            return FAILED
+        return QUEUED
+
+    def _deliver(self, message_id: Optional[int], method: str, payload: Dict) -> str:
+        status = self._call(method, payload)
+        if self.outbox is not None and message_id is not None:
+            if status == QUEUED:
+                self.outbox.attempted(message_id)
+            else:
+                # Delivered, or rejected for good (bad request, blocked bot): never resend
+                self.outbox.remove(message_id)
+        return status
+
+    def send(self, method: str, payload: Dict) -> str:
+        """Queue and send one Bot API request; returns SENT, QUEUED (retry on next flush) or FAILED.
+
+        Once a request to a chat is left queued, later requests to that chat are only
+        queued behind it, so the next flush delivers them in their original order.
+        """
+        chat_id = str(payload.get('chat_id', ''))
+        message_id = self.outbox.put(chat_id, method, payload) if self.outbox else None
+        if message_id is not None:
+            with self._chat_lock:
+                stalled = chat_id in self._stalled
+            if stalled:
+                return QUEUED
+        status = self._deliver(message_id, method, payload)
+        if status == QUEUED and message_id is not None:
+            with self._chat_lock:
+                self._stalled.add(chat_id)
+        return status
+
+    def send_message(self, chat_id: str, text: str, **params) -> str:
+        """Send a text message to one chat."""
+        payload = {'chat_id': chat_id, 'text': text}
+        payload.update(params)
+        return self.send('sendMessage', payload)
+
+    def send_photos(self, chat_id: str, photos: Sequence[Tuple[str, str]]) -> str:
+        """Upload (path, caption) photos to one chat as sendMediaGroup albums of up to ten,
+        or with sendPhoto when there is only one; returns the worst status of the requests."""
+        statuses = []
+        for start in range(0, len(photos), MEDIA_GROUP_MAX):
+            group = photos[start:start + MEDIA_GROUP_MAX]
+            if len(group) == 1:
+                path, caption = group[0]
+                payload = {'chat_id': chat_id, FILES_KEY: {'photo': path}}
+                if caption:
+                    payload['caption'] = caption
+                statuses.append(self.send('sendPhoto', payload))
+                continue
+            media = []
+            for i, (path, caption) in enumerate(group):
+                item = {'type': 'photo', 'media': f"attach://photo{i}"}
+                if caption:
+                    item['caption'] = caption
+                media.append(item)
+            statuses.append(self.send('sendMediaGroup', {
+                'chat_id': chat_id,
+                'media': json.dumps(media),
+                FILES_KEY: {f"photo{i}": path for i, (path, _) in enumerate(group)},
+            }))
+        for status in (FAILED, QUEUED):
+            if status in statuses:
+                return status
+        return SENT
+
+    def queued_files(self) -> Set[str]:
+        """Files that messages waiting in the outbox still have to upload; they must be kept."""
+        return self.outbox.files() if self.outbox is not None else set()
+
+    def flush(self) -> int:
+        """Send messages left in the outbox by earlier runs, oldest first; returns how many went out."""
+        if self.outbox is None:
+            return 0
+        pending = self.outbox.pending()
+        if not pending:
+            return 0
+        logger.info(f"Flushing {len(pending)} queued Telegram messages")
+        sent = 0
+        stalled = set()
+        for message_id, chat_id, method, payload in pending:
+            if chat_id in stalled:
+                # Keep per-chat order: nothing newer goes out before an older message
+                continue
+            status = self._deliver(message_id, method, json.loads(payload))
+            if status == SENT:
+                sent += 1
+            elif status == QUEUED:
+                stalled.add(chat_id)
+        # Chats drained by this flush take new messages directly again
+        with self._chat_lock:
+            self._stalled = stalled
+        return sent
+
+    def close(self):
+        self.session.close()
+        if self.outbox is not None:
+            self.outbox.close()
+
+
+def _read_files(files: Dict[str, str]) -> Dict[str, Tuple[str, bytes]]:
+    """Read files to upload into memory once, so retries resend the same bytes."""
+    uploads = {}
+    for field_name, path in files.items():
+        with open(path, 'rb') as f:
+            uploads[field_name] = (os.path.basename(path), f.read())
+    return uploads
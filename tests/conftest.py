@@ -0,0 +1,26 @@
+"""
+Test setup for KLSE Target Price Monitor
+Puts the repository root on sys.path so the tests import its modules directly, and
+provides the local fake Bot API.
+
+Author: cming401
+License: MIT
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_telegram import start_fake_telegram  # noqa: E402
+
+
+@pytest.fixture
+def telegram():
+    """A running fake Bot API: (server, api_base)."""
+    server, api_base = start_fake_telegram()
+    yield server, api_base
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,57 @@
+"""
+Tests for chart images
+Checks that pruning the chart cache keeps PNGs still queued for upload.
+
+Author: cming401
+License: MIT
+"""
+
+import os
+
+from charts import ChartRenderer
+from fake_telegram import start_fake_telegram
+from telegram_sender import QUEUED, SENT, TelegramSender
+
+
+def write_pngs(directory, count):
+    """`count` placeholder PNGs, oldest first."""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"{i:02d}-upside.png")
+        with open(path, 'wb') as f:
+            f.write(b'\x89PNG' + bytes([i]))
+        os.utime(path, (1_000_000 + i, 1_000_000 + i))
+        paths.append(path)
+    return paths
+
+
+def test_prune_drops_oldest_beyond_max_files(tmp_path):
+    paths = write_pngs(str(tmp_path / 'charts'), 5)
+    ChartRenderer(str(tmp_path / 'charts'), max_files=2).prune()
+
+    assert [os.path.exists(path) for path in paths] == [False, False, False, True, True]
+
+
+def test_prune_keeps_charts_queued_in_the_outbox(tmp_path, telegram):
+    server, api_base = telegram
+    paths = write_pngs(str(tmp_path / 'charts'), 5)
+    offline, offline_api = start_fake_telegram()
+    offline.shutdown()
+    offline.server_close()
+    sender = TelegramSender('test', api_base=offline_api, queue_path=str(tmp_path / 'queue.db'),
+                            per_chat_per_minute=0, global_per_second=0, max_retries=1)
+    try:
+        assert sender.send_photos('1', [(paths[0], 'top movers'), (paths[1], '')]) == QUEUED
+        ChartRenderer(str(tmp_path / 'charts'), max_files=2, in_use=sender.queued_files).prune()
+        assert [os.path.exists(path) for path in paths] == [True, True, False, True, True]
+
+        # The next run uploads the album from the kept files
+        sender.base_url = f"{api_base}/bottest"
+        assert sender.flush() == 1
+        assert sender.queued_files() == set()
+        assert sender.send_message('1', 'next') == SENT
+    finally:
+        sender.close()
+    assert [m['method'] for m in server.messages] == ['sendMediaGroup', 'sendMessage']
+    assert sorted(server.messages[0]['files']) == ['photo0', 'photo1']
@@ -0,0 +1,79 @@
+"""
+Tests for message chunking
+Checks that split reports stay within Telegram's limit with balanced tags and whole entities.
+
+Author: cming401
+License: MIT
+"""
+
+import re
+
+import pytest
+
+from chunking import TELEGRAM_LIMIT, split_blocks, truncate_blocks
+
+TAG = re.compile(r'</?pre>')
+BROKEN_ENTITY = re.compile(r'&(?!(?:[a-z]+|#\d+);)')
+
+
+def assert_balanced(part):
+    """Every <pre> in the part is closed before the next one opens, and by the part's end."""
+    depth = 0
+    for tag in TAG.findall(part):
+        depth += 1 if tag == '<pre>' else -1
+        assert depth in (0, 1), part
+    assert depth == 0, part
+
+
+def content(parts):
+    return ''.join(TAG.sub('', part) for part in parts)
+
+
+def test_long_table_splits_into_balanced_parts():
+    blocks = [("📊 <b>KLSE target prices</b>\n", None)]
+    for i in range(200):
+        blocks.append((f"\n<b>STOCK{i}</b>\n", None))
+        blocks.extend((f"  BROKER {j:<10} RM{i + j:>7.2f} → RM{i * 1.1 + j:>7.2f}  BUY\n", 'pre') for j in range(3))
+    parts = split_blocks(blocks)
+
+    assert len(parts) > 1
+    for part in parts:
+        assert len(part) <= TELEGRAM_LIMIT
+        assert_balanced(part)
+    assert content(parts) == ''.join(text for text, _ in blocks)
+
+
+@pytest.mark.parametrize('tag', ['pre', None])
+def test_line_longer_than_limit_is_cut(tag):
+    line = 'x' * (2 * TELEGRAM_LIMIT + 100)
+    blocks = [('header\n', None), (line, tag), ('footer\n', None)]
+    parts = split_blocks(blocks)
+
+    assert len(parts) >= 3
+    for part in parts:
+        assert len(part) <= TELEGRAM_LIMIT
+        assert_balanced(part)
+    assert content(parts) == 'header\n' + line + 'footer\n'
+
+
+@pytest.mark.parametrize('offset', range(6))
+def test_entities_are_not_cut_at_a_boundary(offset):
+    # Shift the entities against the limit so some cut lands inside each of them
+    line = 'x' * offset + '&amp;&lt;&gt;&#128200;' * 60
+    parts = split_blocks([(line, 'pre')], limit=100)
+
+    assert len(parts) > 1
+    for part in parts:
+        assert len(part) <= 100
+        assert_balanced(part)
+        assert not BROKEN_ENTITY.search(part), part
+    assert content(parts) == line
+
+
+def test_truncate_keeps_whole_blocks_within_limit():
+    blocks = [(f"row {i}\n", 'pre') for i in range(1000)]
+    message = truncate_blocks(blocks, limit=500)
+
+    assert len(message) <= 500
+    assert message.endswith("(truncated to fit Telegram limit)")
+    assert_balanced(message)
@@ -0,0 +1,46 @@
+"""
+Tests for delta tracking
+Checks the published index's per-destination diffs and its retention.
+
+Author: cming401
+License: MIT
+"""
+
+import datetime
+import json
+
+from delta import PublishedIndex, fingerprint
+from models import TargetPrice
+from scheduler import MYT
+
+
+def call(stock_code, target_price, date, analyst='HLIB'):
+    return {'date': date, 'stock_code': stock_code, 'target_price': target_price,
+            'price_call': 'BUY', 'analyst': analyst}
+
+
+def test_prune_counts_days_in_myt(tmp_path):
+    today = datetime.datetime.now(MYT).date()
+    oldest_kept = (today - datetime.timedelta(days=30)).isoformat()
+    too_old = (today - datetime.timedelta(days=31)).isoformat()
+    index = PublishedIndex(str(tmp_path / 'published.json'), retention_days=30)
+    index.mark_published([call('MAYBANK', '11.40', oldest_kept), call('CIMB', '7.00', too_old),
+                          call('TENAGA', '14.00', 'yesterday')], 'chat')
+
+    saved = json.loads((tmp_path / 'published.json').read_text(encoding='utf-8'))
+    # Entries without an ISO date are kept rather than guessed at
+    assert sorted(saved['destinations']['chat']) == ['MAYBANK\tHLIB', 'TENAGA\tHLIB']
+
+
+def test_legacy_index_seeds_each_destination(tmp_path):
+    path = tmp_path / 'published.json'
+    cimb = call('CIMB', '7.00', '2026-10-16')
+    # The flat format written before per-destination tracking
+    path.write_text(json.dumps({'CIMB\tHLIB': {'fingerprint': fingerprint(TargetPrice.coerce(cimb)),
+                                                 'date': '2026-10-16'}}), encoding='utf-8')
+    maybank = call('MAYBANK', '11.40', '2026-10-16')
+    PublishedIndex(str(path)).mark_published([maybank], 'a')
+
+    index = PublishedIndex(str(path))
+    assert index.diff([cimb, maybank], 'a').changed == []
+    assert [rec.stock_code for rec in index.diff([cimb, maybank], 'b').changed] == ['MAYBANK']
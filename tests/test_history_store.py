@@ -0,0 +1,70 @@
+"""
+Tests for the history store
+Checks that the daily report reads one call per analyst and stock from history.
+
+Author: cming401
+License: MIT
+"""
+
+import datetime
+
+import pytest
+
+import history_store
+from history_store import HistoryStore
+
+
+def call(stock_code, analyst, target_price, date='2026-10-16'):
+    return {'date': date, 'stock_code': stock_code, 'stock_name': stock_code, 'current_price': '1.00',
+            'target_price': target_price, 'upside_downside': '', 'price_call': 'BUY', 'analyst': analyst}
+
+
+@pytest.fixture
+def store(tmp_path):
+    with HistoryStore(str(tmp_path / 'history.db')) as store:
+        yield store
+
+
+def targets(records):
+    return [(rec.stock_code, rec.analyst, rec.target_price) for rec in records]
+
+
+def at(monkeypatch, clock):
+    """Make the store stamp rows with `clock`."""
+    class Clock(datetime.datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return cls.fromisoformat(clock)
+    monkeypatch.setattr(history_store.datetime, 'datetime', Clock)
+
+
+def test_intraday_revision_reports_latest_target(store, monkeypatch):
+    at(monkeypatch, '2026-10-16T09:00:00')
+    store.upsert([call('MAYBANK', 'HLIB', '10.90'), call('CIMB', 'HLIB', '7.00')])
+    # The listing still shows the old target below the revision
+    at(monkeypatch, '2026-10-16T10:00:00')
+    store.upsert([call('MAYBANK', 'HLIB', '11.40'), call('MAYBANK', 'HLIB', '10.90'), call('CIMB', 'HLIB', '7.00')])
+
+    # The revised call is a new row, so it now comes after the unchanged one
+    assert targets(store.records_for_date('2026-10-16')) == [
+        ('CIMB', 'HLIB', '7.00'), ('MAYBANK', 'HLIB', '11.40')]
+    # History keeps the superseded target
+    assert len(store.query(stock_code='MAYBANK')) == 2
+
+
+def test_repeated_fetch_picks_the_same_call(store):
+    # Newest first, as on the listing
+    rows = [call('MAYBANK', 'HLIB', '11.40'), call('MAYBANK', 'HLIB', '10.90'), call('CIMB', 'RHB', '7.00')]
+    picked = []
+    for _ in range(3):
+        store.upsert(rows)
+        picked.append(targets(store.records_for_date('2026-10-16')))
+
+    assert picked[0] == [('MAYBANK', 'HLIB', '11.40'), ('CIMB', 'RHB', '7.00')]
+    assert picked[1] == picked[0] and picked[2] == picked[0]
+
+
+def test_records_for_date_ignores_other_days(store):
+    store.upsert([call('MAYBANK', 'HLIB', '10.90', '2026-10-15'), call('MAYBANK', 'HLIB', '11.40')])
+
+    assert targets(store.records_for_date('2026-10-15')) == [('MAYBANK', 'HLIB', '10.90')]
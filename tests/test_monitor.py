@@ -0,0 +1,154 @@
+"""
+Tests for the monitor's runs
+Runs the monitor end to end against the fixture server and the fake Bot API.
+
+Author: cming401
+License: MIT
+"""
+
+import datetime
+import json
+import re
+
+import pytest
+
+from fake_telegram import start_fake_telegram
+from delivery import DeliveryResult, FanOut
+from fixture_server import start_fixture_server
+from klse_monitor import KLSETargetPriceMonitor
+from scheduler import MYT
+from synthetic import generate_rows, listing_date, write_pages
+from telegram_sender import FAILED
+
+
+@pytest.fixture(scope='module')
+def listing(tmp_path_factory):
+    """Today's synthetic listing on the fixture server: (url, page count, rows).
+
+    Its skewed picks give several analysts more than one target for a stock.
+    """
+    directory = tmp_path_factory.mktemp('pages')
+    today = datetime.datetime.now(MYT).strftime('%Y-%m-%d')
+    rows = list(generate_rows(300, listing_date(today), seed=3, stocks=40, analysts=5))
+    pages = write_pages(str(directory), iter(rows), 100)
+    server, url = start_fixture_server(directory=str(directory))
+    yield url, pages, rows
+    server.shutdown()
+    server.server_close()
+
+
+def make_monitor(state, api_base, listing, **sections) -> KLSETargetPriceMonitor:
+    """A monitor reading `listing`, sending to `api_base` and keeping its files in `state`."""
+    url, pages, _ = listing
+    config = {
+        'telegram': {'bot_token': 'test', 'channel_id': '-100', 'chat_id': '', 'api_base': api_base,
+                     'queue_path': str(state / 'queue.db'), 'per_chat_per_minute': 0, 'global_per_second': 0,
+                     'max_retries': 1},
+        'data_source': {'url': url, 'max_pages': pages, 'requests_per_second': 0,
+                        'fallback_to_sample': False, 'cache': {'enabled': False}},
+        'history': {'enabled': True, 'path': str(state / 'history.db')},
+        'delta': {'enabled': True, 'path': str(state / 'published.json')},
+        'schedule': {'weekdays_only': False},
+        'message': {'parse_mode': 'HTML', 'split_long_messages': True},
+    }
+    for name, section in sections.items():
+        config.setdefault(name, {}).update(section)
+    config_path = state / 'config.json'
+    config_path.write_text(json.dumps(config), encoding='utf-8')
+    return KLSETargetPriceMonitor(str(config_path))
+
+
+def run(monitor: KLSETargetPriceMonitor):
+    try:
+        monitor.run_monitor()
+    finally:
+        monitor.close()
+
+
+@pytest.mark.parametrize('history', [True, False])
+def test_same_listing_twice_sends_nothing_new(listing, telegram, tmp_path, history):
+    server, api_base = telegram
+    keys = [(row[1], row[6]) for row in listing[2]]
+    assert len(set(keys)) < len(keys)
+
+    run(make_monitor(tmp_path, api_base, listing, history={'enabled': history}))
+    first = len(server.messages)
+    run(make_monitor(tmp_path, api_base, listing, history={'enabled': history}))
+
+    assert first > 0
+    assert len(server.messages) == first
+
+
+def chat_texts(server, chat_id='-100'):
+    """Texts sent to one chat, minus the report's clock time."""
+    return [re.sub(r'\d{2}:\d{2} MYT', 'HH:MM MYT', m['params'].get('text', ''))
+            for m in server.messages if str(m['params']['chat_id']) == chat_id]
+
+
+def test_report_queued_while_offline_is_sent_once(listing, telegram, tmp_path):
+    server, api_base = telegram
+    # Stopped, so every connection is refused
+    offline, offline_api = start_fake_telegram()
+    offline.shutdown()
+    offline.server_close()
+    (tmp_path / 'reference').mkdir()
+    (tmp_path / 'state').mkdir()
+
+    run(make_monitor(tmp_path / 'reference', api_base, listing))
+    expected = chat_texts(server)
+    server.messages.clear()
+
+    run(make_monitor(tmp_path / 'state', offline_api, listing))
+    run(make_monitor(tmp_path / 'state', api_base, listing))
+    run(make_monitor(tmp_path / 'state', api_base, listing))
+
+    assert expected
+    assert chat_texts(server) == expected
+
+
+def alerts_cfg(state):
+    return {'enabled': True, 'path': str(state / 'alerted.json'),
+            'rules': [{'name': 'Everything', 'chat_id': '555', 'calls': ['BUY', 'HOLD', 'SELL']}]}
+
+
+def test_alerts_are_not_repeated_when_delta_is_off(listing, telegram, tmp_path):
+    server, api_base = telegram
+    sent = []
+    for _ in range(3):
+        run(make_monitor(tmp_path, api_base, listing, alerts=alerts_cfg(tmp_path), delta={'enabled': False}))
+        sent.append((len(chat_texts(server)), chat_texts(server, '555')))
+
+    # The report goes out in full every run, the alert only the first time
+    assert sent[0][0] and sent[2][0] == 3 * sent[0][0]
+    assert sent[0][1] and sent[2][1] == sent[0][1]
+
+
+def test_alerts_are_not_repeated_for_a_failed_report(listing, telegram, tmp_path, monkeypatch):
+    server, api_base = telegram
+    send_one = FanOut.send_one
+
+    def reject_report(fanout, destination, parts, params):
+        if destination.chat_id == '-200':
+            return DeliveryResult(destination, FAILED, 'rejected')
+        return send_one(fanout, destination, parts, params)
+
+    monkeypatch.setattr(FanOut, 'send_one', reject_report)
+    destinations = {'destinations': [{'chat_id': '-100'}, {'chat_id': '-200'}]}
+    for _ in range(2):
+        run(make_monitor(tmp_path, api_base, listing, telegram=destinations, alerts=alerts_cfg(tmp_path)))
+
+    alerts = chat_texts(server, '555')
+    assert alerts
+    assert len(alerts) == len(set(alerts))
+
+
+def test_sample_data_is_never_alerted(listing, telegram, tmp_path):
+    server, api_base = telegram
+    offline, offline_url = start_fixture_server()
+    offline.shutdown()
+    offline.server_close()
+    source = {'url': offline_url, 'fallback_to_sample': True}
+    run(make_monitor(tmp_path, api_base, listing, data_source=source, alerts=alerts_cfg(tmp_path)))
+
+    assert chat_texts(server)
+    assert chat_texts(server, '555') == []
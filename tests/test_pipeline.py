@@ -0,0 +1,85 @@
+"""
+Tests for the async pipeline
+Runs the sync and async modes on one synthetic day and compares what each chat receives.
+
+Author: cming401
+License: MIT
+"""
+
+import datetime
+import json
+import re
+
+import pytest
+
+from fake_telegram import start_fake_telegram
+from fixture_server import start_fixture_server
+from klse_monitor import KLSETargetPriceMonitor
+from scheduler import MYT
+from synthetic import generate_rows, listing_date, write_pages
+
+DESTINATIONS = 6
+
+
+@pytest.fixture(scope='module')
+def listing(tmp_path_factory):
+    """Today's synthetic listing on the fixture server: (url, page count)."""
+    directory = tmp_path_factory.mktemp('pages')
+    today = datetime.datetime.now(MYT).strftime('%Y-%m-%d')
+    pages = write_pages(str(directory), generate_rows(1500, listing_date(today), seed=7), 100)
+    server, url = start_fixture_server(directory=str(directory))
+    yield url, pages
+    server.shutdown()
+    server.server_close()
+
+
+def chat_messages(messages):
+    """Accepted messages per chat in arrival order, minus the report's clock time."""
+    chats = {}
+    for message in messages:
+        params = message['params']
+        text = re.sub(r'\d{2}:\d{2} MYT', 'HH:MM MYT', params.get('text', ''))
+        chats.setdefault(str(params['chat_id']), []).append(
+            (message['method'], text, params.get('parse_mode'), params.get('reply_markup')))
+    return chats
+
+
+def run_mode(mode, listing, state):
+    url, pages = listing
+    telegram, api_base = start_fake_telegram()
+    config = {
+        'telegram': {'bot_token': 'test', 'channel_id': '-100', 'chat_id': '', 'api_base': api_base,
+                     'queue_path': str(state / 'queue.db'), 'per_chat_per_minute': 0, 'global_per_second': 0,
+                     'destinations': [{'chat_id': str(1000 + i), 'message': {
+                         'upside_threshold_pct': 5 * (i % 3), 'max_items': 10 + i % 2 * 20}}
+                         for i in range(DESTINATIONS)]},
+        'data_source': {'url': url, 'max_pages': pages, 'max_workers': 4, 'requests_per_second': 0,
+                        'fallback_to_sample': False, 'cache': {'enabled': False}},
+        'history': {'enabled': True, 'path': str(state / 'history.db')},
+        'delta': {'enabled': True, 'path': str(state / 'published.json')},
+        'schedule': {'weekdays_only': False},
+        'message': {'parse_mode': 'HTML', 'split_long_messages': True, 'include_buttons': True},
+        'pipeline': {'mode': mode},
+    }
+    config_path = state / 'config.json'
+    config_path.write_text(json.dumps(config), encoding='utf-8')
+    monitor = KLSETargetPriceMonitor(str(config_path))
+    try:
+        monitor.run_monitor()
+    finally:
+        monitor.close()
+        telegram.shutdown()
+        telegram.server_close()
+    return chat_messages(telegram.messages)
+
+
+def test_async_mode_sends_what_sync_mode_sends(listing, tmp_path):
+    sent = {}
+    for mode in ('sync', 'async'):
+        state = tmp_path / mode
+        state.mkdir()
+        sent[mode] = run_mode(mode, listing, state)
+
+    assert sorted(sent['sync']) == [str(1000 + i) for i in range(DESTINATIONS)]
+    assert all(sent['sync'].values())
+    assert sent['async'] == sent['sync']
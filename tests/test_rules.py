@@ -0,0 +1,95 @@
+"""
+Tests for alert rules
+Checks the indexed RuleMatcher against checking every rule on every record.
+
+Author: cming401
+License: MIT
+"""
+
+import random
+
+import pytest
+
+from models import TargetPrice
+from rules import FIELDS, OPS, Rule, RuleMatcher
+from synthetic import generate_dicts
+
+
+def record(stock_code='MAYBANK', analyst='HLIB', call='BUY', target='11.00', upside='+1.00 (10.00%)'):
+    return TargetPrice.from_dict({'date': '2026-10-16', 'stock_code': stock_code, 'stock_name': stock_code,
+                                  'current_price': '10.00', 'target_price': target, 'upside_downside': upside,
+                                  'price_call': call, 'analyst': analyst})
+
+
+def pairs(matches):
+    """Matches as comparable (rule, record) identities; the order of rules within a record may differ."""
+    return sorted((id(rec), id(rule)) for rule, rec in matches)
+
+
+def random_rules(rng, count, codes, analysts):
+    rules = []
+    for i in range(count):
+        entry = {'chat_id': str(i % 40)}
+        if rng.random() < 0.6:
+            entry['stocks'] = rng.sample(codes, rng.randint(1, 4))
+        if rng.random() < 0.3:
+            entry['analysts'] = rng.sample(analysts, rng.randint(1, 2))
+        if rng.random() < 0.3:
+            entry['calls'] = rng.sample(['BUY', 'HOLD', 'SELL'], rng.randint(1, 2))
+        if rng.random() < 0.6:
+            entry['field'] = rng.choice(FIELDS)
+            entry['op'] = rng.choice(list(OPS))
+            entry['value'] = round(rng.uniform(-20, 40) if entry['field'] in ('upside_pct', 'change')
+                                   else rng.uniform(0.2, 8), 2)
+        rules.append(Rule.from_config(entry))
+    return rules
+
+
+def test_matcher_agrees_with_every_rule_scan():
+    rng = random.Random(11)
+    records = [TargetPrice.from_dict(d) for d in generate_dicts(800, '2026-10-16', seed=5, stocks=60, analysts=8)]
+    codes = sorted({rec.stock_code for rec in records})
+    analysts = sorted({rec.analyst for rec in records})
+    rules = random_rules(rng, 600, codes, analysts)
+    # Thresholds right on a record's value exercise the ladders' edges
+    for rec in records[:20]:
+        for op in OPS:
+            rules.append(Rule.from_config({'chat_id': '1', 'stocks': [rec.stock_code],
+                                           'field': 'upside_pct', 'op': op, 'value': rec.upside_pct}))
+
+    naive = [(rule, rec) for rec in records for rule in rules if rule.matches(rec)]
+    assert naive
+    assert pairs(RuleMatcher(rules).match(records)) == pairs(naive)
+
+
+@pytest.mark.parametrize('op, passing', [
+    ('>', [5, 9.99]),
+    ('>=', [5, 9.99, 10]),
+    ('<', [10.01, 20]),
+    ('<=', [10, 10.01, 20]),
+])
+def test_threshold_ladder_edges(op, passing):
+    rules = [Rule.from_config({'chat_id': '1', 'field': 'upside_pct', 'op': op, 'value': value})
+             for value in (5, 9.99, 10, 10.01, 20)]
+    rec = record(upside='+1.00 (10.00%)')
+    assert rec.upside_pct == 10
+
+    matched = sorted(rule.value for rule, _ in RuleMatcher(rules).match([rec]))
+    assert matched == passing
+
+
+def test_rules_are_found_through_each_bucket():
+    by_stock = Rule.from_config({'chat_id': '1', 'stocks': ['maybank', 'CIMB'], 'calls': ['BUY']})
+    by_analyst = Rule.from_config({'chat_id': '2', 'analysts': ['hlib']})
+    by_call = Rule.from_config({'chat_id': '3', 'calls': ['SELL']})
+    anything = Rule.from_config({'chat_id': '4', 'field': 'target', 'op': '>=', 'value': 5})
+    matcher = RuleMatcher([by_stock, by_analyst, by_call, anything])
+
+    def matched(rec):
+        return {rule.chat_id for rule, _ in matcher.match([rec])}
+
+    assert matched(record('MAYBANK', 'HLIB', 'BUY')) == {'1', '2', '4'}
+    assert matched(record('CIMB', 'RHB', 'SELL', target='4.00')) == {'3'}
+    # The stock bucket still checks the rule's other conditions
+    assert matched(record('CIMB', 'RHB', 'HOLD', target='4.00')) == set()
+    assert matched(record('TENAGA', 'RHB', 'BUY', target='14.00')) == {'4'}
@@ -0,0 +1,99 @@
+"""
+Tests for Telegram delivery
+Runs the sender against the local fake Bot API: rate limits, pacing and the outbox.
+
+Author: cming401
+License: MIT
+"""
+
+import time
+
+from delivery import Destination, FanOut
+from fake_telegram import start_fake_telegram
+from telegram_sender import QUEUED, SENT, TelegramSender
+
+
+def make_sender(api_base, tmp_path, **kwargs) -> TelegramSender:
+    options = {'per_chat_per_minute': 0, 'global_per_second': 0, 'max_retries': 3}
+    options.update(kwargs)
+    return TelegramSender('test', api_base=api_base, queue_path=str(tmp_path / 'queue.db'), **options)
+
+
+def dead_api_base() -> str:
+    """The address of a fake Bot API that has been stopped, so connections are refused."""
+    server, api_base = start_fake_telegram()
+    server.shutdown()
+    server.server_close()
+    return api_base
+
+
+def texts(messages, chat_id):
+    return [m['params']['text'] for m in messages if m['params']['chat_id'] == chat_id]
+
+
+def test_429_waits_retry_after(telegram, tmp_path):
+    server, api_base = telegram
+    server.fake_cfg.update(rate_limit_every=2, retry_after=0.3)
+    sender = make_sender(api_base, tmp_path)
+    try:
+        assert sender.send_message('1', 'first') == SENT
+        started = time.monotonic()
+        assert sender.send_message('1', 'second') == SENT
+        elapsed = time.monotonic() - started
+        assert sender.outbox.pending() == []
+    finally:
+        sender.close()
+    assert elapsed >= 0.3
+    assert sender.stats['rate_limited'] == 1
+    assert texts(server.messages, '1') == ['first', 'second']
+
+
+def test_token_bucket_paces_requests(telegram, tmp_path):
+    server, api_base = telegram
+    # Bursts of up to 5, then one request every 0.2s
+    sender = make_sender(api_base, tmp_path, global_per_second=5)
+    started = time.monotonic()
+    try:
+        for i in range(10):
+            assert sender.send_message(str(i % 2), f"message {i}") == SENT
+    finally:
+        sender.close()
+    assert time.monotonic() - started >= 0.9
+    assert len(server.messages) == 10
+
+
+def test_queued_parts_flush_in_chat_order(telegram, tmp_path):
+    server, api_base = telegram
+    sender = make_sender(dead_api_base(), tmp_path, max_retries=1)
+    try:
+        fanout = FanOut(sender)
+        results = fanout.send([(Destination('1'), ['1/3', '2/3', '3/3'], {}),
+                               (Destination('2'), ['1/2', '2/2'], {})])
+        assert [r.status for r in results] == [QUEUED, QUEUED]
+        assert not any(r.delivered for r in results)
+        assert len(sender.outbox.pending()) == 5
+
+        # The next run reaches Telegram and sends the backlog before anything new
+        sender.base_url = f"{api_base}/bottest"
+        assert sender.flush() == 5
+        assert sender.send_message('1', 'next') == SENT
+        assert sender.outbox.pending() == []
+    finally:
+        sender.close()
+    assert texts(server.messages, '1') == ['1/3', '2/3', '3/3', 'next']
+    assert texts(server.messages, '2') == ['1/2', '2/2']
+
+
+def test_chat_burst_is_read_from_config(tmp_path):
+    sender = TelegramSender.from_config({'bot_token': 'test', 'queue_path': str(tmp_path / 'queue.db'),
+                                         'per_chat_per_minute': 60, 'chat_burst': 2})
+    try:
+        bucket = sender._chat_bucket('1')
+        assert (bucket.rate, bucket.capacity) == (1.0, 2.0)
+        started = time.monotonic()
+        for _ in range(3):
+            bucket.acquire()
+        # Two go out at once, the third waits for a token
+        assert time.monotonic() - started >= 0.9
+    finally:
+        sender.close()
@@ -0,0 +1,101 @@
+"""
+Tests for the bulk import
+Checks which rows of a call sheet are imported and which are rejected, with their lines.
+
+Author: cming401
+License: MIT
+"""
+
+import json
+
+import pytest
+
+from history_store import HistoryStore
+from update_data import RowError, import_file
+
+SHEET = """\
+Code,Company,Price,Target,Recommendation,Broker,Date
+MAYBANK,Malayan Banking,RM9.80,RM11.40,Buy,HLIB,2026-10-16
+CIMB,CIMB Group,7.20,8.10,Outperform,RHB,16/10/2026
+GAMUDA,Gamuda,4.50,5.00,Neutral,,2026-10-16
+,No Code,1.00,1.20,Buy,HLIB,2026-10-16
+TENAGA,Tenaga,13.00,-2,Buy,HLIB,2026-10-16
+YINSON,Yinson,2.50,3.10,Maybe,HLIB,2026-10-16
+SIME,Sime Darby,2.40,2.90,Buy,HLIB,someday
+CIMB,CIMB Group,7.25,8.10,Trading Buy,RHB,2026-10-16
+CIMB,CIMB Group,7.25,8.30,Buy,RHB,2026-10-16
+
+"""
+
+
+@pytest.fixture
+def sheet(tmp_path):
+    path = tmp_path / 'calls.csv'
+    path.write_text(SHEET, encoding='utf-8')
+    return str(path)
+
+
+def test_good_rows_are_imported_and_bad_ones_reported(sheet, tmp_path):
+    db = str(tmp_path / 'history.db')
+    records, rejects = import_file(sheet, default_analyst=None, history_path=db)
+
+    assert [(rec.stock_code, rec.analyst, rec.target_price, rec.price_call) for rec in records] == [
+        ('MAYBANK', 'HLIB', '11.40', 'BUY'),
+        ('CIMB', 'RHB', '8.10', 'BUY'),
+        ('CIMB', 'RHB', '8.30', 'BUY'),
+    ]
+    assert [rec.date for rec in records] == ['2026-10-16'] * 3
+    assert [(number, reason) for number, reason, _ in rejects] == [
+        (4, "missing analyst"),
+        (5, "missing stock code"),
+        (6, "bad target price '-2'"),
+        (7, "unknown call 'Maybe'"),
+        (8, "unrecognised date 'someday'"),
+        (9, "duplicate of line 3"),
+    ]
+    assert rejects[0][2]['stock_code'] == 'GAMUDA'
+    with HistoryStore(db) as store:
+        assert len(store.query()) == 3
+
+
+def test_default_analyst_fills_missing_ones(sheet, tmp_path):
+    records, rejects = import_file(sheet, default_analyst='KENANGA', history_path=str(tmp_path / 'history.db'))
+
+    assert ('GAMUDA', 'KENANGA') in [(rec.stock_code, rec.analyst) for rec in records]
+    assert 4 not in [number for number, _, _ in rejects]
+
+
+def test_strict_import_writes_nothing(sheet, tmp_path):
+    db = tmp_path / 'history.db'
+    records, rejects = import_file(sheet, history_path=str(db), strict=True)
+
+    assert records and rejects
+    assert not db.exists()
+
+
+def test_json_lines_import_writes_daily_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    rows = [
+        {'stock_code': 'maybank', 'target_price': '11.40', 'current_price': '9.80', 'price_call': 'ADD',
+         'analyst': 'HLIB', 'date': '2026-10-16'},
+        {'stock_code': 'CIMB', 'target_price': 'n/a', 'price_call': 'BUY', 'analyst': 'RHB', 'date': '2026-10-16'},
+    ]
+    path = tmp_path / 'calls.jsonl'
+    path.write_text('\n'.join(json.dumps(row) for row in rows) + '\n{not json\n[1, 2]\n', encoding='utf-8')
+
+    records, rejects = import_file(str(path))
+
+    assert [rec.stock_code for rec in records] == ['MAYBANK']
+    assert records[0].upside_downside == '+1.60 (16.33%)'
+    assert [number for number, _, _ in rejects] == [2, 3, 4]
+    assert rejects[1][1].startswith('invalid JSON')
+    saved = json.loads((tmp_path / 'klse_data_2026-10-16.json').read_text(encoding='utf-8'))
+    assert [row['stock_code'] for row in saved['data']] == ['MAYBANK']
+
+
+def test_csv_without_target_column_is_refused(tmp_path):
+    path = tmp_path / 'calls.csv'
+    path.write_text("Code,Broker\nMAYBANK,HLIB\n", encoding='utf-8')
+
+    with pytest.raises(RowError):
+        import_file(str(path))
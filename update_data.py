@@ -1,16 +1,255 @@
 #!/usr/bin/env python3
 """
 Manual Data Update Tool for KLSE Target Price Monitor
-Allows users to manually input new target price data.
+Allows users to manually input new target price data, or bulk import call sheets
+from CSV, JSON-lines or JSON files and stdin.
 
 Author: cming401
 License: MIT
 """
 
+import argparse
+import csv
+import io
 import json
 import datetime
-from typing import List, Dict
+import sys
+import time
+from functools import lru_cache
+from typing import IO, Dict, Iterator, List, Optional, Tuple
+
+from history_store import HistoryStore
 from klse_monitor import KLSETargetPriceMonitor
+from models import RECORD_KEYS, PriceCall, TargetPrice, parse_price, parse_upside, trend_direction
+from scraper import HEADER_FIELDS, normalize_date
+from sources import iter_json_array
+
+# Extra header keywords seen on broker call sheets, tried before the listing's own
+IMPORT_HEADER_FIELDS = [
+    ('code', 'stock_code'),
+    ('company', 'stock_name'),
+    ('recommendation', 'price_call'),
+    ('rating', 'price_call'),
+    ('broker', 'analyst'),
+] + HEADER_FIELDS
+
+# Broker wording mapped onto the three calls the monitor reports
+CALL_ALIASES = {
+    'TRADING BUY': PriceCall.BUY, 'OUTPERFORM': PriceCall.BUY, 'OVERWEIGHT': PriceCall.BUY,
+    'ADD': PriceCall.BUY, 'ACCUMULATE': PriceCall.BUY, 'STRONG BUY': PriceCall.BUY,
+    'NEUTRAL': PriceCall.HOLD, 'MARKET PERFORM': PriceCall.HOLD, 'TRADING HOLD': PriceCall.HOLD,
+    'UNDERPERFORM': PriceCall.SELL, 'UNDERWEIGHT': PriceCall.SELL, 'REDUCE': PriceCall.SELL,
+    'TRADING SELL': PriceCall.SELL, 'STRONG SELL': PriceCall.SELL, 'TAKE PROFIT': PriceCall.SELL,
+}
+CALL_NAMES = {**{call.value: call for call in PriceCall}, **CALL_ALIASES}
+
+# Rows handed to the history store per transaction
+HISTORY_BATCH = 5000
+
+
+class RowError(ValueError):
+    """A row that cannot be imported; the message says why."""
+
+
+def map_import_headers(headers: List[str]) -> List[Optional[str]]:
+    """Map CSV header labels to record fields: exact field names first, then keywords."""
+    fields: List[Optional[str]] = []
+    for label in headers:
+        label = (label or '').strip().lower()
+        field = label if label in RECORD_KEYS and label not in fields else None
+        if field is None:
+            for keyword, name in IMPORT_HEADER_FIELDS:
+                if keyword in label and name not in fields:
+                    field = name
+                    break
+        fields.append(field)
+    return fields
+
+
+def _first_char(stream: IO[str]) -> str:
+    """The first non-blank character of a stream, without consuming it."""
+    if stream.seekable():
+        head = stream.read(256)
+        stream.seek(0)
+        return head.lstrip()[:1]
+    peek = getattr(getattr(stream, 'buffer', None), 'peek', None)
+    head = peek(256) if peek else b''
+    return head.lstrip(b'\xef\xbb\xbf \t\r\n')[:1].decode('ascii', 'replace')
+
+
+def detect_format(path: str, stream: IO[str]) -> str:
+    """'csv', 'jsonl' or 'json', from the file extension or, for stdin, the first character."""
+    lowered = path.lower()
+    if lowered.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    if lowered.endswith('.json'):
+        return 'json'
+    if lowered.endswith(('.csv', '.tsv', '.txt')):
+        return 'csv'
+    first = _first_char(stream)
+    return {'{': 'jsonl', '[': 'json'}.get(first, 'csv')
+
+
+def iter_csv(stream: IO[str]) -> Iterator[Tuple[int, Dict[str, str]]]:
+    """Yield (line number, row dict) from CSV, sniffing the delimiter from the header line."""
+    header_line = stream.readline()
+    if not header_line:
+        return
+    try:
+        dialect = csv.Sniffer().sniff(header_line, delimiters=',;\t|')
+    except csv.Error:
+        dialect = csv.excel
+    fields = map_import_headers(next(csv.reader([header_line], dialect)))
+    if 'stock_code' not in fields or 'target_price' not in fields:
+        raise RowError(f"line 1: header needs stock code and target price columns, got {header_line.strip()!r}")
+    columns = [(i, field) for i, field in enumerate(fields) if field]
+    reader = csv.reader(stream, dialect)
+    for cells in reader:
+        if not any(cells):
+            continue
+        width = len(cells)
+        # reader.line_num counts from the second physical line
+        yield reader.line_num + 1, {field: cells[i] for i, field in columns if i < width}
+
+
+def iter_jsonl(stream: IO[str]) -> Iterator[Tuple[int, Dict]]:
+    """Yield (line number, row dict) from JSON lines; a bad line is yielded as a RowError."""
+    for number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield number, RowError(f"invalid JSON: {e}")
+            continue
+        yield number, row if isinstance(row, dict) else RowError("expected a JSON object")
+
+
+def iter_json(stream: IO[str]) -> Iterator[Tuple[int, Dict]]:
+    """Yield (item number, row dict) from a JSON array of rows, or from the `data` array of
+    a saved klse_data_<date>.json file; items are decoded one at a time."""
+    key = None if _first_char(stream) == '[' else 'data'
+    try:
+        for number, row in enumerate(iter_json_array(stream, key), 1):
+            yield number, row if isinstance(row, dict) else RowError("expected a JSON object")
+    except ValueError as e:
+        raise RowError(f"invalid JSON document: {e}") from e
+
+
+def normalize_call(text: Optional[str]) -> PriceCall:
+    """Map a recommendation to BUY/HOLD/SELL, accepting common broker wording."""
+    call = CALL_NAMES.get(' '.join((text or '').upper().split()))
+    if call is None:
+        raise RowError(f"unknown call {text!r}")
+    return call
+
+
+@lru_cache(maxsize=4096)
+def _iso_date(text: str) -> Optional[str]:
+    """A sheet date as YYYY-MM-DD, or None; sheets repeat a handful of dates, so it is cached."""
+    date = normalize_date(text)
+    try:
+        datetime.date.fromisoformat(date)
+    except ValueError:
+        return None
+    return date
+
+
+def _price_text(value) -> str:
+    """A price as the scraper stores it: the original digits without 'RM' or commas."""
+    return str(value).replace('RM', '').replace(',', '').strip()
+
+
+def normalize_row(row: Dict, default_date: str, default_analyst: Optional[str] = None) -> TargetPrice:
+    """Validate one imported row and build its record; raises RowError with the reason."""
+    code = ' '.join(str(row.get('stock_code') or '').upper().split())
+    if not code:
+        raise RowError("missing stock code")
+
+    raw_date = str(row.get('date') or '').strip()
+    date = _iso_date(raw_date) if raw_date else default_date
+    if date is None:
+        raise RowError(f"unrecognised date {raw_date!r}")
+
+    target = parse_price(row.get('target_price'))
+    if target is None or target <= 0:
+        raise RowError(f"bad target price {row.get('target_price')!r}")
+    current = parse_price(row.get('current_price'))
+    if row.get('current_price') not in (None, '') and (current is None or current <= 0):
+        raise RowError(f"bad current price {row.get('current_price')!r}")
+
+    upside = ' '.join(str(row.get('upside_downside') or '').split())
+    change, pct = parse_upside(upside)
+    if pct is None:
+        # Missing or garbled upside: rebuild it from the prices when we can
+        if current is not None:
+            change = target - current
+            pct = change / current * 100
+            upside = f"{change:+.2f} ({pct:.2f}%)"
+        elif upside:
+            raise RowError(f"unparseable upside {upside!r} and no current price to rebuild it")
+
+    call = normalize_call(row.get('price_call'))
+    analyst = ' '.join(str(row.get('analyst') or '').split()) or default_analyst
+    if not analyst:
+        raise RowError("missing analyst")
+
+    return TargetPrice(
+        date=date,
+        stock_code=code,
+        stock_name=' '.join(str(row.get('stock_name') or '').split()) or code,
+        current_price=_price_text(row.get('current_price')) if current is not None else None,
+        target_price=_price_text(row.get('target_price')),
+        upside_downside=upside or None,
+        price_call=call.value,
+        analyst=analyst,
+        current=current,
+        target=target,
+        change=change,
+        upside_pct=pct,
+        call=call,
+        direction=trend_direction(upside),
+    )
+
+
+def validate_rows(rows: Iterator[Tuple[int, Dict]], default_date: str, default_analyst: Optional[str],
+                  rejects: List[Tuple[int, str, Dict]]) -> Iterator[TargetPrice]:
+    """Yield valid records in one pass, appending (line, reason, row) for each rejected row.
+
+    A row repeating an earlier one's date, stock, analyst and target, the history
+    store's key, is rejected as a duplicate of that line.
+    """
+    seen: Dict[Tuple[str, str, str, str], int] = {}
+    for number, row in rows:
+        try:
+            if isinstance(row, RowError):
+                raise row
+            rec = normalize_row(row, default_date, default_analyst)
+            key = (rec.date, rec.stock_code, rec.analyst, rec.target_price)
+            first = seen.setdefault(key, number)
+            if first != number:
+                raise RowError(f"duplicate of line {first}")
+            yield rec
+        except RowError as e:
+            rejects.append((number, str(e), row if isinstance(row, dict) else {}))
+
+
+def write_data_file(date: str, data_list: List[Dict], filename: Optional[str] = None,
+                    indent: Optional[int] = 2) -> str:
+    """Save records in the klse_data_<date>.json format; returns the file name.
+
+    Bulk imports pass `indent=None`: json only encodes in one C call for compact
+    output, which is several times faster on sheets with thousands of rows.
+    """
+    filename = filename or f"klse_data_{date}.json"
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write(json.dumps({
+            'timestamp': datetime.datetime.now().isoformat(),
+            'date': date,
+            'data': data_list
+        }, ensure_ascii=False, indent=indent))
+    return filename
 
 
 def update_data_from_input():
@@ -54,13 +293,7 @@ def update_data_from_input():
     
     if data_list:
         # Save to file
-        filename = f"klse_data_{today}.json"
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump({
-                'timestamp': datetime.datetime.now().isoformat(),
-                'date': today,
-                'data': data_list
-            }, f, ensure_ascii=False, indent=2)
+        filename = write_data_file(today, data_list)
         
         print(f"✅ Data saved to {filename}")
         print(f"📊 Total records saved: {len(data_list)}")
@@ -79,9 +312,6 @@ def update_data_from_input():
             try:
                 monitor = KLSETargetPriceMonitor()
                 
-                # Override the sample data method
-                monitor.get_sample_data = lambda: data_list
-                
                 # Send message
                 message = monitor.format_message(data_list)
                 success = monitor.send_to_telegram(message)
@@ -97,5 +327,107 @@ def update_data_from_input():
         print("❌ No data entered")
 
 
+def import_file(path: str, fmt: str = 'auto', default_date: Optional[str] = None,
+                default_analyst: Optional[str] = None, history_path: Optional[str] = None,
+                output: Optional[str] = None, strict: bool = False) -> Tuple[List[TargetPrice], List[Tuple[int, str, Dict]]]:
+    """Stream-import a CSV, JSON-lines or JSON array file ('-' for stdin).
+
+    Valid records go to the history store when `history_path` is given, otherwise to
+    one klse_data_<date>.json file per date. With `strict`, nothing is written if any
+    row is rejected. Returns the imported records and the rejects.
+    """
+    default_date = default_date or datetime.date.today().strftime('%Y-%m-%d')
+    if path == '-':
+        stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig', newline='')
+    else:
+        stream = open(path, 'r', encoding='utf-8-sig', newline='')
+    rejects: List[Tuple[int, str, Dict]] = []
+    try:
+        if fmt == 'auto':
+            fmt = detect_format(path, stream)
+        readers = {'jsonl': iter_jsonl, 'json': iter_json, 'csv': iter_csv}
+        rows = readers[fmt](stream)
+        records = list(validate_rows(rows, default_date, default_analyst, rejects))
+    finally:
+        if path == '-':
+            # Leave the real stdin open for anything that reads it later
+            stream.detach()
+        else:
+            stream.close()
+
+    if strict and rejects:
+        return records, rejects
+    if history_path:
+        with HistoryStore(history_path) as store:
+            for start in range(0, len(records), HISTORY_BATCH):
+                store.upsert(records[start:start + HISTORY_BATCH])
+    else:
+        by_date: Dict[str, List[Dict]] = {}
+        for rec in records:
+            by_date.setdefault(rec.date, []).append(rec.to_dict())
+        for date, data_list in sorted(by_date.items()):
+            filename = output if output and len(by_date) == 1 else None
+            print(f"✅ {len(data_list)} records saved to {write_data_file(date, data_list, filename, indent=None)}")
+    return records, rejects
+
+
+def main():
+    """Interactive entry by default; bulk import with --import."""
+    parser = argparse.ArgumentParser(description="Add KLSE target price data by hand or from a file")
+    parser.add_argument('--import', dest='source', metavar='PATH',
+                        help="Import a CSV, JSON-lines or JSON file, or '-' for stdin")
+    parser.add_argument('--format', choices=['auto', 'csv', 'jsonl', 'json'], default='auto',
+                        help="Input format (default: from the extension, or sniffed on stdin)")
+    parser.add_argument('--date', help="Date for rows without one (YYYY-MM-DD, default today)")
+    parser.add_argument('--analyst', help="Analyst for rows without one")
+    parser.add_argument('--history', nargs='?', const='klse_history.db', metavar='DB',
+                        help="Write to the history store instead of klse_data_<date>.json")
+    parser.add_argument('--output', help="JSON file name when all rows share one date")
+    parser.add_argument('--rejects', help="Write rejected rows to this JSON-lines file")
+    parser.add_argument('--strict', action='store_true', help="Write nothing if any row is rejected")
+    parser.add_argument('--send', action='store_true', help="Send the imported records to Telegram")
+    parser.add_argument('--config', default='config.json', help="Configuration file used by --send")
+    args = parser.parse_args()
+
+    if not args.source:
+        update_data_from_input()
+        return
+
+    started = time.perf_counter()
+    try:
+        records, rejects = import_file(args.source, args.format, args.date, args.analyst,
+                                       args.history, args.output, args.strict)
+    except (OSError, RowError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(2)
+
+    for number, reason, _ in rejects[:50]:
+        print(f"line {number}: {reason}", file=sys.stderr)
+    if len(rejects) > 50:
+        print(f"... and {len(rejects) - 50} more rejected rows", file=sys.stderr)
+    if args.rejects and rejects:
+        with open(args.rejects, 'w', encoding='utf-8') as f:
+            for number, reason, row in rejects:
+                f.write(json.dumps({'line': number, 'reason': reason, 'row': row}, ensure_ascii=False) + '\n')
+    elapsed = time.perf_counter() - started
+    print(f"📊 {len(records)} rows accepted, {len(rejects)} rejected in {elapsed:.2f}s"
+          + (f" (stored in {args.history})" if args.history and not (args.strict and rejects) else ''))
+    if args.strict and rejects:
+        print("❌ Nothing written: --strict and rows were rejected", file=sys.stderr)
+        sys.exit(1)
+
+    if args.send and records:
+        monitor = KLSETargetPriceMonitor(args.config)
+        try:
+            results = monitor.deliver(records)
+        finally:
+            monitor.close()
+        if any(r.ok for r in results):
+            print("✅ Message sent to Telegram")
+        else:
+            print("❌ Failed to send message. Check your configuration.")
+            sys.exit(1)
+
+
 if __name__ == "__main__":
-    update_data_from_input()
\ No newline at end of file
+    main()